@@ -0,0 +1,294 @@
+"""
+Статистика по всей истории пользователя на колоночных numpy-массивах.
+
+История загружается одним запросом (database.get_user_exercise_rows) и раскладывается
+в три уровня массивов: тренировки (время начала), упражнения (тренировка, упражнение,
+кардио/силовое) и подходы (упражнение, вес, повторения). Упражнения кодируются
+целыми id, поэтому подсчёты, группировка по неделям/месяцам, топы, объём и рекорды —
+это маски, bincount и накопительные максимумы без циклов по подходам в Python.
+
+Сравнение с calculate_*_stats из handlers_statistics: python bench_analytics.py
+"""
+from datetime import datetime
+
+import numpy as np
+
+from bot_utils import normalize_exercise_sets, parse_training_datetime
+from database import get_user_exercise_rows
+
+_MINUTE = "datetime64[m]"
+
+# Порог формул 1ПМ как в progression.estimate_1rm
+_BRZYCKI_MAX_REPS = 10
+
+
+class History:
+    """Колоночное представление истории: индексы связывают уровни между собой."""
+
+    __slots__ = (
+        "names", "training_ids", "training_start",
+        "ex_training", "ex_name", "ex_cardio",
+        "set_ex", "weight", "reps",
+    )
+
+    def __init__(self, names, training_ids, training_start, ex_training, ex_name, ex_cardio, set_ex, weight, reps):
+        self.names = names                    # id упражнения -> название
+        self.training_ids = training_ids      # int64[T]
+        self.training_start = training_start  # datetime64[m][T], по возрастанию
+        self.ex_training = ex_training        # int32[E] — индекс тренировки
+        self.ex_name = ex_name                # int32[E] — id упражнения
+        self.ex_cardio = ex_cardio            # bool[E]
+        self.set_ex = set_ex                  # int32[S] — индекс упражнения
+        self.weight = weight                  # float64[S]
+        self.reps = reps                      # int32[S]
+
+    def __len__(self):
+        return len(self.training_ids)
+
+    @property
+    def sets_count(self):
+        return len(self.set_ex)
+
+
+def from_rows(rows) -> History:
+    """Собрать History из строк (training_id, date_start, name, type, sets), упорядоченных по дате."""
+    name_ids = {}
+    training_index = {}
+    training_ids, training_start = [], []
+    ex_training, ex_name, ex_cardio = [], [], []
+    set_ex, weights, reps = [], [], []
+
+    for training_id, date_start, name, type_, sets in rows:
+        t = training_index.get(training_id)
+        if t is None:
+            t = training_index[training_id] = len(training_ids)
+            training_ids.append(training_id)
+            training_start.append(date_start)
+        if name is None:
+            continue
+        e = len(ex_name)
+        ex_training.append(t)
+        ex_name.append(name_ids.setdefault(name, len(name_ids)))
+        is_cardio = type_ == "cardio"
+        ex_cardio.append(is_cardio)
+        if is_cardio:
+            continue
+        for set_data in normalize_exercise_sets(sets):
+            try:
+                w, r = float(set_data["weight"]), int(set_data["reps"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            set_ex.append(e)
+            weights.append(w)
+            reps.append(r)
+
+    start = np.array(training_start, dtype=_MINUTE)
+    order = np.argsort(start, kind="stable")
+    if len(order) and not np.all(order[:-1] <= order[1:]):
+        # Тренировки не по порядку: переупорядочить и перенумеровать ссылки упражнений
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        start = start[order]
+        training_ids = np.array(training_ids, dtype=np.int64)[order]
+        ex_training = rank[np.array(ex_training, dtype=np.int64)] if ex_training else ex_training
+
+    return History(
+        names=list(name_ids),
+        training_ids=np.asarray(training_ids, dtype=np.int64),
+        training_start=start,
+        ex_training=np.asarray(ex_training, dtype=np.int32),
+        ex_name=np.asarray(ex_name, dtype=np.int32),
+        ex_cardio=np.asarray(ex_cardio, dtype=bool),
+        set_ex=np.asarray(set_ex, dtype=np.int32),
+        weight=np.asarray(weights, dtype=np.float64),
+        reps=np.asarray(reps, dtype=np.int32),
+    )
+
+
+def from_trainings(trainings) -> History:
+    """History из списка тренировок в формате get_user_trainings (для сравнения и тестов)."""
+    rows = []
+    for training in reversed(trainings):
+        started = parse_training_datetime(training["date_start"])
+        if not training.get("exercises"):
+            rows.append((training["training_id"], started, None, None, None))
+        for exercise in training.get("exercises") or []:
+            rows.append((
+                training["training_id"],
+                started,
+                exercise["name"],
+                "cardio" if exercise.get("is_cardio") else "strength",
+                exercise.get("sets"),
+            ))
+    return from_rows(rows)
+
+
+def load_user_history(user_id, since=None) -> History:
+    """История пользователя (вся или начиная с since) одним запросом."""
+    return from_rows(get_user_exercise_rows(user_id, since))
+
+
+# ==================== ВЫБОРКИ ====================
+
+def _since(value):
+    return None if value is None else np.datetime64(value, "m")
+
+
+def _training_mask(history, since=None, until=None):
+    mask = np.ones(len(history), dtype=bool)
+    if since is not None:
+        mask &= history.training_start >= _since(since)
+    if until is not None:
+        mask &= history.training_start < _since(until)
+    return mask
+
+
+def _top(counts, names, n):
+    order = np.argsort(-counts, kind="stable")[:n]
+    return [(names[i], counts[i].item()) for i in order if counts[i] > 0]
+
+
+def period_summary(history, since=None, until=None, top=3) -> dict:
+    """Тренировки, упражнения (силовые/кардио) и самые частые упражнения за период."""
+    t_mask = _training_mask(history, since, until)
+    e_mask = t_mask[history.ex_training]
+    cardio = int(np.count_nonzero(history.ex_cardio & e_mask))
+    exercises = int(np.count_nonzero(e_mask))
+    counts = np.bincount(history.ex_name[e_mask], minlength=len(history.names))
+    return {
+        "trainings": int(np.count_nonzero(t_mask)),
+        "exercises": exercises,
+        "strength": exercises - cardio,
+        "cardio": cardio,
+        "popular_exercises": _top(counts, history.names, top),
+    }
+
+
+def recent_trainings(history, since=None, limit=5):
+    """Последние тренировки периода: [(datetime, число упражнений)], новые первыми."""
+    t_mask = _training_mask(history, since)
+    per_training = np.bincount(history.ex_training, minlength=len(history))
+    indexes = np.flatnonzero(t_mask)[::-1][:limit]
+    return [(history.training_start[i].astype(datetime), per_training[i].item()) for i in indexes]
+
+
+def trainings_by_period(history, unit="M", since=None):
+    """Число тренировок по неделям ("W", с понедельника) или месяцам ("M"): [(начало периода, n)], новые первыми."""
+    starts = history.training_start[_training_mask(history, since)]
+    if unit == "W":
+        days = starts.astype("datetime64[D]")
+        # 1970-01-01 — четверг: сдвиг на 3 дня делает началом недели понедельник
+        buckets = (days - ((days.astype(np.int64) + 3) % 7).astype("timedelta64[D]"))
+    else:
+        buckets = starts.astype(f"datetime64[{unit}]")
+    values, counts = np.unique(buckets, return_counts=True)
+    return [(v.astype("datetime64[D]").astype(datetime), c.item()) for v, c in zip(values[::-1], counts[::-1])]
+
+
+# ==================== СИЛОВЫЕ ПОКАЗАТЕЛИ ====================
+
+def estimated_1rm(weight, reps):
+    """Векторный аналог progression.estimate_1rm."""
+    weight = np.asarray(weight, dtype=np.float64)
+    reps = np.asarray(reps, dtype=np.float64)
+    brzycki = weight * 36 / np.maximum(37 - reps, 1)
+    epley = weight * (1 + reps / 30)
+    one_rm = np.where(reps <= _BRZYCKI_MAX_REPS, brzycki, epley)
+    one_rm = np.where(reps == 1, weight, one_rm)
+    return np.where((weight > 0) & (reps > 0), np.floor(one_rm * 10 + 0.5) / 10, 0.0)
+
+
+def exercise_stats(history) -> dict:
+    """То же, что calculate_exercise_stats: {название: count, type, max_weight, total_reps, total_sets}."""
+    n = len(history.names)
+    count = np.bincount(history.ex_name, minlength=n)
+    # Тип — по первому выполнению упражнения
+    first = np.full(n, -1, dtype=np.int64)
+    seen = np.unique(history.ex_name[::-1], return_index=True)
+    first[seen[0]] = len(history.ex_name) - 1 - seen[1]
+    set_name = history.ex_name[history.set_ex]
+    max_weight = np.zeros(n, dtype=np.float64)
+    np.maximum.at(max_weight, set_name, history.weight)
+    total_reps = np.bincount(set_name, weights=history.reps, minlength=n)
+    total_sets = np.bincount(set_name, minlength=n)
+
+    stats = {}
+    for i, name in enumerate(history.names):
+        stats[name] = {
+            "count": count[i].item(),
+            "type": "cardio" if history.ex_cardio[first[i]] else "strength",
+            "max_weight": max_weight[i].item(),
+            "total_reps": int(total_reps[i]),
+            "total_sets": total_sets[i].item(),
+        }
+    return stats
+
+
+def volume_by_exercise(history, since=None, top=None):
+    """Тоннаж (вес × повторения) по упражнениям за период: [(название, кг)] по убыванию."""
+    s_mask = _training_mask(history, since)[history.ex_training[history.set_ex]]
+    set_name = history.ex_name[history.set_ex][s_mask]
+    volume = np.bincount(
+        set_name,
+        weights=(history.weight[s_mask].astype(np.float64) * history.reps[s_mask]),
+        minlength=len(history.names),
+    )
+    return [(name, round(v, 1)) for name, v in _top(volume, history.names, top or len(history.names))]
+
+
+def personal_records(history, limit=10):
+    """Тренировки, где расчётный 1ПМ превысил все предыдущие по этому упражнению.
+
+    [(datetime, название, 1ПМ, вес, повторения)], новые первыми. Первое выполнение рекордом не считается.
+    """
+    if not history.sets_count:
+        return []
+    set_name = history.ex_name[history.set_ex]
+    set_training = history.ex_training[history.set_ex]
+    one_rm = estimated_1rm(history.weight, history.reps)
+
+    # По упражнению, затем хронологически (порядок подходов внутри тренировки сохраняется)
+    order = np.lexsort((np.arange(len(one_rm)), set_training, set_name))
+    name_sorted = set_name[order]
+    training_sorted = set_training[order]
+    value = one_rm[order]
+
+    # Накопительный максимум внутри каждой группы: сдвиг групп на величину больше любого значения.
+    # 1ПМ округлён до 0.1 — считаем в целых десятых, чтобы сдвиг не вносил ошибок округления
+    tenths = np.rint(value * 10).astype(np.int64)
+    offset = name_sorted.astype(np.int64) * (tenths.max() + 1)
+    running = np.maximum.accumulate(tenths + offset) - offset
+    group_start = np.r_[True, name_sorted[1:] != name_sorted[:-1]]
+    # Рекорд сравнивается с лучшим результатом предыдущих тренировок, а не подходов той же тренировки
+    training_start = np.r_[True, (training_sorted[1:] != training_sorted[:-1]) | group_start[1:]]
+    before = np.where(training_start, np.r_[-1, running[:-1]], -1)
+    # Значение на старте тренировки распространяется на все её подходы
+    starts = np.maximum.accumulate(np.where(training_start, np.arange(len(value)), 0))
+    before = before[starts]
+    # Внутри первой тренировки упражнения рекордов нет
+    first_training = np.maximum.accumulate(np.where(group_start, np.arange(len(value)), 0))
+    in_first = training_sorted == training_sorted[first_training]
+    is_pr = (tenths > before) & ~in_first
+
+    # Одна запись на тренировку и упражнение — лучший подход
+    hits = np.flatnonzero(is_pr)
+    if not len(hits):
+        return []
+    key = name_sorted[hits].astype(np.int64) * (len(history) + 1) + training_sorted[hits]
+    best = {}
+    for h, k in zip(hits, key):
+        if k not in best or value[h] > value[best[k]]:
+            best[k] = h
+    events = sorted(best.values(), key=lambda h: (training_sorted[h], value[h]), reverse=True)[:limit]
+    result = []
+    for h in events:
+        s = order[h]
+        result.append((
+            history.training_start[training_sorted[h]].astype(datetime),
+            history.names[name_sorted[h]],
+            float(value[h]),
+            float(history.weight[s]),
+            int(history.reps[s]),
+        ))
+    return result
+
@@ -0,0 +1,123 @@
+"""
+Сравнение скорости: calculate_*_stats (словари и циклы) против analytics.py (numpy)
+на синтетической истории.
+
+    python bench_analytics.py            # 100 000 подходов
+    python bench_analytics.py 500000     # другой объём
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import analytics
+from handlers_statistics import (
+    calculate_exercise_stats,
+    calculate_weekly_stats,
+    calculate_monthly_stats,
+    calculate_yearly_stats,
+)
+from utils_constants import DEFAULT_STRENGTH_EXERCISES, DEFAULT_CARDIO_EXERCISES
+
+_STRENGTH = DEFAULT_STRENGTH_EXERCISES + [f"Упражнение {i}" for i in range(40)]
+
+
+def synthetic_rows(total_sets: int, seed: int = 1):
+    """Плоские строки как из get_user_exercise_rows: ~5 упражнений по ~4 подхода на тренировку."""
+    rng = random.Random(seed)
+    rows = []
+    sets_left = total_sets
+    training_id = 0
+    started = datetime.now() - timedelta(days=total_sets // 20)
+    while sets_left > 0:
+        training_id += 1
+        started += timedelta(hours=rng.randint(20, 30))
+        for _ in range(rng.randint(3, 7)):
+            if rng.random() < 0.15:
+                rows.append((training_id, started, rng.choice(DEFAULT_CARDIO_EXERCISES), "cardio", None))
+                continue
+            sets = [
+                {"weight": round(rng.uniform(10, 120) * 2) / 2, "reps": rng.randint(3, 15)}
+                for _ in range(rng.randint(2, 6))
+            ]
+            sets_left -= len(sets)
+            rows.append((training_id, started, rng.choice(_STRENGTH), "strength", sets))
+    return rows
+
+
+def rows_to_trainings(rows):
+    """Те же данные в формате get_user_trainings (новые первыми)."""
+    trainings = {}
+    for training_id, started, name, type_, sets in rows:
+        training = trainings.setdefault(training_id, {
+            "training_id": training_id,
+            "date_start": started.strftime("%d.%m.%Y %H:%M"),
+            "exercises": [],
+        })
+        exercise = {"name": name, "type": type_, "is_cardio": type_ == "cardio"}
+        if type_ == "cardio":
+            exercise["details"] = "30 минут"
+        else:
+            exercise["sets"] = sets
+        training["exercises"].append(exercise)
+    return list(reversed(list(trainings.values())))
+
+
+def timed(func, *args, repeat=5):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def main(total_sets: int = 100_000):
+    rows = synthetic_rows(total_sets)
+    trainings = rows_to_trainings(rows)
+    build_ms, history = timed(analytics.from_rows, rows, repeat=3)
+    print(
+        f"История: {len(trainings)} тренировок, {len(rows)} упражнений, {history.sets_count} подходов; "
+        f"сборка колонок {build_ms:.1f} мс\n"
+    )
+
+    now = datetime.now()
+    week = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    year = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    cases = [
+        ("по упражнениям", lambda: calculate_exercise_stats(trainings), lambda: analytics.exercise_stats(history)),
+        ("текущая неделя", lambda: calculate_weekly_stats(trainings), lambda: analytics.period_summary(history, week)),
+        ("текущий месяц", lambda: calculate_monthly_stats(trainings), lambda: analytics.period_summary(history, month)),
+        ("текущий год", lambda: calculate_yearly_stats(trainings),
+         lambda: (analytics.period_summary(history, year), analytics.trainings_by_period(history, "M", year))),
+    ]
+    print(f"{'расчёт':<18}{'циклы, мс':>12}{'numpy, мс':>12}{'ускорение':>12}")
+    for title, baseline, vectorized in cases:
+        base_ms, base = timed(baseline)
+        vec_ms, vec = timed(vectorized)
+        print(f"{title:<18}{base_ms:>12.1f}{vec_ms:>12.2f}{base_ms / vec_ms:>11.0f}×")
+
+    expected = calculate_exercise_stats(trainings)
+    got = analytics.exercise_stats(history)
+    mismatched = [
+        name for name in expected
+        if {k: expected[name][k] for k in ("count", "type", "total_reps", "total_sets")}
+        != {k: got[name][k] for k in ("count", "type", "total_reps", "total_sets")}
+        or abs(expected[name]["max_weight"] - got[name]["max_weight"]) > 1e-3
+    ]
+    print("\nСовпадение с calculate_exercise_stats:", "да" if not mismatched else f"нет ({mismatched[:5]})")
+
+    for title, func in (
+        ("объём по упражнениям", lambda: analytics.volume_by_exercise(history, top=10)),
+        ("тренировки по неделям", lambda: analytics.trainings_by_period(history, "W")),
+        ("личные рекорды", lambda: analytics.personal_records(history)),
+    ):
+        ms, _ = timed(func)
+        print(f"{title:<24}{ms:>8.2f} мс (numpy, без аналога в calculate_*)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
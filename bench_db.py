@@ -0,0 +1,118 @@
+"""
+Пул соединений и prepared statements: сколько стоят горячие чтения database.py в трёх
+режимах и сколько PostgreSQL тратит на планирование их запросов с prepared statements и без.
+Нужна настоящая БД (DATABASE_URL); данные не изменяются.
+
+    python bench_db.py                  # 200 вызовов каждой функции, user_id 0
+    python bench_db.py 500 123456789    # число вызовов и пользователь с историей
+"""
+import os
+import sys
+import time
+
+import database
+
+MODES = (
+    ("новое соединение", 0, False),
+    ("пул", 5, False),
+    ("пул + prepared", 5, True),
+)
+
+_EXPLAIN_REPEAT = 20
+# После пяти выполнений с частными планами PostgreSQL решает, переходить ли на общий план
+_GENERIC_PLAN_AFTER = 6
+
+
+def hot_calls(user_id):
+    trainings = database.get_user_trainings(user_id, limit=1)
+    training_id = trainings[0]['training_id'] if trainings else 0
+    return [
+        ("get_current_training", lambda: database.get_current_training(user_id)),
+        ("get_training_exercises", lambda: database.get_training_exercises(training_id)),
+        ("get_custom_exercises", lambda: database.get_custom_exercises(user_id)),
+    ]
+
+
+def call_times(calls, iterations):
+    """Среднее время вызова каждой функции в каждом режиме, мс."""
+    results = {}
+    for mode, pool_size, prepared in MODES:
+        database.POOL_SIZE = pool_size
+        database.PREPARED_STATEMENTS = prepared
+        database.close_pool()
+        for name, call in calls:
+            call()  # прогрев: соединение в пуле, подготовленный запрос
+            started = time.perf_counter()
+            for _ in range(iterations):
+                call()
+            results[(name, mode)] = (time.perf_counter() - started) * 1000 / iterations
+    database.close_pool()
+    return results
+
+
+def captured_queries(calls):
+    """Текст и параметры запросов, которые выполняют функции (первый запрос каждой)."""
+    queries = {}
+    original = database._execute
+
+    def capture(cur, sql, params=None, prepared=False):
+        queries.setdefault(current, (sql, params))
+        return original(cur, sql, params, prepared)
+
+    database._execute = capture
+    try:
+        for current, call in calls:
+            call()
+    finally:
+        database._execute = original
+    return queries
+
+
+def _planning_ms(cur, sql, params):
+    total = 0.0
+    for _ in range(_EXPLAIN_REPEAT):
+        cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", params)
+        total += cur.fetchone()[0][0]["Planning Time"]
+    return total / _EXPLAIN_REPEAT
+
+
+def planning_times(queries):
+    """Время планирования (мс): текст запроса каждый раз и EXECUTE подготовленного."""
+    from pg8000.dbapi import convert_paramstyle
+
+    conn = database._connect(os.environ['DATABASE_URL'])
+    results = {}
+    try:
+        cur = conn.cursor()
+        for index, (name, (sql, params)) in enumerate(queries.items()):
+            plain = _planning_ms(cur, sql, params)
+            statement, _ = convert_paramstyle("format", sql, params)
+            cur.execute(f"PREPARE bench_{index} AS {statement}")
+            execute = f"EXECUTE bench_{index}({', '.join(['%s'] * len(params))})"
+            for _ in range(_GENERIC_PLAN_AFTER):
+                cur.execute(execute, params)
+            results[name] = (plain, _planning_ms(cur, execute, params))
+            cur.execute(f"DEALLOCATE bench_{index}")
+        conn.rollback()
+    finally:
+        conn.close()
+    return results
+
+
+def main(iterations=200, user_id=0):
+    calls = hot_calls(user_id)
+
+    times = call_times(calls, iterations)
+    print(f"Среднее время вызова, мс ({iterations} вызовов):")
+    print(f"{'функция':<26}" + "".join(f"{mode:>20}" for mode, *_ in MODES))
+    for name, _ in calls:
+        print(f"{name:<26}" + "".join(f"{times[(name, mode)]:>20.2f}" for mode, *_ in MODES))
+
+    print(f"\nПланирование на сервере, мс (среднее из {_EXPLAIN_REPEAT}):")
+    print(f"{'функция':<26}{'текст запроса':>16}{'prepared':>12}{'экономия':>12}")
+    for name, (plain, prepared) in planning_times(captured_queries(calls)).items():
+        print(f"{name:<26}{plain:>16.3f}{prepared:>12.3f}{plain - prepared:>12.3f}")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
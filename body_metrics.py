@@ -0,0 +1,163 @@
+"""
+Разбор замеров тела из свободного текста в отдельные показатели.
+
+Пользователь вводит замеры как угодно («вес 65кг, талия 70см», «65/70/95», «65кг»).
+Текст по-прежнему хранится целиком в user_measurements, а распознанные значения
+дополнительно пишутся в measurement_values — узкую таблицу (пользователь, показатель,
+время, значение) с индексом по (user_id, metric, measured_at). Графики и тренды читают
+её диапазонным сканом по индексу, без повторного разбора текста; экран динамики получает
+готовые недельные агрегаты (database.get_measurement_buckets) одним запросом.
+
+Для замеров, сохранённых до появления таблицы:
+    python body_metrics.py backfill
+"""
+import re
+import sys
+from datetime import timedelta
+
+# Показатель -> (подпись, единица, допустимый диапазон, шаблон названия).
+# Порядок важен: «бедро» (обхват ноги) проверяется раньше «бёдер» (обхват таза)
+METRICS = {
+    "weight": ("Вес", "кг", (20, 400), r"вес|weight"),
+    "body_fat": ("Жир", "%", (2, 70), r"жир|fat"),
+    "waist": ("Талия", "см", (30, 250), r"тали|waist"),
+    "chest": ("Грудь", "см", (40, 250), r"груд|chest"),
+    "thigh": ("Бедро", "см", (20, 150), r"бедро|thigh"),
+    "hips": ("Бёдра", "см", (40, 250), r"б[её]д[ре]|ягодиц|hips?"),
+    "biceps": ("Бицепс", "см", (10, 80), r"бицеп|рук|biceps|arm"),
+    "calf": ("Икры", "см", (15, 80), r"икр|голен|calf"),
+    "neck": ("Шея", "см", (20, 70), r"ше[яие]|neck"),
+}
+
+# Порядок значений в коротком формате «65/70/95» — как в подсказке ввода
+_SLASH_ORDER = ("weight", "waist", "chest")
+
+_LABELS = [(metric, re.compile(rf"(?<![а-яёa-z])(?:{pattern})", re.IGNORECASE)) for metric, (*_, pattern) in METRICS.items()]
+_NUMBER = re.compile(r"(\d+(?:[.,]\d+)?)\s*(кг|kg|см|cm|%)?", re.IGNORECASE)
+# Части ввода: «вес 65,5кг, талия 70» — запятая перед цифрой остаётся десятичной
+_SEPARATORS = re.compile(r"[;\n]|,(?!\d)")
+_SLASHES = re.compile(r"^\s*\d+(?:[.,]\d+)?(?:\s*/\s*\d+(?:[.,]\d+)?){1,2}\s*$")
+
+
+def _value(metric, number):
+    value = float(number.replace(",", "."))
+    low, high = METRICS[metric][2]
+    return value if low <= value <= high else None
+
+
+def parse_measurements(text) -> dict:
+    """Распознанные показатели: {metric: (значение, фрагмент текста)}. Нераспознанное пропускается."""
+    found = {}
+    if not text:
+        return found
+
+    if _SLASHES.match(text):
+        for metric, number in zip(_SLASH_ORDER, text.split("/")):
+            value = _value(metric, number.strip())
+            if value is not None:
+                found[metric] = (value, text.strip())
+        return found
+
+    for part in _SEPARATORS.split(text):
+        part = part.strip()
+        number = _NUMBER.search(part)
+        if not number:
+            continue
+        metric = next((m for m, label in _LABELS if label.search(part)), None)
+        if metric is None:
+            # Без названия угадываем только по единице: «65кг» — вес, «18%» — жир
+            unit = (number.group(2) or "").lower()
+            metric = {"кг": "weight", "kg": "weight", "%": "body_fat"}.get(unit)
+        if metric is None or metric in found:
+            continue
+        value = _value(metric, number.group(1))
+        if value is not None:
+            found[metric] = (value, part)
+    return found
+
+
+def format_value(metric, value) -> str:
+    label, unit, *_ = METRICS[metric]
+    return f"{label.lower()} {value:g} {unit}"
+
+
+# ==================== ДИНАМИКА ====================
+
+TREND_WEEKS = (4, 12, 52)
+_MOVING_AVERAGE_WEEKS = (4, 12)
+
+
+def _weighted_avg(buckets):
+    count = sum(b['count'] for b in buckets)
+    return sum(b['avg'] * b['count'] for b in buckets) / count if count else None
+
+
+def measurement_trends(weekly, this_week) -> list:
+    """Динамика по недельным агрегатам database.get_measurement_buckets(unit='week').
+
+    this_week — начало текущей недели. Изменение за N недель — разница средних первой и
+    последней недели с замерами внутри окна; скользящее среднее — среднее всех замеров окна.
+    """
+    by_metric = {}
+    for bucket in weekly:
+        by_metric.setdefault(bucket['metric'], []).append(bucket)
+
+    trends = []
+    for metric in METRICS:
+        buckets = by_metric.get(metric)
+        if not buckets:
+            continue
+        windows = {
+            weeks: [b for b in buckets if b['bucket'] >= this_week - timedelta(weeks=weeks)]
+            for weeks in TREND_WEEKS
+        }
+        trends.append({
+            'metric': metric,
+            'current': buckets[-1]['last'],
+            'changes': {
+                weeks: window[-1]['avg'] - window[0]['avg'] if len(window) > 1 else None
+                for weeks, window in windows.items()
+            },
+            'moving_averages': {weeks: _weighted_avg(windows[weeks]) for weeks in _MOVING_AVERAGE_WEEKS},
+            'min': min(b['min'] for b in buckets),
+            'max': max(b['max'] for b in buckets),
+            'count': sum(b['count'] for b in buckets),
+        })
+    return trends
+
+
+def _num(value):
+    return f"{round(value, 1):g}"
+
+
+def _signed(value):
+    return "—" if value is None else f"{value:+.1f}"
+
+
+def format_trends(trends) -> str:
+    """Текст экрана «📉 Динамика замеров»."""
+    text = "📉 ДИНАМИКА ЗАМЕРОВ ЗА ГОД\n\n"
+    for trend in trends:
+        label, unit, *_ = METRICS[trend['metric']]
+        text += f"📏 {label}: {_num(trend['current'])} {unit}\n"
+        text += "   Изменение: " + " · ".join(
+            f"{weeks} нед. {_signed(change)}" for weeks, change in trend['changes'].items()
+        ) + "\n"
+        averages = [f"{weeks} нед. {_num(avg)}" for weeks, avg in trend['moving_averages'].items() if avg is not None]
+        if averages:
+            text += "   Среднее: " + " · ".join(averages) + "\n"
+        text += f"   Мин/макс: {_num(trend['min'])} / {_num(trend['max'])} {unit} (замеров: {trend['count']})\n\n"
+    return text
+
+
+def main(argv):
+    if argv[1:2] == ["backfill"]:
+        from database import backfill_measurement_values
+
+        print(f"Обработано замеров: {backfill_measurement_values()}")
+        return
+    print(__doc__)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,115 @@
+"""
+PNG-графики прогресса для экрана «📉 Графики».
+
+Рисование — CPU-работа, поэтому render_chart выполняется в пуле процессов
+(process_pool, задача "chart"): данные он читает из БД сам и возвращает PNG-байты
+(вес тела — средние по дням из measurement_values, см. body_metrics.py).
+Готовая картинка после первой отправки хранится в Telegram: её file_id сохраняется
+в chart_cache вместе с версией данных пользователя, и пока данные не изменились,
+повторный просмотр — это отправка file_id без рендера и без загрузки файла.
+
+matplotlib подключается только здесь, внутри функций рисования.
+"""
+import io
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import analytics
+from database import get_measurement_buckets
+
+logger = logging.getLogger(__name__)
+
+_WEEKS = 26
+_TOP_EXERCISES = 10
+
+
+def _figure(title):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 4.5), dpi=120)
+    ax = fig.add_subplot()
+    ax.set_title(title)
+    ax.grid(axis="y", alpha=0.3)
+    return fig, ax
+
+
+def _png(fig) -> bytes:
+    buf = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
+
+
+def _trainings_per_week(user_id):
+    history = analytics.load_user_history(user_id)
+    if not len(history):
+        return None
+    today = datetime.now().date()
+    this_week = today - timedelta(days=today.weekday())
+    weeks = [this_week - timedelta(weeks=i) for i in range(_WEEKS - 1, -1, -1)]
+    counts = dict(analytics.trainings_by_period(history, "W", weeks[0]))
+    values = [counts.get(week, 0) for week in weeks]
+
+    fig, ax = _figure(f"Тренировки по неделям (последние {_WEEKS})")
+    ax.bar(range(len(weeks)), values, color="#4C72B0")
+    step = max(1, len(weeks) // 9)
+    ax.set_xticks(range(0, len(weeks), step))
+    ax.set_xticklabels([week.strftime("%d.%m") for week in weeks[::step]])
+    ax.set_ylabel("тренировок")
+    ax.yaxis.get_major_locator().set_params(integer=True)
+    return _png(fig)
+
+
+def _volume_per_exercise(user_id):
+    history = analytics.load_user_history(user_id)
+    volume = analytics.volume_by_exercise(history, top=_TOP_EXERCISES)
+    if not volume:
+        return None
+    names = [name for name, _ in reversed(volume)]
+    values = [kg for _, kg in reversed(volume)]
+
+    fig, ax = _figure("Объём по упражнениям за всё время, кг")
+    ax.barh(names, values, color="#55A868")
+    ax.grid(axis="x", alpha=0.3)
+    ax.grid(axis="y", visible=False)
+    ax.tick_params(axis="y", labelsize=8)
+    return _png(fig)
+
+
+def _body_weight(user_id):
+    # Средние по дням: длинная история приходит уже прореженной
+    days = get_measurement_buckets(user_id, "day", metric="weight")
+    if len(days) < 2:
+        return None
+    dates = [day['bucket'] for day in days]
+    weights = np.array([day['avg'] for day in days])
+
+    fig, ax = _figure("Вес тела, кг")
+    from matplotlib.dates import DateFormatter
+
+    ax.plot(dates, weights, marker="o", markersize=3, color="#C44E52")
+    ax.xaxis.set_major_formatter(DateFormatter("%d.%m.%y"))
+    ax.set_ylim(weights.min() - 2, weights.max() + 2)
+    fig.autofmt_xdate()
+    return _png(fig)
+
+
+# Название графика (ключ chart_cache) -> функция рисования
+CHARTS = {
+    "trainings_per_week": _trainings_per_week,
+    "volume_per_exercise": _volume_per_exercise,
+    "body_weight": _body_weight,
+}
+
+
+def render_chart(user_id, chart):
+    """PNG графика или None (нет данных / нет matplotlib). Задача пула процессов."""
+    try:
+        import matplotlib
+    except ImportError:
+        logger.error("Пакет matplotlib не установлен — графики недоступны")
+        return None
+    matplotlib.use("Agg")
+    return CHARTS[chart](user_id)
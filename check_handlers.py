@@ -1,86 +1,59 @@
-import re
-import ast
+def check_routes():
+    """Проверить таблицу маршрутов: у каждого состояния есть обработчик по умолчанию,
+    каждый обработчик — корутина, каждая кнопка из keyboards куда-то ведёт."""
+    import importlib
+    import inspect
+    import keyboards
+    from routing import ROUTES, FALLBACKS, STATE_NAMES, iter_transitions
 
-def extract_handlers_from_main():
-    """Извлечь все обработчики из main.py"""
-    with open('main.py', 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Найти все MessageHandler вызовы
-    handlers = []
-    pattern = r'MessageHandler\([^)]+,\s*([^),]+)\)'
-    matches = re.findall(pattern, content)
-    
-    for match in matches:
-        if match not in handlers:
-            handlers.append(match)
-    
-    return handlers
+    print("🔍 ПРОВЕРКА МАРШРУТОВ:")
+    print("=" * 50)
 
-def extract_imports_from_main():
-    """Извлечь все импорты из main.py"""
-    with open('main.py', 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Найти импорты
-    imports = []
-    
-    # from ... import ...
-    from_imports = re.findall(r'from\s+(\w+)\s+import\s+([^#\n]+)', content)
-    for module, imported in from_imports:
-        if imported.strip() == '*':
-            imports.append(f"{module}.*")
-        else:
-            functions = [f.strip() for f in imported.split(',')]
-            imports.extend([f"{module}.{func}" for func in functions])
-    
-    return imports
+    problems = []
+
+    for state in ROUTES:
+        if state not in FALLBACKS:
+            problems.append(f"{STATE_NAMES.get(state, state)}: нет обработчика по умолчанию")
+
+    buttons = set()
+    for state, text, handler in iter_transitions():
+        name = STATE_NAMES.get(state, state)
+        label = text if text is not None else "<прочий текст>"
+        # Ленивая ссылка "модуль:функция" — проверяем саму функцию
+        target = getattr(handler, "target", None)
+        if target:
+            module_name, _, func_name = target.partition(":")
+            handler = getattr(importlib.import_module(module_name), func_name, None)
+            if handler is None:
+                problems.append(f"{name} / {label}: {target} не найден")
+                continue
+        if not inspect.iscoroutinefunction(handler):
+            problems.append(f"{name} / {label}: {handler!r} не async-функция")
+            continue
+        if text is not None:
+            buttons.add(text)
+        print(f"✅ {name:<32} {label:<40} → {handler.__name__}")
+
+    # Кнопки статических клавиатур, которые не ведут ни в одно состояние
+    for attr in dir(keyboards):
+        markup = getattr(keyboards, attr)
+        if not attr.endswith("_KEYBOARD"):
+            continue
+        for row in markup.keyboard:
+            for button in row:
+                if button.text not in buttons:
+                    problems.append(f"{attr}: кнопка «{button.text}» не обрабатывается")
 
-def check_handler_imports():
-    """Проверить что все обработчики импортированы"""
-    handlers = extract_handlers_from_main()
-    imports = extract_imports_from_main()
-    
-    print("🔍 ПРОВЕРКА ОБРАБОТЧИКОВ:")
-    print("=" * 50)
-    
-    missing = []
-    found = []
-    
-    for handler in handlers:
-        handler_clean = handler.strip()
-        
-        # Проверить разные варианты импорта
-        is_imported = False
-        
-        # Вариант 1: Прямой импорт (from module import function)
-        for imp in imports:
-            if f".{handler_clean}" in imp:
-                is_imported = True
-                break
-        
-        # Вариант 2: Импорт через * (from module import *)
-        if any(imp.endswith('.*') for imp in imports):
-            is_imported = True
-        
-        # Вариант 3: Функция определена в main.py
-        if f"def {handler_clean}" in open('main.py').read():
-            is_imported = True
-        
-        if is_imported:
-            found.append(handler_clean)
-            print(f"✅ {handler_clean}")
-        else:
-            missing.append(handler_clean)
-            print(f"❌ {handler_clean}")
-    
     print("=" * 50)
-    if missing:
-        print(f"🚨 Отсутствуют импорты для: {', '.join(missing)}")
+    if problems:
+        print("🚨 Проблемы:")
+        for problem in problems:
+            print(f"  ❌ {problem}")
     else:
-        print("🎉 Все обработчики корректно импортированы!")
-    
-    return missing
+        print("🎉 Все переходы описаны и обработчики найдены!")
+
+    return problems
+
 
 if __name__ == '__main__':
-    check_handler_imports()
+    check_routes()
@@ -0,0 +1,93 @@
+"""
+Circuit breaker для внешней зависимости (PostgreSQL).
+
+closed    — запросы идут как обычно; failure_threshold сбоев подряд → open
+open      — запросы сразу отклоняются, без ожидания таймаута подключения
+half_open — через reset_timeout секунд пропускается один пробный запрос:
+            успех → closed, сбой → снова open
+
+Потокобезопасен: к БД ходят и из event loop, и из потоков (asyncio.to_thread, пул процессов).
+"""
+import threading
+import time
+
+from metrics import inc, set_gauge
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._last_error = None
+
+    def _set_state(self, state):
+        self._state = state
+        set_gauge("circuit_state", _STATE_GAUGE[state], breaker=self.name)
+        inc("circuit_transitions_total", breaker=self.name, to=state)
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос сейчас (в half_open — только один пробный)."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    inc("circuit_rejected_total", breaker=self.name)
+                    return False
+                self._set_state(HALF_OPEN)
+            if self._probe_in_flight:
+                inc("circuit_rejected_total", breaker=self.name)
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def is_open(self) -> bool:
+        """Зависимость заведомо недоступна (без побочных эффектов, для быстрого отказа в UI)."""
+        with self._lock:
+            if self._state == OPEN:
+                return time.monotonic() - self._opened_at < self.reset_timeout
+            return self._state == HALF_OPEN and self._probe_in_flight
+
+    def is_closed(self) -> bool:
+        return self._state == CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self._failures += 1
+            self._last_error = repr(error) if error is not None else None
+            self._probe_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._set_state(OPEN)
+                self._opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            retry_in = None
+            if self._state == OPEN:
+                retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)), 1)
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "retry_in_s": retry_in,
+                "last_error": self._last_error,
+            }
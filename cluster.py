@@ -0,0 +1,256 @@
+"""
+Несколько воркеров на одного бота.
+
+Входная точка (ingress) — единственный процесс, который забирает апдейты у Telegram
+(getUpdates), и раздаёт их воркерам по user_id % WORKER_COUNT. Апдейты одного
+пользователя всегда уходят одному воркеру и по одному, поэтому порядок сохраняется.
+Следующая пачка запрашивается только после доставки текущей — при падении ingress
+Telegram отдаст недоставленные апдейты повторно.
+
+Воркер — обычный main.py без собственного polling (BOT_MODE=worker): апдейты приходят
+POST /update на служебный HTTP-сервер, состояние диалогов и user_data хранятся в
+PostgreSQL (persistence.py). Воркер отвечает только после обработки апдейта, поэтому
+апдейты, принятые упавшим воркером, ingress доставит заново. Запросы без заголовка
+X-Worker-Secret со значением WORKER_SECRET отклоняются; без секрета воркер слушает
+только локальный интерфейс.
+
+Переменные окружения:
+    BOT_MODE        — polling (по умолчанию, один процесс), ingress или worker
+    WORKER_COUNT    — число воркеров
+    WORKER_INDEX    — номер воркера (0..WORKER_COUNT-1)
+    WORKER_PORT     — порт POST /update воркера
+    WORKER_HOST     — интерфейс POST /update воркера (127.0.0.1; другой — только с WORKER_SECRET)
+    WORKER_SECRET   — общий секрет ingress и воркеров
+    WORKER_URLS     — для ingress: адреса воркеров через запятую, по порядку номеров
+
+Локальный запуск ingress + N воркеров:  python cluster.py 3
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+WORKER_COUNT = int(os.getenv('WORKER_COUNT', '1'))
+WORKER_INDEX = int(os.getenv('WORKER_INDEX', '0'))
+WORKER_HOST = os.getenv('WORKER_HOST', '127.0.0.1')
+WORKER_SECRET = os.getenv('WORKER_SECRET', '')
+
+SECRET_HEADER = "X-Worker-Secret"
+
+# Повтор доставки воркеру, который не отвечает; ожидание ответа (воркер отвечает после обработки)
+DELIVERY_RETRY_DELAY = 1.0
+DELIVERY_RETRY_MAX_DELAY = 30.0
+DELIVERY_TIMEOUT = 60.0
+
+# Сколько последних обработанных update_id помнит воркер: повторная доставка не обрабатывается дважды
+_DONE_LIMIT = 1000
+
+
+def owner_of(user_id: int, worker_count: int = WORKER_COUNT) -> int:
+    """Номер воркера-владельца пользователя."""
+    return user_id % worker_count
+
+
+def update_user_id(payload: dict) -> int:
+    """user_id из JSON апдейта без разбора в объекты telegram (0 — апдейт без пользователя)."""
+    for value in payload.values():
+        if isinstance(value, dict):
+            sender = value.get("from") or value.get("user")
+            if isinstance(sender, dict) and "id" in sender:
+                return sender["id"]
+            chat = value.get("chat")
+            if isinstance(chat, dict) and "id" in chat:
+                return abs(chat["id"])
+    return 0
+
+
+# ==================== ВОРКЕР ====================
+
+def authorized(headers: dict) -> bool:
+    """Запрос несёт общий секрет (без WORKER_SECRET — любой: воркер слушает только локально)."""
+    if not WORKER_SECRET:
+        return True
+    return hmac.compare_digest(headers.get(SECRET_HEADER.lower(), "").encode(), WORKER_SECRET.encode())
+
+
+def register_worker_routes(application):
+    """POST /update: апдейт от ingress обрабатывается, ответ — после обработки.
+
+    Повторная доставка апдейта, который ещё обрабатывается (ingress не дождался ответа),
+    ждёт ту же обработку, а уже обработанного — сразу получает 200.
+    """
+    from telegram import Update
+    from health import record_poll
+    from http_server import add_route
+
+    processing = {}
+    done = OrderedDict()
+
+    def finished(update_id, task):
+        processing.pop(update_id, None)
+        if not task.cancelled() and task.exception() is None:
+            done[update_id] = True
+            while len(done) > _DONE_LIMIT:
+                done.popitem(last=False)
+
+    async def receive_update(body: bytes, headers: dict):
+        if not authorized(headers):
+            return 403, "text/plain", b""
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return 400, "text/plain", b"bad json"
+        update_id = payload.get("update_id")
+        if update_id in done:
+            return 200, "text/plain", b""
+        user_id = update_user_id(payload)
+        if owner_of(user_id) != WORKER_INDEX:
+            logger.warning(
+                "Апдейт %s пользователя %s пришёл не своему воркеру %s",
+                update_id, user_id, WORKER_INDEX,
+            )
+        task = processing.get(update_id)
+        if task is None:
+            task = asyncio.ensure_future(application.process_update(Update.de_json(payload, application.bot)))
+            processing[update_id] = task
+            task.add_done_callback(lambda t: finished(update_id, t))
+            record_poll()
+        await asyncio.shield(task)
+        return 200, "text/plain", b""
+
+    add_route("POST", "/update", receive_update, with_headers=True)
+
+
+async def run_worker(application, port: int):
+    """Запустить приложение без updater и принимать апдейты по HTTP до SIGTERM/SIGINT."""
+    from http_server import start_http_server
+
+    if WORKER_HOST not in ("127.0.0.1", "localhost", "::1") and not WORKER_SECRET:
+        raise SystemExit(f"WORKER_HOST={WORKER_HOST} без WORKER_SECRET: POST /update был бы открыт всем")
+    register_worker_routes(application)
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    server = await start_http_server(port, WORKER_HOST)
+    logger.info("Воркер %s/%s принимает апдейты на %s:%s", WORKER_INDEX, WORKER_COUNT, WORKER_HOST, port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+        logger.info("Воркер %s останавливается", WORKER_INDEX)
+    finally:
+        server.close()
+        await server.wait_closed()
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+# ==================== INGRESS ====================
+
+async def _deliver(client, url: str, updates: list):
+    """Отправить апдейты воркеру строго по порядку, повторяя до успеха."""
+    from metrics import inc
+
+    headers = {SECRET_HEADER: WORKER_SECRET} if WORKER_SECRET else {}
+    for payload in updates:
+        delay = DELIVERY_RETRY_DELAY
+        while True:
+            try:
+                response = await client.post(url, content=json.dumps(payload).encode("utf-8"), headers=headers)
+                if response.status_code < 300:
+                    break
+                if response.status_code == 400:
+                    # Апдейт не разобран — повтор ничего не изменит
+                    logger.error("Воркер %s отклонил апдейт %s", url, payload.get("update_id"))
+                    break
+                logger.warning("Воркер %s ответил %s", url, response.status_code)
+            except Exception as e:
+                logger.warning("Воркер %s недоступен: %s", url, e)
+            inc("ingress_delivery_retries_total")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, DELIVERY_RETRY_MAX_DELAY)
+        inc("ingress_updates_total")
+
+
+async def run_ingress(token: str, worker_urls: list):
+    """Забирать апдейты у Telegram и раздавать их воркерам по user_id."""
+    import httpx
+    from telegram import Bot, Update
+
+    bot = Bot(token)
+    offset = None
+    async with bot, httpx.AsyncClient(timeout=DELIVERY_TIMEOUT) as client:
+        await bot.delete_webhook(drop_pending_updates=True)
+        logger.info("Ingress раздаёт апдейты %s воркерам", len(worker_urls))
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES)
+            except Exception as e:
+                logger.warning("getUpdates: %s", e)
+                await asyncio.sleep(DELIVERY_RETRY_DELAY)
+                continue
+            if not updates:
+                continue
+
+            batches = {}
+            for update in updates:
+                payload = update.to_dict()
+                owner = owner_of(update_user_id(payload), len(worker_urls))
+                batches.setdefault(owner, []).append(payload)
+
+            # Воркеры получают свои части параллельно, внутри воркера — по порядку
+            await asyncio.gather(*(
+                _deliver(client, worker_urls[owner], batch) for owner, batch in batches.items()
+            ))
+            offset = updates[-1].update_id + 1
+
+
+# ==================== ЛОКАЛЬНЫЙ ЗАПУСК ====================
+
+def launch_local(worker_count: int, base_port: int = 8081):
+    """Запустить ingress и worker_count воркеров подпроцессами (для проверки на одной машине)."""
+    urls = [f"http://127.0.0.1:{base_port + i}/update" for i in range(worker_count)]
+    secret = WORKER_SECRET or secrets.token_hex(16)
+    processes = []
+    for index in range(worker_count):
+        env = dict(
+            os.environ,
+            BOT_MODE="worker",
+            WORKER_COUNT=str(worker_count),
+            WORKER_INDEX=str(index),
+            WORKER_PORT=str(base_port + index),
+            WORKER_HOST="127.0.0.1",
+            WORKER_SECRET=secret,
+        )
+        processes.append(subprocess.Popen([sys.executable, "main.py"], env=env))
+    env = dict(os.environ, BOT_MODE="ingress", WORKER_URLS=",".join(urls), WORKER_SECRET=secret)
+    processes.append(subprocess.Popen([sys.executable, "main.py"], env=env))
+
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == '__main__':
+    launch_local(int(sys.argv[1]) if len(sys.argv) > 1 else 2)
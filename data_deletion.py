@@ -0,0 +1,121 @@
+"""
+Очистка истории («🗑️ Очистить историю») в фоне, порциями.
+
+На запросе пользователя выполняется только короткая транзакция
+database.request_user_data_deletion: небольшие таблицы очищаются сразу, а объёмные
+ставятся в deletion_requests с границей (последний training_id и время запроса).
+Пользователь сразу получает подтверждение и может пользоваться ботом, а фоновая задача
+удаляет старые данные порциями по DELETION_CHUNK_SIZE тренировок — каждая в своей
+короткой транзакции, с паузой DELETION_CHUNK_PAUSE между ними, чтобы не держать
+блокировки и не отнимать БД у других пользователей. Прогресс показывается
+редактированием сообщения о начале очистки.
+
+Если процесс упал посреди очистки, задача планировщика "user_data_deletion" подберёт
+её после SCHEDULER_STALE_AFTER секунд без heartbeat и доведёт до конца.
+
+Переменные окружения:
+    DELETION_CHUNK_SIZE       — тренировок (или строк замеров) в одной транзакции (200)
+    DELETION_CHUNK_PAUSE      — пауза между порциями, сек (0.05)
+    DELETION_PROGRESS_INTERVAL — как часто обновлять сообщение о прогрессе, сек (3)
+"""
+import asyncio
+import logging
+import os
+import time
+
+from database import (
+    checkpoint_deletion, claim_stale_deletions, delete_user_data_chunk, finish_deletion,
+    request_user_data_deletion,
+)
+from metrics import inc
+from rate_limiter import PRIORITY_BULK
+from scheduler import OWNER, STALE_AFTER
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.getenv('DELETION_CHUNK_SIZE', '200'))
+CHUNK_PAUSE = float(os.getenv('DELETION_CHUNK_PAUSE', '0.05'))
+PROGRESS_INTERVAL = float(os.getenv('DELETION_PROGRESS_INTERVAL', '3'))
+
+# Очистки, которые ведёт этот процесс: user_id -> заявка (повторный запрос обновляет её на ходу)
+_active = {}
+
+
+def progress_text(deleted_trainings, total_trainings) -> str:
+    return f"🗑 Удаляем историю… тренировок удалено: {deleted_trainings} из {total_trainings}"
+
+
+async def _edit(bot, user_id, message_id, text):
+    if not message_id:
+        return
+    try:
+        await bot.edit_message_text(text, chat_id=user_id, message_id=message_id, rate_limit_args=PRIORITY_BULK)
+    except Exception as e:
+        # Сообщение удалено, текст не изменился и т.п. — прогресс не критичен
+        logger.debug("Прогресс очистки %s не обновлён: %s", user_id, e)
+
+
+async def run_deletion(bot, request):
+    """Удалить данные по заявке deletion_requests порциями, обновляя прогресс."""
+    user_id = request['user_id']
+    if user_id in _active:
+        # Повторная очистка во время текущей: новая граница и сообщение прогресса
+        _active[user_id].update(request)
+        return
+    _active[user_id] = request
+    started = time.perf_counter()
+    deleted_rows = request.get('deleted_rows') or 0
+    deleted_trainings = request.get('deleted_trainings') or 0
+    last_progress = time.monotonic()
+    try:
+        while True:
+            result = await asyncio.to_thread(
+                delete_user_data_chunk, user_id, request['cutoff_training_id'], request['cutoff_at'], CHUNK_SIZE,
+            )
+            if result is None:
+                # БД недоступна: заявка останется «running» и будет подобрана планировщиком
+                logger.warning("Очистка истории %s прервана, будет продолжена позже", user_id)
+                return
+            rows, trainings = result
+            if not rows:
+                break
+            deleted_rows += rows
+            deleted_trainings += trainings
+            inc("user_data_deleted_rows_total", rows)
+            if not await asyncio.to_thread(
+                checkpoint_deletion, user_id, OWNER, deleted_rows, deleted_trainings, request.get('message_id'),
+            ):
+                logger.warning("Очистку истории %s перехватил другой процесс", user_id)
+                return
+            if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                text = progress_text(deleted_trainings, request['total_trainings'])
+                await _edit(bot, user_id, request.get('message_id'), text)
+            await asyncio.sleep(CHUNK_PAUSE)
+
+        await asyncio.to_thread(finish_deletion, user_id, OWNER)
+        elapsed = time.perf_counter() - started
+        logger.info(
+            "🗑 История пользователя %s удалена: %s строк (%s тренировок) за %.1f с",
+            user_id, deleted_rows, deleted_trainings, elapsed,
+        )
+        inc("user_data_deletions_total")
+        await _edit(bot, user_id, request.get('message_id'), f"✅ История удалена (тренировок: {deleted_trainings}).")
+    except Exception:
+        logger.exception("Ошибка очистки истории пользователя %s", user_id)
+    finally:
+        _active.pop(user_id, None)
+
+
+async def queue_deletion(user_id):
+    """Быстрая часть очистки (короткая транзакция). Заявка для run_deletion или None при ошибке."""
+    return await asyncio.to_thread(request_user_data_deletion, user_id, OWNER)
+
+
+async def run_stale_deletions(run):
+    """Задача планировщика: довести до конца очистки, брошенные упавшими процессами."""
+    requests = await asyncio.to_thread(claim_stale_deletions, OWNER, STALE_AFTER)
+    for request in requests:
+        logger.info("Продолжаем очистку истории пользователя %s", request['user_id'])
+        await run_deletion(run.application.bot, request)
+    run.details.update(resumed=len(requests))
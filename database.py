@@ -1,10 +1,24 @@
 import os
 import logging
-import pg8000
 import json
-from datetime import datetime
+import contextlib
+import functools
+import random
+import sys
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
 from urllib.parse import urlparse
 
+from metrics import (
+    inc, track_db, observe, current_update_stats, record_db_connect, record_db_round_trip,
+)
+from circuit_breaker import CircuitBreaker
+from logging_setup import current_user_id
+from progression import summarize_sets
+from body_metrics import parse_measurements
+import history_archive
 from utils_constants import DEFAULT_STRENGTH_EXERCISES, DEFAULT_CARDIO_EXERCISES
 
 logger = logging.getLogger(__name__)
@@ -14,6 +28,275 @@ STRENGTH_TYPE = 'strength'
 CARDIO_TYPE = 'cardio'
 
 
+# Трассировка запросов: порог медленного запроса и доля EXPLAIN для выбросов
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '200'))
+EXPLAIN_SAMPLE_RATE = float(os.getenv('DB_EXPLAIN_SAMPLE_RATE', '0'))
+
+# Недоступность БД: таймаут подключения, circuit breaker и повторы идемпотентных чтений
+CONNECT_TIMEOUT = float(os.getenv('DB_CONNECT_TIMEOUT', '10'))
+
+# application_name соединений бота: по нему миграции (partitioning.py) видят, что бот запущен;
+# служебные скрипты подключаются под своим именем
+BOT_APPLICATION_NAME = "fitness-bot"
+APPLICATION_NAME = BOT_APPLICATION_NAME
+READ_RETRIES = int(os.getenv('DB_READ_RETRIES', '2'))
+RETRY_BASE_DELAY = float(os.getenv('DB_RETRY_BASE_DELAY', '0.1'))
+RETRY_MAX_DELAY = float(os.getenv('DB_RETRY_MAX_DELAY', '1'))
+
+db_breaker = CircuitBreaker(
+    "database",
+    failure_threshold=int(os.getenv('DB_BREAKER_FAILURES', '3')),
+    reset_timeout=float(os.getenv('DB_BREAKER_RESET_TIMEOUT', '30')),
+)
+
+# Пул соединений (0 — новое соединение на каждый вызов), сколько секунд простоя соединение остаётся
+# пригодным; именованные prepared statements для горячих запросов — разбираются и планируются один
+# раз на соединение (выключить при пулере в режиме transaction, он их не поддерживает)
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', '300'))
+PREPARED_STATEMENTS = os.getenv('DB_PREPARED_STATEMENTS', '1') != '0'
+STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '64'))
+
+# Реплика для чтения статистики, истории и экспорта (пусто — всё с основной БД) и сколько секунд
+# после своей записи пользователь читает с основной: реплика может отставать
+REPLICA_URL = os.getenv('DATABASE_REPLICA_URL', '')
+REPLICA_FRESHNESS = float(os.getenv('DB_REPLICA_FRESHNESS', '5'))
+
+replica_breaker = CircuitBreaker(
+    "database_replica",
+    failure_threshold=int(os.getenv('DB_BREAKER_FAILURES', '3')),
+    reset_timeout=float(os.getenv('DB_BREAKER_RESET_TIMEOUT', '30')),
+)
+
+# user_id -> time.monotonic() последней записи в рамках его апдейта. Апдейты пользователя
+# обрабатывает один воркер (cluster.py), поэтому учёта в процессе бота достаточно; задачам
+# пула процессов он передаёт решение через primary_reads (process_pool.run_job)
+_recent_writes = {}
+_RECENT_WRITES_LIMIT = 10000
+
+# Был ли в текущем вызове сетевой сбой (функции доступа к БД ловят исключения сами);
+# replica — вызов читает с реплики, on_replica — текущее соединение открыто к ней,
+# primary — чтения replica_read идут с основной БД (primary_reads)
+_call_state = threading.local()
+
+
+def database_available() -> bool:
+    """False, пока circuit breaker разомкнут: обращаться к БД бессмысленно."""
+    return not db_breaker.is_open()
+
+
+def call_noting_transient(func, *args, **kwargs):
+    """Вызвать функцию доступа к БД. Возвращает (результат, была ли в вызове временная недоступность БД —
+    сетевой сбой или разомкнутый breaker, в отличие от ошибок SQL и ограничений)."""
+    _call_state.transient = False
+    result = func(*args, **kwargs)
+    return result, _call_state.transient
+
+
+def _is_transient(error) -> bool:
+    """Сетевой сбой/обрыв соединения — в отличие от ошибок SQL и ограничений."""
+    if isinstance(error, (OSError, TimeoutError)):
+        return True
+    pg8000 = sys.modules.get("pg8000")
+    return pg8000 is not None and isinstance(error, pg8000.exceptions.InterfaceError)
+
+
+def _current_breaker():
+    return replica_breaker if getattr(_call_state, "on_replica", False) else db_breaker
+
+
+def _note_failure(error):
+    if _is_transient(error):
+        _call_state.transient = True
+        _current_breaker().record_failure(error)
+
+
+def _note_write():
+    """Запомнить, что пользователь текущего апдейта только что писал: его чтения пока идут с основной БД."""
+    user_id = current_user_id()
+    if user_id is None:
+        return
+    now = time.monotonic()
+    if len(_recent_writes) >= _RECENT_WRITES_LIMIT:
+        for key, written in list(_recent_writes.items()):
+            if now - written >= REPLICA_FRESHNESS:
+                del _recent_writes[key]
+    _recent_writes[user_id] = now
+
+
+def wrote_recently(user_id) -> bool:
+    """Писал ли пользователь последние DB_REPLICA_FRESHNESS секунд: тогда его чтения — с основной БД."""
+    written = _recent_writes.get(user_id)
+    return written is not None and time.monotonic() - written < REPLICA_FRESHNESS
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Чтения replica_read внутри блока — с основной БД (задачи пула процессов, где нет _recent_writes)."""
+    previous = getattr(_call_state, "primary", False)
+    _call_state.primary = True
+    try:
+        yield
+    finally:
+        _call_state.primary = previous
+
+
+def replica_read(func):
+    """Чтение статистики, истории или экспорта (первый аргумент — user_id): с реплики, если она
+    настроена и пользователь не писал последние DB_REPLICA_FRESHNESS секунд. Вложенные вызовы
+    (упражнения тренировок истории) читают оттуда же."""
+    @functools.wraps(func)
+    def wrapper(user_id, *args, **kwargs):
+        if not REPLICA_URL or getattr(_call_state, "replica", False):
+            return func(user_id, *args, **kwargs)
+        if getattr(_call_state, "primary", False):
+            inc("db_replica_fallbacks_total", reason="primary_requested")
+            return func(user_id, *args, **kwargs)
+        if wrote_recently(user_id):
+            inc("db_replica_fallbacks_total", reason="recent_write")
+            return func(user_id, *args, **kwargs)
+        _call_state.replica = True
+        try:
+            return func(user_id, *args, **kwargs)
+        finally:
+            _call_state.replica = False
+            _call_state.on_replica = False
+    return wrapper
+
+
+def _call_with_retries(func, args, kwargs):
+    """Повторы после сетевого сбоя: экспоненциальная пауза со случайным разбросом
+    (full jitter), только пока breaker замкнут (для чтения с реплики — breaker реплики)."""
+    outer = getattr(_call_state, "transient", False)
+    try:
+        for attempt in range(READ_RETRIES + 1):
+            _call_state.transient = False
+            result = func(*args, **kwargs)
+            if not _call_state.transient or attempt == READ_RETRIES or not _current_breaker().is_closed():
+                return result
+            inc("db_retries_total", function=func.__name__)
+            time.sleep(random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)))
+        return result
+    finally:
+        _call_state.transient = outer or _call_state.transient
+
+
+def retry_read(func):
+    """Идемпотентное чтение: повторяется после сетевого сбоя."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return _call_with_retries(func, args, kwargs)
+    return wrapper
+
+
+def retry_keyed_write(func):
+    """Запись повторяется после сетевого сбоя, только если передан idempotency_key
+    (без ключа повтор после потерянного ответа создал бы дубликат)."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if kwargs.get("idempotency_key"):
+            return _call_with_retries(func, args, kwargs)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def _param_shapes(params):
+    """Форма параметров без значений: типы и длины строк."""
+    if params is None:
+        return []
+    shapes = []
+    for value in params:
+        if isinstance(value, (str, bytes)):
+            shapes.append(f"{type(value).__name__}[{len(value)}]")
+        else:
+            shapes.append(type(value).__name__)
+    return shapes
+
+
+def _explain_outlier(cur, sql, params):
+    """EXPLAIN (ANALYZE, BUFFERS) медленного SELECT на отдельном курсоре того же соединения."""
+    try:
+        with cur.connection.cursor() as explain_cur:
+            explain_cur.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params or ())
+            plan = "\n".join(row[0] for row in explain_cur.fetchall())
+        logger.warning("План медленного запроса:\n%s", plan)
+    except Exception as e:
+        logger.warning(f"Не удалось получить EXPLAIN: {e}")
+
+
+def _execute_prepared(cur, sql, params):
+    """Выполнить sql именованным prepared statement соединения (готовится при первом вызове).
+
+    Вместо Parse/Describe/Bind с тремя ожиданиями ответа — один Bind/Execute, а PostgreSQL после
+    нескольких выполнений переходит на общий план и не планирует запрос заново. Использует
+    внутренний API pg8000 (версия закреплена в requirements.txt).
+    """
+    from pg8000.converters import make_params
+    from pg8000.dbapi import convert_paramstyle
+
+    conn = cur._c
+    statements = _statements.setdefault(conn, {})
+    statement, values = convert_paramstyle(cur.paramstyle, sql, params)
+    prepared = statements.get(sql)
+    if prepared is None:
+        if len(statements) >= STATEMENT_CACHE_SIZE:
+            return cur.execute(sql, params)
+        prepared = statements[sql] = conn.prepare_statement(statement, ())
+        inc("db_prepared_statements_total")
+    name, columns, input_funcs = prepared
+    if not conn._in_transaction and not conn.autocommit:
+        conn.execute_simple("begin transaction")
+    try:
+        cur._context = conn.execute_named(name, make_params(conn.py_types, values), columns, input_funcs, statement)
+    except Exception:
+        # Например, «cached plan must not change result type» после ALTER TABLE — подготовить заново
+        statements.pop(sql, None)
+        raise
+    cur._row_iter = iter(cur._context.rows or ())
+    return cur
+
+
+def _execute(cur, sql, params=None, prepared=False):
+    """Выполнить запрос: учёт round trip, время выполнения и лог медленных запросов.
+    prepared=True — горячий запрос с неизменным текстом: выполнять через prepared statement."""
+    record_db_round_trip()
+    if REPLICA_URL and not getattr(_call_state, "on_replica", False) and sql.lstrip()[:6].upper() != "SELECT":
+        _note_write()
+    caller = sys._getframe(1).f_code.co_name
+    started = time.perf_counter()
+    try:
+        if params is None:
+            result = cur.execute(sql)
+        elif prepared and PREPARED_STATEMENTS:
+            result = _execute_prepared(cur, sql, params)
+        else:
+            result = cur.execute(sql, params)
+    except Exception as e:
+        _note_failure(e)
+        raise
+    else:
+        # Соединения из пула не проходят через подключение: успешный запрос сбрасывает счётчик сбоев
+        _current_breaker().record_success()
+        return result
+    finally:
+        elapsed = time.perf_counter() - started
+        observe("db_statement_seconds", elapsed, function=caller)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            stats = current_update_stats()
+            statement = " ".join(sql.split())
+            logger.warning(
+                "Медленный запрос %.0f мс в %s (хендлер %s), параметры %s: %s",
+                elapsed * 1000,
+                caller,
+                stats["handler"] if stats else "-",
+                _param_shapes(params),
+                statement[:500],
+            )
+            if statement.upper().startswith("SELECT") and random.random() < EXPLAIN_SAMPLE_RATE:
+                _explain_outlier(cur, sql, params)
+
+
+@track_db
 def ensure_bot_schema():
     """Создаёт вспомогательные таблицы, если их ещё нет (идемпотентно)."""
     conn = get_db_connection()
@@ -22,7 +305,7 @@ def ensure_bot_schema():
         return
     try:
         with conn.cursor() as cur:
-            cur.execute(
+            _execute(cur,
                 """
                 CREATE TABLE IF NOT EXISTS user_hidden_defaults (
                     user_id BIGINT NOT NULL,
@@ -32,19 +315,208 @@ def ensure_bot_schema():
                 )
                 """
             )
+            # Общее хранилище состояния диалогов для нескольких воркеров (см. persistence.py)
+            _execute(cur,
+                """
+                CREATE TABLE IF NOT EXISTS bot_conversations (
+                    name TEXT NOT NULL,
+                    chat_id BIGINT NOT NULL,
+                    user_id BIGINT NOT NULL,
+                    state INTEGER NOT NULL,
+                    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (name, chat_id, user_id)
+                )
+                """
+            )
+            _execute(cur,
+                """
+                CREATE TABLE IF NOT EXISTS bot_user_data (
+                    user_id BIGINT PRIMARY KEY,
+                    data JSONB NOT NULL,
+                    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            # Ключи идемпотентности (из update_id): повторная доставка апдейта, двойное нажатие
+            # или досылка из локального журнала (journal.py) не создают дубликатов
+            for table in ("trainings", "training_exercises", "user_measurements"):
+                _execute(cur,
+                    f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS idempotency_key TEXT"
+                )
+                _execute(cur,
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_idempotency_key ON {table} (idempotency_key)"
+                )
+            # Начало тренировки у каждого упражнения — ключ секционирования training_exercises
+            # (partitioning.py); новые строки заполняют его всегда, старые — при миграции
+            _execute(cur,
+                "ALTER TABLE training_exercises ADD COLUMN IF NOT EXISTS training_start TIMESTAMP"
+            )
+            # Прогресс в силовых упражнениях (см. progression.py): точка на каждое выполнение и рекорды
+            _execute(cur,
+                """
+                CREATE TABLE IF NOT EXISTS exercise_progress (
+                    exercise_id BIGINT PRIMARY KEY,
+                    user_id BIGINT NOT NULL,
+                    exercise TEXT NOT NULL,
+                    training_id BIGINT NOT NULL,
+                    recorded_at TIMESTAMP NOT NULL,
+                    best_1rm REAL NOT NULL,
+                    best_weight REAL NOT NULL,
+                    best_reps INTEGER NOT NULL,
+                    max_weight REAL NOT NULL,
+                    volume REAL NOT NULL,
+                    sets_count INTEGER NOT NULL,
+                    reps_total INTEGER NOT NULL
+                )
+                """
+            )
+            _execute(cur,
+                """
+                CREATE INDEX IF NOT EXISTS exercise_progress_series
+                ON exercise_progress (user_id, exercise, recorded_at DESC)
+                """
+            )
+            _execute(cur,
+                """
+                CREATE TABLE IF NOT EXISTS exercise_records (
+                    user_id BIGINT NOT NULL,
+                    exercise TEXT NOT NULL,
+                    best_1rm REAL NOT NULL,
+                    best_1rm_at TIMESTAMP NOT NULL,
+                    best_weight REAL NOT NULL,
+                    best_reps INTEGER NOT NULL,
+                    max_weight REAL NOT NULL,
+                    max_weight_at TIMESTAMP NOT NULL,
+                    best_volume REAL NOT NULL,
+                    best_volume_at TIMESTAMP NOT NULL,
+                    total_volume REAL NOT NULL,
+                    sessions INTEGER NOT NULL,
+                    first_at TIMESTAMP NOT NULL,
+                    last_at TIMESTAMP NOT NULL,
+                    PRIMARY KEY (user_id, exercise)
+                )
+                """
+            )
+            # Замеры тела по показателям (см. body_metrics.py); исходный текст остаётся в user_measurements
+            _execute(cur,
+                """
+                CREATE TABLE IF NOT EXISTS measurement_values (
+                    user_id BIGINT NOT NULL,
+                    metric TEXT NOT NULL,
+                    measured_at TIMESTAMP NOT NULL,
+                    value REAL NOT NULL,
+                    raw TEXT NOT NULL,
+                    PRIMARY KEY (user_id, metric, measured_at)
+                )
+                """
+            )
+            # Незавершённые тренировки: get_current_training и очистка брошенных (maintenance.py)
+            # читают маленький частичный индекс вместо всей истории
+            _execute(cur,
+                """
+                CREATE INDEX IF NOT EXISTS trainings_open
+                ON trainings (user_id, date_start DESC) WHERE date_end IS NULL
+                """
+            )
+            # Очистка истории (data_deletion.py): удаление порциями в фоне, граница — на момент запроса
+            _execute(cur,
+                """
+                CREATE TABLE IF NOT EXISTS deletion_requests (
+                    user_id BIGINT PRIMARY KEY,
+                    cutoff_training_id BIGINT NOT NULL,
+                    cutoff_at TIMESTAMP NOT NULL,
+                    total_trainings INTEGER NOT NULL,
+                    deleted_trainings INTEGER NOT NULL DEFAULT 0,
+                    deleted_rows INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    owner TEXT,
+                    message_id BIGINT,
+                    requested_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    heartbeat_at TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+                """
+            )
+            # Фоновые задачи по расписанию (scheduler.py): один запуск за период, курсор для продолжения
+            _execute(cur,
+                """
+                CREATE TABLE IF NOT EXISTS scheduled_jobs (
+                    name TEXT PRIMARY KEY,
+                    period_key TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    cursor TEXT NOT NULL DEFAULT '',
+                    processed INTEGER NOT NULL DEFAULT 0,
+                    owner TEXT,
+                    started_at TIMESTAMP,
+                    heartbeat_at TIMESTAMP,
+                    finished_at TIMESTAMP,
+                    error TEXT
+                )
+                """
+            )
+            # Итоги прошлой недели (digest.py), считаются заранее в ночь на понедельник
+            _execute(cur,
+                """
+                CREATE TABLE IF NOT EXISTS weekly_digests (
+                    user_id BIGINT NOT NULL,
+                    week_start DATE NOT NULL,
+                    trainings INTEGER NOT NULL,
+                    prev_trainings INTEGER NOT NULL,
+                    exercises INTEGER NOT NULL,
+                    cardio INTEGER NOT NULL,
+                    volume REAL NOT NULL,
+                    records INTEGER NOT NULL,
+                    top_exercise TEXT,
+                    computed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    sent_at TIMESTAMP,
+                    PRIMARY KEY (user_id, week_start)
+                )
+                """
+            )
+            # Отправленные графики (charts.py): file_id в Telegram и версия данных, по которой он нарисован
+            _execute(cur,
+                """
+                CREATE TABLE IF NOT EXISTS chart_cache (
+                    user_id BIGINT NOT NULL,
+                    chart TEXT NOT NULL,
+                    data_version TEXT NOT NULL,
+                    file_id TEXT NOT NULL,
+                    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, chart)
+                )
+                """
+            )
+            # Холодный архив истории (history_archive.py): сжатый блок тренировок на пользователя и месяц
+            _execute(cur,
+                """
+                CREATE TABLE IF NOT EXISTS training_archive (
+                    user_id BIGINT NOT NULL,
+                    period_start DATE NOT NULL,
+                    trainings INTEGER NOT NULL,
+                    first_at TIMESTAMP NOT NULL,
+                    last_at TIMESTAMP NOT NULL,
+                    data BYTEA NOT NULL,
+                    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, period_start)
+                )
+                """
+            )
+            _detect_partitioning(cur)
         conn.commit()
         conn.close()
     except Exception as e:
         logger.error(f"ensure_bot_schema: {e}")
 
 
+@track_db
+@retry_read
 def _hidden_defaults_rows(user_id):
     conn = get_db_connection()
     if not conn:
         return []
     try:
         with conn.cursor() as cur:
-            cur.execute(
+            _execute(cur,
                 "SELECT name, type FROM user_hidden_defaults WHERE user_id = %s",
                 (user_id,),
             )
@@ -56,6 +528,7 @@ def _hidden_defaults_rows(user_id):
         return []
 
 
+@track_db
 def get_hidden_defaults(user_id):
     """Имена стандартных упражнений, скрытых для пользователя."""
     hidden = {"strength": set(), "cardio": set()}
@@ -67,6 +540,7 @@ def get_hidden_defaults(user_id):
     return hidden
 
 
+@track_db
 def add_hidden_default_exercise(user_id, name, type_):
     """Скрыть стандартное упражнение из каталога пользователя."""
     conn = get_db_connection()
@@ -74,7 +548,7 @@ def add_hidden_default_exercise(user_id, name, type_):
         return False
     try:
         with conn.cursor() as cur:
-            cur.execute(
+            _execute(cur,
                 """
                 INSERT INTO user_hidden_defaults (user_id, name, type)
                 VALUES (%s, %s, %s)
@@ -84,16 +558,68 @@ def add_hidden_default_exercise(user_id, name, type_):
             )
         conn.commit()
         conn.close()
+        _bump_catalog_version(user_id)
         return True
     except Exception as e:
         logger.error(f"❌ Ошибка скрытия упражнения {user_id}/{name}: {e}")
         return False
 
 
+# Версия каталога упражнений пользователя: растёт при каждом его изменении в этом процессе.
+# Кэш видимого каталога действителен, пока версия совпадает (и не старше TTL —
+# на случай изменений из другого процесса).
+CATALOG_CACHE_TTL = float(os.getenv('CATALOG_CACHE_TTL', '300'))
+_catalog_versions = {}
+_visible_catalog_cache = {}
+
+
+def get_catalog_version(user_id):
+    """Текущая версия каталога упражнений пользователя."""
+    return _catalog_versions.get(user_id, 0)
+
+
+def _bump_catalog_version(user_id):
+    _catalog_versions[user_id] = get_catalog_version(user_id) + 1
+    _visible_catalog_cache.pop(user_id, None)
+
+
+@track_db
+@retry_read
 def get_visible_exercise_lists(user_id):
-    """Каталог упражнений пользователя: стандартные минус скрытые + свои."""
-    hidden = get_hidden_defaults(user_id)
-    custom = get_custom_exercises(user_id)
+    """Каталог упражнений пользователя: стандартные минус скрытые + свои (кэш по версии каталога)."""
+    version = get_catalog_version(user_id)
+    cached = _visible_catalog_cache.get(user_id)
+    if cached and cached[0] == version and time.monotonic() - cached[1] < CATALOG_CACHE_TTL:
+        return cached[2]
+
+    # Скрытые стандартные и свои упражнения — одним запросом
+    hidden = {"strength": set(), "cardio": set()}
+    custom = {"strength": [], "cardio": []}
+    loaded = False
+    conn = get_db_connection()
+    if conn:
+        try:
+            with conn.cursor() as cur:
+                _execute(cur,
+                    """
+                    SELECT name, type, TRUE FROM user_hidden_defaults WHERE user_id = %s
+                    UNION ALL
+                    SELECT name, type, FALSE FROM custom_exercises WHERE user_id = %s
+                    """,
+                    (user_id, user_id),
+                )
+                rows = cur.fetchall()
+            conn.close()
+            for name, type_, is_hidden in rows:
+                if type_ not in custom:
+                    continue
+                if is_hidden:
+                    hidden[type_].add(name)
+                else:
+                    custom[type_].append(name)
+            loaded = True
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения каталога упражнений {user_id}: {e}")
 
     strength = [n for n in DEFAULT_STRENGTH_EXERCISES if n not in hidden["strength"]]
     for n in custom["strength"]:
@@ -105,9 +631,14 @@ def get_visible_exercise_lists(user_id):
         if n not in cardio:
             cardio.append(n)
 
-    return {"strength": strength, "cardio": cardio}
+    visible = {"strength": strength, "cardio": cardio}
+    # Неполный каталог (ошибка БД) не кэшируем
+    if loaded:
+        _visible_catalog_cache[user_id] = (version, time.monotonic(), visible)
+    return visible
 
 
+@track_db
 def remove_exercise_from_user_catalog(user_id, name, exercise_type):
     """Убрать упражнение из списка: своё — удалить из БД; стандартное — скрыть."""
     custom = get_custom_exercises(user_id)
@@ -119,36 +650,194 @@ def remove_exercise_from_user_catalog(user_id, name, exercise_type):
         return add_hidden_default_exercise(user_id, name, CARDIO_TYPE)
     return False
 
+def _connect(database_url):
+    url = urlparse(database_url)
+    
+    # Драйвер загружается при первом подключении — не замедляет старт бота
+    import pg8000
+
+    # Создаем SSL контекст с отключенной проверкой сертификата
+    import ssl
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    
+    return pg8000.connect(
+        host=url.hostname,
+        port=url.port or 5432,
+        user=url.username,
+        password=url.password,
+        database=url.path[1:],
+        ssl_context=ssl_context,
+        timeout=CONNECT_TIMEOUT,
+        application_name=APPLICATION_NAME,
+    )
+
+# Простаивающие соединения пула: адрес БД -> [(соединение, время возврата)]
+_idle = {}
+_pool_lock = threading.Lock()
+# Подготовленные запросы каждого соединения: текст запроса -> (имя, столбцы, функции разбора)
+_statements = weakref.WeakKeyDictionary()
+
+
+class _PooledConnection:
+    """Соединение из пула: close() возвращает его в пул, а не закрывает."""
+
+    __slots__ = ("_conn", "_url")
+
+    def __init__(self, conn, url):
+        self._conn = conn
+        self._url = url
+
+    def cursor(self):
+        return self._conn.cursor()
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        if self._conn is not None:
+            _release(self._url, self._conn)
+            self._conn = None
+
+
+def _acquire(database_url, breaker):
+    """Простаивающее соединение из пула или None. Пока breaker не замкнут, пробный запрос
+    идёт через новое подключение: его успех или сбой и переводит breaker в нужное состояние."""
+    if POOL_SIZE <= 0 or not breaker.is_closed():
+        return None
+    now = time.monotonic()
+    expired = []
+    conn = None
+    with _pool_lock:
+        idle = _idle.get(database_url, [])
+        while idle:
+            candidate, released = idle.pop()
+            if now - released < POOL_MAX_IDLE:
+                conn = candidate
+                break
+            expired.append(candidate)
+    for stale in expired:
+        _close_quietly(stale)
+    inc("db_pool_acquire_total", result="hit" if conn else "miss")
+    return conn
+
+
+def _release(database_url, conn):
+    # Чтение без commit оставляет открытую транзакцию — откатить, прежде чем отдавать соединение
+    try:
+        if conn._in_transaction:
+            conn.rollback()
+    except Exception:
+        _close_quietly(conn)
+        return
+    with _pool_lock:
+        idle = _idle.setdefault(database_url, [])
+        if len(idle) < POOL_SIZE:
+            idle.append((conn, time.monotonic()))
+            return
+    _close_quietly(conn)
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _pooled(conn, database_url):
+    return _PooledConnection(conn, database_url) if POOL_SIZE > 0 else conn
+
+
+def close_pool():
+    """Закрыть простаивающие соединения (при остановке бота)."""
+    with _pool_lock:
+        connections = [conn for idle in _idle.values() for conn, _ in idle]
+        _idle.clear()
+    for conn in connections:
+        _close_quietly(conn)
+
+
+def pool_status() -> dict:
+    """Раздел для /readyz."""
+    with _pool_lock:
+        idle = sum(len(connections) for connections in _idle.values())
+    return {"size": POOL_SIZE, "idle": idle, "prepared_statements": PREPARED_STATEMENTS}
+
+
+def _replica_connection():
+    """Соединение с репликой или None — тогда чтение уходит на основную БД."""
+    if not replica_breaker.allow():
+        inc("db_replica_fallbacks_total", reason="breaker_open")
+        return None
+    conn = _acquire(REPLICA_URL, replica_breaker)
+    if conn:
+        inc("db_replica_reads_total")
+        return _pooled(conn, REPLICA_URL)
+    try:
+        conn = _connect(REPLICA_URL)
+        replica_breaker.record_success()
+        inc("db_replica_reads_total")
+        return _pooled(conn, REPLICA_URL)
+    except Exception as e:
+        replica_breaker.record_failure(e)
+        inc("db_replica_fallbacks_total", reason="connect_error")
+        logger.warning(f"Реплика недоступна, чтение с основной БД: {e}")
+        return None
+
 def get_db_connection():
-    """Получить соединение с PostgreSQL для Supabase"""
+    """Получить соединение с PostgreSQL для Supabase (внутри replica_read — с репликой, если доступна)"""
+    if getattr(_call_state, "replica", False):
+        conn = _replica_connection()
+        _call_state.on_replica = conn is not None
+        if conn:
+            return conn
+    if not db_breaker.allow():
+        # БД заведомо недоступна: отказ сразу, без ожидания таймаута подключения (сбой временный)
+        _call_state.transient = True
+        return None
+    started = time.perf_counter()
     try:
         database_url = os.getenv('DATABASE_URL')
         if not database_url:
             logger.error("DATABASE_URL не установлен")
             return None
         
-        url = urlparse(database_url)
-        
-        # Создаем SSL контекст с отключенной проверкой сертификата
-        import ssl
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        
-        conn = pg8000.connect(
-            host=url.hostname,
-            port=url.port or 5432,
-            user=url.username,
-            password=url.password,
-            database=url.path[1:],
-            ssl_context=ssl_context,
-            timeout=10
-        )
-        return conn
+        conn = _acquire(database_url, db_breaker)
+        if conn:
+            return _pooled(conn, database_url)
+        conn = _connect(database_url)
+        record_db_connect(time.perf_counter() - started, ok=True)
+        db_breaker.record_success()
+        return _pooled(conn, database_url)
     except Exception as e:
+        record_db_connect(time.perf_counter() - started, ok=False)
+        _call_state.transient = True
+        db_breaker.record_failure(e)
         logger.error(f"❌ Ошибка подключения к базе: {e}")
         return None
 
+@track_db
+def ping_database():
+    """Проверка доступности БД: подключение и SELECT 1."""
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, "SELECT 1")
+            cur.fetchone()
+        conn.close()
+        return True
+    except Exception as e:
+        logger.error(f"❌ Проверка БД не прошла: {e}")
+        return False
+
+@track_db
 def create_user(user_id, username, first_name):
     """Создать нового пользователя"""
     conn = get_db_connection()
@@ -157,7 +846,7 @@ def create_user(user_id, username, first_name):
     
     try:
         with conn.cursor() as cur:
-            cur.execute('''
+            _execute(cur, '''
                 INSERT INTO users (user_id, username, first_name)
                 VALUES (%s, %s, %s)
                 ON CONFLICT (user_id) DO NOTHING
@@ -169,6 +858,8 @@ def create_user(user_id, username, first_name):
         logger.error(f"❌ Ошибка создания пользователя {user_id}: {e}")
         return False
 
+@track_db
+@retry_read
 def get_current_training(user_id):
     """Получить текущую (незавершенную) тренировку пользователя"""
     conn = get_db_connection()
@@ -177,13 +868,13 @@ def get_current_training(user_id):
     
     try:
         with conn.cursor() as cur:
-            cur.execute('''
+            _execute(cur, '''
                 SELECT training_id, date_start, comment, measurements
                 FROM trainings 
                 WHERE user_id = %s AND date_end IS NULL
                 ORDER BY date_start DESC 
                 LIMIT 1
-            ''', (user_id,))
+            ''', (user_id,), prepared=True)
             result = cur.fetchone()
         
         conn.close()
@@ -197,7 +888,7 @@ def get_current_training(user_id):
             }
             
             # Загружаем упражнения для этой тренировки
-            training['exercises'] = get_training_exercises(result[0])
+            training['exercises'] = get_training_exercises(result[0], result[1])
             return training
         
         return None
@@ -205,21 +896,52 @@ def get_current_training(user_id):
         logger.error(f"❌ Ошибка получения текущей тренировки {user_id}: {e}")
         return None
 
-def create_training(user_id):
-    """Создать новую тренировку"""
+def _check_key_owner(cur, table, column, key, owner):
+    """Вставка с ключом ничего не добавила: убедиться, что это повтор своей записи, а не чужая с тем же ключом."""
+    _execute(cur, f"SELECT {column} FROM {table} WHERE idempotency_key = %s", (key,))
+    row = cur.fetchone()
+    if row and row[0] != owner:
+        raise ValueError(f"ключ {key} уже занят записью {table} с {column}={row[0]}")
+
+@track_db
+@retry_keyed_write
+def create_training(user_id, idempotency_key=None):
+    """Создать новую тренировку (повтор с тем же idempotency_key вернёт уже созданную)"""
     conn = get_db_connection()
     if not conn:
         return None
     
     try:
-        current_date = datetime.now()
         with conn.cursor() as cur:
-            cur.execute('''
-                INSERT INTO trainings (user_id, date_start)
-                VALUES (%s, %s)
-                RETURNING training_id
-            ''', (user_id, current_date))
-            training_id = cur.fetchone()[0]
+            if trainings_partitioned():
+                # Уникальный индекс секционированной таблицы включает date_start, а при повторе
+                # время другое — поэтому существующая строка ищется по ключу явно. Одновременные
+                # попытки с тем же ключом ждут друг друга на блокировке до конца транзакции,
+                # иначе обе не нашли бы строку и вставили по тренировке
+                _execute(cur, "SELECT pg_advisory_xact_lock(hashtext(%s))", (idempotency_key,), prepared=True)
+                _execute(cur, '''
+                    WITH existing AS (
+                        SELECT training_id, date_start, user_id FROM trainings WHERE idempotency_key = %s
+                    ),
+                    inserted AS (
+                        INSERT INTO trainings (user_id, date_start, idempotency_key)
+                        SELECT %s, %s, %s
+                        WHERE NOT EXISTS (SELECT 1 FROM existing)
+                        RETURNING training_id, date_start, user_id
+                    )
+                    SELECT * FROM inserted UNION ALL SELECT * FROM existing
+                ''', (idempotency_key, user_id, datetime.now(), idempotency_key), prepared=True)
+            else:
+                # При конфликте ключа «пустой» UPDATE нужен, чтобы RETURNING вернул существующую строку
+                _execute(cur, '''
+                    INSERT INTO trainings (user_id, date_start, idempotency_key)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (idempotency_key) DO UPDATE SET idempotency_key = EXCLUDED.idempotency_key
+                    RETURNING training_id, date_start, user_id
+                ''', (user_id, datetime.now(), idempotency_key), prepared=True)
+            training_id, current_date, owner = cur.fetchone()
+            if owner != user_id:
+                raise ValueError(f"ключ {idempotency_key} уже занят тренировкой другого пользователя")
         
         conn.commit()
         conn.close()
@@ -232,53 +954,199 @@ def create_training(user_id):
             'measurements': ''
         }
     except Exception as e:
+        _forget_partitioning()
         logger.error(f"❌ Ошибка создания тренировки {user_id}: {e}")
         return None
 
-def delete_all_user_data(user_id):
-    """Удалить ВСЕ данные пользователя (очистка истории)"""
+_DELETION_COLUMNS = (
+    'user_id', 'cutoff_training_id', 'cutoff_at', 'total_trainings',
+    'deleted_trainings', 'deleted_rows', 'message_id',
+)
+
+@track_db
+def request_user_data_deletion(user_id, owner):
+    """Очистка истории, быстрая часть: одна короткая транзакция на запросе пользователя.
+
+    Сразу удаляются небольшие таблицы (свои упражнения, рекорды, кэши) и открытая тренировка,
+    а для объёмных (тренировки, упражнения, замеры) ставится задача в deletion_requests с
+    границей: всё, что пользователь создаст после запроса, удаление не затронет.
+    Возвращает заявку (поля _DELETION_COLUMNS) или None при ошибке.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            # Открытая тренировка — чтобы бот сразу перестал предлагать её продолжить
+            for table in ("training_exercises", "exercise_progress"):
+                _execute(cur, f'''
+                    DELETE FROM {table}
+                    WHERE training_id IN (
+                        SELECT training_id FROM trainings WHERE user_id = %s AND date_end IS NULL
+                    )
+                ''', (user_id,))
+            _execute(cur, "DELETE FROM trainings WHERE user_id = %s AND date_end IS NULL", (user_id,))
+            for table in (
+                "custom_exercises", "user_hidden_defaults", "exercise_records", "chart_cache", "weekly_digests",
+                "training_archive",
+            ):
+                _execute(cur, f"DELETE FROM {table} WHERE user_id = %s", (user_id,))
+            _execute(cur, f'''
+                INSERT INTO deletion_requests
+                    (user_id, cutoff_training_id, cutoff_at, total_trainings, status, owner, heartbeat_at)
+                SELECT %s, COALESCE(MAX(training_id), 0), CURRENT_TIMESTAMP, COUNT(*), 'running', %s, CURRENT_TIMESTAMP
+                FROM trainings WHERE user_id = %s
+                ON CONFLICT (user_id) DO UPDATE SET
+                    cutoff_training_id = EXCLUDED.cutoff_training_id,
+                    cutoff_at = EXCLUDED.cutoff_at,
+                    total_trainings = EXCLUDED.total_trainings,
+                    deleted_trainings = 0,
+                    deleted_rows = 0,
+                    status = 'running',
+                    owner = EXCLUDED.owner,
+                    heartbeat_at = EXCLUDED.heartbeat_at,
+                    requested_at = CURRENT_TIMESTAMP,
+                    finished_at = NULL
+                RETURNING {', '.join(_DELETION_COLUMNS)}
+            ''', (user_id, owner, user_id))
+            request = dict(zip(_DELETION_COLUMNS, cur.fetchone()))
+        
+        conn.commit()
+        conn.close()
+        _bump_catalog_version(user_id)
+        logger.info(
+            f"🗑 Очистка истории пользователя {user_id} поставлена в очередь ({request['total_trainings']} тренировок)"
+        )
+        return request
+    except Exception as e:
+        logger.error(f"❌ Ошибка постановки очистки истории {user_id}: {e}")
+        return None
+
+@track_db
+def delete_user_data_chunk(user_id, cutoff_training_id, cutoff_at, chunk_size):
+    """Удалить очередную порцию старых данных пользователя в отдельной короткой транзакции.
+
+    Сначала тренировки (по chunk_size вместе с упражнениями и точками прогресса), затем замеры.
+    Возвращает (удалено строк, из них тренировок); (0, 0) — удалять больше нечего; None — ошибка.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                SELECT training_id FROM trainings
+                WHERE user_id = %s AND training_id <= %s
+                ORDER BY training_id
+                LIMIT %s
+            ''', (user_id, cutoff_training_id, chunk_size))
+            training_ids = [row[0] for row in cur.fetchall()]
+            deleted = 0
+            if training_ids:
+                for sql in (
+                    "DELETE FROM training_exercises WHERE training_id = ANY(%s::BIGINT[])",
+                    "DELETE FROM exercise_progress WHERE training_id = ANY(%s::BIGINT[])",
+                    "DELETE FROM trainings WHERE training_id = ANY(%s::BIGINT[])",
+                ):
+                    _execute(cur, sql, (training_ids,))
+                    deleted += cur.rowcount
+            else:
+                # Архив — ещё раз: блок мог дописать архиватор, начавший работу до запроса очистки
+                for table, column in (
+                    ("user_measurements", "measurement_date"),
+                    ("measurement_values", "measured_at"),
+                    ("training_archive", "first_at"),
+                ):
+                    _execute(cur, f'''
+                        DELETE FROM {table}
+                        WHERE ctid IN (
+                            SELECT ctid FROM {table}
+                            WHERE user_id = %s AND {column} <= %s
+                            LIMIT %s
+                        )
+                    ''', (user_id, cutoff_at, chunk_size))
+                    deleted += cur.rowcount
+                    if deleted:
+                        break
+        conn.commit()
+        conn.close()
+        return deleted, len(training_ids)
+    except Exception as e:
+        logger.error(f"❌ Ошибка удаления порции данных пользователя {user_id}: {e}")
+        return None
+
+@track_db
+def checkpoint_deletion(user_id, owner, deleted_rows, deleted_trainings, message_id=None):
+    """Прогресс очистки. False — задачу перехватил другой процесс (или БД недоступна)."""
     conn = get_db_connection()
     if not conn:
         return False
-    
     try:
         with conn.cursor() as cur:
-            # Удаляем упражнения из тренировок
-            cur.execute('''
-                DELETE FROM training_exercises 
-                WHERE training_id IN (
-                    SELECT training_id FROM trainings WHERE user_id = %s
-                )
-            ''', (user_id,))
-            
-            # Удаляем тренировки
-            cur.execute('''
-                DELETE FROM trainings WHERE user_id = %s
-            ''', (user_id,))
-            
-            # Удаляем пользовательские упражнения
-            cur.execute('''
-                DELETE FROM custom_exercises WHERE user_id = %s
-            ''', (user_id,))
+            _execute(cur, '''
+                UPDATE deletion_requests
+                SET deleted_rows = %s, deleted_trainings = %s,
+                    message_id = COALESCE(%s, message_id), heartbeat_at = CURRENT_TIMESTAMP
+                WHERE user_id = %s AND owner = %s AND status = 'running'
+                RETURNING 1
+            ''', (deleted_rows, deleted_trainings, message_id, user_id, owner))
+            owned = cur.fetchone() is not None
+        conn.commit()
+        conn.close()
+        return owned
+    except Exception as e:
+        logger.error(f"❌ Ошибка сохранения прогресса очистки {user_id}: {e}")
+        return False
 
-            cur.execute(
-                "DELETE FROM user_hidden_defaults WHERE user_id = %s",
-                (user_id,),
-            )
-            
-            # Удаляем замеры
-            cur.execute('''
-                DELETE FROM user_measurements WHERE user_id = %s
-            ''', (user_id,))
-        
+@track_db
+def finish_deletion(user_id, owner):
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                UPDATE deletion_requests
+                SET status = 'done', finished_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+                WHERE user_id = %s AND owner = %s
+            ''', (user_id, owner))
         conn.commit()
         conn.close()
-        logger.info(f"✅ Все данные пользователя {user_id} удалены")
         return True
     except Exception as e:
-        logger.error(f"❌ Ошибка удаления данных пользователя {user_id}: {e}")
+        logger.error(f"❌ Ошибка завершения очистки {user_id}: {e}")
         return False
 
+@track_db
+def claim_stale_deletions(owner, stale_after, limit=20):
+    """Забрать очистки, брошенные упавшим процессом (heartbeat старше stale_after секунд)"""
+    conn = get_db_connection()
+    if not conn:
+        return []
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, f'''
+                UPDATE deletion_requests
+                SET owner = %s, heartbeat_at = CURRENT_TIMESTAMP
+                WHERE user_id IN (
+                    SELECT user_id FROM deletion_requests
+                    WHERE status = 'running'
+                      AND heartbeat_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+                    ORDER BY requested_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING {', '.join(_DELETION_COLUMNS)}
+            ''', (owner, stale_after, limit))
+            rows = cur.fetchall()
+        conn.commit()
+        conn.close()
+        return [dict(zip(_DELETION_COLUMNS, row)) for row in rows]
+    except Exception as e:
+        logger.error(f"❌ Ошибка выборки брошенных очисток: {e}")
+        return []
+
+@track_db
 def save_training_measurements(training_id, measurements):
     """Сохранить замеры для тренировки"""
     conn = get_db_connection()
@@ -287,7 +1155,7 @@ def save_training_measurements(training_id, measurements):
     
     try:
         with conn.cursor() as cur:
-            cur.execute('''
+            _execute(cur, '''
                 UPDATE trainings 
                 SET measurements = %s
                 WHERE training_id = %s
@@ -300,8 +1168,10 @@ def save_training_measurements(training_id, measurements):
         logger.error(f"❌ Ошибка сохранения замеров {training_id}: {e}")
         return False
 
-def add_exercise_to_training(training_id, exercise_data):
-    """Добавить упражнение к тренировке"""
+@track_db
+@retry_keyed_write
+def add_exercise_to_training(training_id, exercise_data, idempotency_key=None):
+    """Добавить упражнение к тренировке (повтор с тем же idempotency_key ничего не добавляет)"""
     conn = get_db_connection()
     if not conn:
         return False
@@ -314,21 +1184,34 @@ def add_exercise_to_training(training_id, exercise_data):
                 sets_data = exercise_data.get('sets', [])
                 sets_json = json.dumps(sets_data)  # ← ВАЖНО!
                 
-                cur.execute('''
+                _execute(cur, f'''
                     INSERT INTO training_exercises 
-                    (training_id, name, type, sets)
-                    VALUES (%s, %s, %s, %s)
+                    (training_id, name, type, sets, idempotency_key, training_start)
+                    VALUES (%s, %s, %s, %s, %s, ({_TRAINING_START}))
+                    ON CONFLICT {_exercise_conflict()} DO NOTHING
+                    RETURNING exercise_id
                 ''', (
                     training_id, 
                     exercise_data['name'], 
                     STRENGTH_TYPE,
-                    sets_json  # ← передаем JSON строку
-                ))
+                    sets_json,  # ← передаем JSON строку
+                    idempotency_key,
+                    training_id
+                ), prepared=True)
+                inserted = cur.fetchone()
+                # Повтор с тем же ключом ничего не вставил — прогресс уже учтён
+                if inserted:
+                    _record_progress(cur, inserted[0], training_id, exercise_data['name'], summarize_sets(sets_data))
+                else:
+                    _check_key_owner(cur, "training_exercises", "training_id", idempotency_key, training_id)
             else:  # CARDIO
-                cur.execute('''
+                _execute(cur, f'''
                     INSERT INTO training_exercises 
-                    (training_id, name, type, time_minutes, distance_meters, speed_kmh, details)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    (training_id, name, type, time_minutes, distance_meters, speed_kmh, details, idempotency_key,
+                     training_start)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, ({_TRAINING_START}))
+                    ON CONFLICT {_exercise_conflict()} DO NOTHING
+                    RETURNING exercise_id
                 ''', (
                     training_id,
                     exercise_data['name'],
@@ -336,62 +1219,281 @@ def add_exercise_to_training(training_id, exercise_data):
                     exercise_data.get('time_minutes'),
                     exercise_data.get('distance_meters'),
                     exercise_data.get('speed_kmh'),
-                    exercise_data.get('details', '')
-                ))
+                    exercise_data.get('details', ''),
+                    idempotency_key,
+                    training_id
+                ), prepared=True)
+                if not cur.fetchone():
+                    _check_key_owner(cur, "training_exercises", "training_id", idempotency_key, training_id)
         
         conn.commit()
         conn.close()
         return True
     except Exception as e:
+        _forget_partitioning()
         logger.error(f"❌ Ошибка добавления упражнения {training_id}: {e}")
         return False
 
-def get_training_exercises(training_id):
-    """Получить все упражнения для тренировки"""
+def _record_progress(cur, exercise_id, training_id, exercise, summary):
+    """Точка ряда и обновление рекордов — в транзакции сохранения упражнения."""
+    if not summary['sets_count']:
+        return
+    _execute(cur, '''
+        INSERT INTO exercise_progress
+        (exercise_id, user_id, exercise, training_id, recorded_at, best_1rm, best_weight, best_reps,
+         max_weight, volume, sets_count, reps_total)
+        SELECT %s, user_id, %s, training_id, date_start, %s, %s, %s, %s, %s, %s, %s
+        FROM trainings WHERE training_id = %s
+        ON CONFLICT (exercise_id) DO NOTHING
+    ''', (
+        exercise_id, exercise, summary['best_1rm'], summary['best_weight'], summary['best_reps'],
+        summary['max_weight'], summary['volume'], summary['sets_count'], summary['reps_total'],
+        training_id,
+    ), prepared=True)
+    # В DO UPDATE exercise_records.* — значения до обновления, EXCLUDED.* — новое выполнение
+    _execute(cur, '''
+        INSERT INTO exercise_records
+        (user_id, exercise, best_1rm, best_1rm_at, best_weight, best_reps, max_weight, max_weight_at,
+         best_volume, best_volume_at, total_volume, sessions, first_at, last_at)
+        SELECT user_id, %s, %s, date_start, %s, %s, %s, date_start, %s, date_start, %s, 1, date_start, date_start
+        FROM trainings WHERE training_id = %s
+        ON CONFLICT (user_id, exercise) DO UPDATE SET
+            best_1rm = GREATEST(exercise_records.best_1rm, EXCLUDED.best_1rm),
+            best_1rm_at = CASE WHEN EXCLUDED.best_1rm > exercise_records.best_1rm
+                THEN EXCLUDED.best_1rm_at ELSE exercise_records.best_1rm_at END,
+            best_weight = CASE WHEN EXCLUDED.best_1rm > exercise_records.best_1rm
+                THEN EXCLUDED.best_weight ELSE exercise_records.best_weight END,
+            best_reps = CASE WHEN EXCLUDED.best_1rm > exercise_records.best_1rm
+                THEN EXCLUDED.best_reps ELSE exercise_records.best_reps END,
+            max_weight = GREATEST(exercise_records.max_weight, EXCLUDED.max_weight),
+            max_weight_at = CASE WHEN EXCLUDED.max_weight > exercise_records.max_weight
+                THEN EXCLUDED.max_weight_at ELSE exercise_records.max_weight_at END,
+            best_volume = GREATEST(exercise_records.best_volume, EXCLUDED.best_volume),
+            best_volume_at = CASE WHEN EXCLUDED.best_volume > exercise_records.best_volume
+                THEN EXCLUDED.best_volume_at ELSE exercise_records.best_volume_at END,
+            total_volume = exercise_records.total_volume + EXCLUDED.total_volume,
+            sessions = exercise_records.sessions + 1,
+            first_at = LEAST(exercise_records.first_at, EXCLUDED.first_at),
+            last_at = GREATEST(exercise_records.last_at, EXCLUDED.last_at)
+    ''', (
+        exercise, summary['best_1rm'], summary['best_weight'], summary['best_reps'], summary['max_weight'],
+        summary['volume'], summary['volume'], training_id,
+    ), prepared=True)
+
+
+_REBUILD_RECORDS_SQL = '''
+    INSERT INTO exercise_records
+    (user_id, exercise, best_1rm, best_1rm_at, best_weight, best_reps, max_weight, max_weight_at,
+     best_volume, best_volume_at, total_volume, sessions, first_at, last_at)
+    SELECT
+        user_id, exercise,
+        MAX(best_1rm), (ARRAY_AGG(recorded_at ORDER BY best_1rm DESC, recorded_at))[1],
+        (ARRAY_AGG(best_weight ORDER BY best_1rm DESC, recorded_at))[1],
+        (ARRAY_AGG(best_reps ORDER BY best_1rm DESC, recorded_at))[1],
+        MAX(max_weight), (ARRAY_AGG(recorded_at ORDER BY max_weight DESC, recorded_at))[1],
+        MAX(volume), (ARRAY_AGG(recorded_at ORDER BY volume DESC, recorded_at))[1],
+        SUM(volume), COUNT(*), MIN(recorded_at), MAX(recorded_at)
+    FROM exercise_progress
+    GROUP BY user_id, exercise
+    ON CONFLICT (user_id, exercise) DO UPDATE SET
+        best_1rm = EXCLUDED.best_1rm, best_1rm_at = EXCLUDED.best_1rm_at,
+        best_weight = EXCLUDED.best_weight, best_reps = EXCLUDED.best_reps,
+        max_weight = EXCLUDED.max_weight, max_weight_at = EXCLUDED.max_weight_at,
+        best_volume = EXCLUDED.best_volume, best_volume_at = EXCLUDED.best_volume_at,
+        total_volume = EXCLUDED.total_volume, sessions = EXCLUDED.sessions,
+        first_at = EXCLUDED.first_at, last_at = EXCLUDED.last_at
+'''
+
+
+@track_db
+def backfill_exercise_progress(batch_size=1000):
+    """Заполнить exercise_progress по уже сохранённым силовым упражнениям и пересчитать рекорды.
+
+    Идемпотентно: уже учтённые упражнения пропускаются. Возвращает число добавленных точек.
+    """
     conn = get_db_connection()
     if not conn:
-        return []
-    
+        return 0
+    added = 0
+    last_id = 0
     try:
         with conn.cursor() as cur:
-            cur.execute('''
-                SELECT exercise_id, name, type, sets, time_minutes, 
-                       distance_meters, speed_kmh, details
-                FROM training_exercises 
-                WHERE training_id = %s
-                ORDER BY exercise_id
-            ''', (training_id,))
-            results = cur.fetchall()
-        
+            while True:
+                _execute(cur, '''
+                    SELECT te.exercise_id, te.training_id, te.name, te.sets
+                    FROM training_exercises te
+                    WHERE te.type = %s AND te.exercise_id > %s
+                      AND NOT EXISTS (SELECT 1 FROM exercise_progress p WHERE p.exercise_id = te.exercise_id)
+                    ORDER BY te.exercise_id
+                    LIMIT %s
+                ''', (STRENGTH_TYPE, last_id, batch_size))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                for exercise_id, training_id, name, sets in rows:
+                    if isinstance(sets, str):
+                        sets = json.loads(sets or "[]")
+                    summary = summarize_sets(sets)
+                    if summary['sets_count']:
+                        _execute(cur, '''
+                            INSERT INTO exercise_progress
+                            (exercise_id, user_id, exercise, training_id, recorded_at, best_1rm, best_weight,
+                             best_reps, max_weight, volume, sets_count, reps_total)
+                            SELECT %s, user_id, %s, training_id, date_start, %s, %s, %s, %s, %s, %s, %s
+                            FROM trainings WHERE training_id = %s
+                            ON CONFLICT (exercise_id) DO NOTHING
+                        ''', (
+                            exercise_id, name, summary['best_1rm'], summary['best_weight'],
+                            summary['best_reps'], summary['max_weight'], summary['volume'],
+                            summary['sets_count'], summary['reps_total'], training_id,
+                        ))
+                        # Точка, уже вставленная параллельным сохранением, не считается
+                        added += max(cur.rowcount, 0)
+                last_id = rows[-1][0]
+                conn.commit()
+                logger.info("Прогресс: обработано до exercise_id=%s, добавлено точек %s", last_id, added)
+            _execute(cur, _REBUILD_RECORDS_SQL)
+        conn.commit()
         conn.close()
-        
-        exercises = []
-        for row in results:
-            exercise = {
-                'exercise_id': row[0],
-                'name': row[1],
-                'type': row[2]
-            }
-            
-            if row[2] == STRENGTH_TYPE:
-                exercise['sets'] = row[3] or []
-                exercise['is_cardio'] = False
-            else:  # CARDIO
-                exercise.update({
-                    'time_minutes': row[4],
-                    'distance_meters': row[5],
-                    'speed_kmh': row[6],
-                    'details': row[7] or '',
-                    'is_cardio': True
-                })
-            
-            exercises.append(exercise)
-        
-        return exercises
+        return added
     except Exception as e:
-        logger.error(f"❌ Ошибка получения упражнений {training_id}: {e}")
+        logger.error(f"❌ Ошибка заполнения прогресса упражнений: {e}")
+        return added
+
+
+@track_db
+@replica_read
+@retry_read
+def get_progress_exercises(user_id):
+    """Силовые упражнения, по которым есть прогресс (недавние первыми)."""
+    conn = get_db_connection()
+    if not conn:
+        return []
+    try:
+        with conn.cursor() as cur:
+            _execute(cur,
+                "SELECT exercise FROM exercise_records WHERE user_id = %s ORDER BY last_at DESC",
+                (user_id,),
+            )
+            rows = cur.fetchall()
+        conn.close()
+        return [row[0] for row in rows]
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения списка прогресса {user_id}: {e}")
+        return []
+
+
+@track_db
+@replica_read
+@retry_read
+def get_exercise_progress(user_id, exercise, points=10):
+    """Рекорды упражнения и последние points тренировок (в хронологическом порядке); None — данных нет."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                SELECT best_1rm, best_1rm_at, best_weight, best_reps, max_weight, max_weight_at,
+                       best_volume, best_volume_at, total_volume, sessions, first_at, last_at
+                FROM exercise_records
+                WHERE user_id = %s AND exercise = %s
+            ''', (user_id, exercise))
+            record = cur.fetchone()
+            series = []
+            if record:
+                # Несколько выполнений за тренировку — одна точка
+                _execute(cur, '''
+                    SELECT recorded_at, MAX(best_1rm), SUM(volume)
+                    FROM exercise_progress
+                    WHERE user_id = %s AND exercise = %s
+                    GROUP BY recorded_at, training_id
+                    ORDER BY recorded_at DESC
+                    LIMIT %s
+                ''', (user_id, exercise, points))
+                series = cur.fetchall()
+        conn.close()
+        if not record:
+            return None
+        day = "%d.%m.%Y"
+        return {
+            'record': {
+                'best_1rm': record[0],
+                'best_1rm_at': record[1].strftime(day),
+                'best_weight': record[2],
+                'best_reps': record[3],
+                'max_weight': record[4],
+                'max_weight_at': record[5].strftime(day),
+                'best_volume': record[6],
+                'best_volume_at': record[7].strftime(day),
+                'total_volume': record[8],
+                'sessions': record[9],
+                'first_at': record[10].strftime(day),
+                'last_at': record[11].strftime(day),
+            },
+            'series': [
+                {'date': date.strftime("%d.%m.%y"), 'best_1rm': best_1rm, 'volume': volume}
+                for date, best_1rm, volume in reversed(series)
+            ],
+        }
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения прогресса {user_id} / {exercise}: {e}")
+        return None
+
+@track_db
+@retry_read
+def get_training_exercises(training_id, training_start=None):
+    """Получить все упражнения для тренировки (training_start — её начало, чтобы читать одну секцию)"""
+    conn = get_db_connection()
+    if not conn:
         return []
+    
+    try:
+        with conn.cursor() as cur:
+            params = [training_id]
+            pruning = ""
+            if training_start is not None and trainings_partitioned():
+                pruning = "AND training_start = %s"
+                params.append(training_start)
+            _execute(cur, f'''
+                SELECT exercise_id, name, type, sets, time_minutes, 
+                       distance_meters, speed_kmh, details
+                FROM training_exercises 
+                WHERE training_id = %s {pruning}
+                ORDER BY exercise_id
+            ''', params, prepared=True)
+            results = cur.fetchall()
+        
+        conn.close()
+        
+        return [_exercise_dict(row) for row in results]
+    except Exception as e:
+        logger.error(f"❌ Ошибка получения упражнений {training_id}: {e}")
+        return []
+
+def _exercise_dict(row):
+    """Упражнение из строки (exercise_id, name, type, sets, time_minutes, distance_meters, speed_kmh, details)"""
+    exercise = {
+        'exercise_id': row[0],
+        'name': row[1],
+        'type': row[2]
+    }
+    
+    if row[2] == STRENGTH_TYPE:
+        exercise['sets'] = row[3] or []
+        exercise['is_cardio'] = False
+    else:  # CARDIO
+        exercise.update({
+            'time_minutes': row[4],
+            'distance_meters': row[5],
+            'speed_kmh': row[6],
+            'details': row[7] or '',
+            'is_cardio': True
+        })
+    
+    return exercise
 
+@track_db
 def finish_training(training_id, comment=""):
     """Завершить тренировку"""
     conn = get_db_connection()
@@ -400,11 +1502,11 @@ def finish_training(training_id, comment=""):
     
     try:
         with conn.cursor() as cur:
-            cur.execute('''
+            _execute(cur, '''
                 UPDATE trainings 
                 SET date_end = CURRENT_TIMESTAMP, comment = %s
                 WHERE training_id = %s
-            ''', (comment, training_id))
+            ''', (comment, training_id), prepared=True)
         
         conn.commit()
         conn.close()
@@ -413,15 +1515,18 @@ def finish_training(training_id, comment=""):
         logger.error(f"❌ Ошибка завершения тренировки {training_id}: {e}")
         return False
 
+@track_db
+@replica_read
+@retry_read
 def get_user_trainings(user_id, limit=10):
-    """Получить историю тренировок пользователя"""
+    """Получить историю тренировок пользователя (новые первыми; старые дочитываются из архива)"""
     conn = get_db_connection()
     if not conn:
         return []
     
     try:
         with conn.cursor() as cur:
-            cur.execute('''
+            _execute(cur, '''
                 SELECT training_id, date_start, date_end, comment, measurements
                 FROM trainings 
                 WHERE user_id = %s AND date_end IS NOT NULL
@@ -429,27 +1534,100 @@ def get_user_trainings(user_id, limit=10):
                 LIMIT %s
             ''', (user_id, limit))
             results = cur.fetchall()
+            archive = []
+            if len(results) < limit:
+                # Сначала только размеры блоков: распаковываются лишь те, что покрывают недостающие
+                _execute(cur, '''
+                    SELECT period_start, trainings FROM training_archive
+                    WHERE user_id = %s
+                    ORDER BY period_start DESC
+                ''', (user_id,))
+                periods, needed = [], limit - len(results)
+                for period_start, count in cur.fetchall():
+                    if needed <= 0:
+                        break
+                    periods.append(period_start)
+                    needed -= count
+                if periods:
+                    _execute(cur, '''
+                        SELECT data FROM training_archive
+                        WHERE user_id = %s AND period_start = ANY(%s::DATE[])
+                        ORDER BY period_start DESC
+                    ''', (user_id, periods))
+                    archive = cur.fetchall()
         
         conn.close()
         
         trainings = []
         for row in results:
-            training = {
-                'training_id': row[0],
-                'date_start': row[1].strftime("%d.%m.%Y %H:%M"),
-                'date_end': row[2].strftime("%d.%m.%Y %H:%M") if row[2] else None,
-                'comment': row[3] or '',
-                'measurements': row[4] or '',
-                'exercises': get_training_exercises(row[0])
-            }
-            trainings.append(training)
+            trainings.append(_training_dict(row, get_training_exercises(row[0], row[1])))
+        # Блоки архива — от новых месяцев к старым, распаковываются по мере надобности
+        for (data,) in archive:
+            for row in reversed(history_archive.unpack(data)):
+                if len(trainings) >= limit:
+                    return trainings
+                trainings.append(_training_dict(row, [_exercise_dict(exercise) for exercise in row[5]]))
         
         return trainings
     except Exception as e:
         logger.error(f"❌ Ошибка получения истории тренировок {user_id}: {e}")
         return []
 
+@track_db
+@replica_read
+@retry_read
+def get_user_exercise_rows(user_id, since=None):
+    """История завершённых тренировок (вся или начиная с since, вместе с архивом) плоскими строками
+    для analytics.py: (training_id, date_start, name, type, sets). Тренировка без упражнений — строка с name = None."""
+    conn = get_db_connection()
+    if not conn:
+        return []
+    try:
+        with conn.cursor() as cur:
+            join = _exercise_join()
+            params = []
+            period = ""
+            if since is not None:
+                # Условие на ключ каждой таблицы — секции до since не читаются вовсе
+                if trainings_partitioned():
+                    join += " AND te.training_start >= %s"
+                    params.append(since)
+                period = "AND t.date_start >= %s"
+            params.append(user_id)
+            if since is not None:
+                params.append(since)
+            _execute(cur, f'''
+                SELECT t.training_id, t.date_start, te.name, te.type, te.sets
+                FROM trainings t
+                LEFT JOIN training_exercises te ON {join}
+                WHERE t.user_id = %s AND t.date_end IS NOT NULL {period}
+                ORDER BY t.date_start, te.exercise_id
+            ''', params)
+            rows = cur.fetchall()
+            archived = _archived_exercise_rows(cur, user_id, since)
+        conn.close()
+        if archived:
+            # Архив обычно целиком старше горячих строк, но порядок гарантирует только сортировка
+            rows = sorted(archived + list(rows), key=lambda row: row[1])
+        return rows
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения истории упражнений {user_id}: {e}")
+        return []
+
+def _training_dict(row, exercises):
+    """Тренировка в формате истории из строки (training_id, date_start, date_end, comment, measurements)"""
+    return {
+        'training_id': row[0],
+        'date_start': row[1].strftime("%d.%m.%Y %H:%M"),
+        'date_end': row[2].strftime("%d.%m.%Y %H:%M") if row[2] else None,
+        'comment': row[3] or '',
+        'measurements': row[4] or '',
+        'exercises': exercises
+    }
+
 # Функции для работы с пользовательскими упражнениями
+@track_db
+@retry_read
 def get_custom_exercises(user_id):
     """Получить пользовательские упражнения"""
     conn = get_db_connection()
@@ -458,10 +1636,10 @@ def get_custom_exercises(user_id):
     
     try:
         with conn.cursor() as cur:
-            cur.execute('''
+            _execute(cur, '''
                 SELECT name, type FROM custom_exercises 
                 WHERE user_id = %s
-            ''', (user_id,))
+            ''', (user_id,), prepared=True)
             results = cur.fetchall()
         
         conn.close()
@@ -475,6 +1653,7 @@ def get_custom_exercises(user_id):
         logger.error(f"❌ Ошибка получения упражнений {user_id}: {e}")
         return {'strength': [], 'cardio': []}
 
+@track_db
 def add_custom_exercise(user_id, name, type_):
     """Добавить пользовательское упражнение"""
     conn = get_db_connection()
@@ -483,7 +1662,7 @@ def add_custom_exercise(user_id, name, type_):
     
     try:
         with conn.cursor() as cur:
-            cur.execute('''
+            _execute(cur, '''
                 INSERT INTO custom_exercises (user_id, name, type)
                 VALUES (%s, %s, %s)
                 ON CONFLICT (user_id, name, type) DO NOTHING
@@ -491,11 +1670,13 @@ def add_custom_exercise(user_id, name, type_):
         
         conn.commit()
         conn.close()
+        _bump_catalog_version(user_id)
         return True
     except Exception as e:
         logger.error(f"❌ Ошибка добавления упражнения {user_id}: {e}")
         return False
 
+@track_db
 def delete_custom_exercise(user_id, name, type_):
     """Удалить пользовательское упражнение"""
     conn = get_db_connection()
@@ -504,31 +1685,45 @@ def delete_custom_exercise(user_id, name, type_):
     
     try:
         with conn.cursor() as cur:
-            cur.execute('''
+            _execute(cur, '''
                 DELETE FROM custom_exercises 
                 WHERE user_id = %s AND name = %s AND type = %s
             ''', (user_id, name, type_))
         
         conn.commit()
         conn.close()
+        _bump_catalog_version(user_id)
         return True
     except Exception as e:
         logger.error(f"❌ Ошибка удаления упражнения {user_id}: {e}")
         return False
 
 # Функции для работы с замерами
-def save_measurement(user_id, measurements):
-    """Сохранить замеры пользователя"""
+@track_db
+@retry_keyed_write
+def save_measurement(user_id, measurements, idempotency_key=None):
+    """Сохранить замеры пользователя (повтор с тем же idempotency_key ничего не добавляет).
+
+    Распознанные показатели (вес, талия, ...) в той же транзакции пишутся в measurement_values.
+    """
+    values = parse_measurements(measurements)
     conn = get_db_connection()
     if not conn:
         return False
     
     try:
         with conn.cursor() as cur:
-            cur.execute('''
-                INSERT INTO user_measurements (user_id, measurement_date, measurements)
-                VALUES (%s, CURRENT_TIMESTAMP, %s)
-            ''', (user_id, measurements))
+            _execute(cur, '''
+                INSERT INTO user_measurements (user_id, measurement_date, measurements, idempotency_key)
+                VALUES (%s, CURRENT_TIMESTAMP, %s, %s)
+                ON CONFLICT (idempotency_key) DO NOTHING
+                RETURNING measurement_date
+            ''', (user_id, measurements, idempotency_key), prepared=True)
+            row = cur.fetchone()
+            if row:
+                _insert_measurement_values(cur, user_id, row[0], values)
+            else:
+                _check_key_owner(cur, "user_measurements", "user_id", idempotency_key, user_id)
         
         conn.commit()
         conn.close()
@@ -537,6 +1732,9 @@ def save_measurement(user_id, measurements):
         logger.error(f"❌ Ошибка сохранения замеров {user_id}: {e}")
         return False
 
+@track_db
+@replica_read
+@retry_read
 def get_measurements_history(user_id, limit=10):
     """Получить историю замеров"""
     conn = get_db_connection()
@@ -545,7 +1743,7 @@ def get_measurements_history(user_id, limit=10):
     
     try:
         with conn.cursor() as cur:
-            cur.execute('''
+            _execute(cur, '''
                 SELECT measurement_date, measurements
                 FROM user_measurements 
                 WHERE user_id = %s
@@ -568,3 +1766,1014 @@ def get_measurements_history(user_id, limit=10):
         logger.error(f"❌ Ошибка получения замеров {user_id}: {e}")
         return []
 
+def _insert_measurement_values(cur, user_id, measured_at, values):
+    for metric, (value, raw) in values.items():
+        _execute(cur, '''
+            INSERT INTO measurement_values (user_id, metric, measured_at, value, raw)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, metric, measured_at) DO NOTHING
+        ''', (user_id, metric, measured_at, value, raw), prepared=True)
+
+@track_db
+def backfill_measurement_values(batch_size=1000):
+    """Разобрать уже сохранённые замеры в measurement_values (идемпотентно). Возвращает число замеров."""
+    conn = get_db_connection()
+    if not conn:
+        return 0
+    processed = 0
+    last = (-1, datetime.min)
+    try:
+        with conn.cursor() as cur:
+            while True:
+                _execute(cur, '''
+                    SELECT user_id, measurement_date, measurements
+                    FROM user_measurements
+                    WHERE (user_id, measurement_date) > (%s, %s)
+                    ORDER BY user_id, measurement_date
+                    LIMIT %s
+                ''', (last[0], last[1], batch_size))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                for user_id, measured_at, text in rows:
+                    _insert_measurement_values(cur, user_id, measured_at, parse_measurements(text))
+                processed += len(rows)
+                last = rows[-1][:2]
+                conn.commit()
+                logger.info("Замеры: обработано %s (до user_id=%s)", processed, last[0])
+        conn.close()
+        return processed
+    except Exception as e:
+        logger.error(f"❌ Ошибка разбора сохранённых замеров: {e}")
+        return processed
+
+@track_db
+@replica_read
+@retry_read
+def get_measurement_buckets(user_id, unit="week", since=None, metric=None):
+    """Замеры, агрегированные на сервере по дням или неделям (unit: 'day' / 'week').
+
+    [{'metric', 'bucket' (начало периода), 'avg', 'min', 'max', 'last', 'count'}] — по показателю
+    и времени. Сколько бы замеров ни было, строк не больше одной на показатель и период.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return []
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                SELECT metric, date_trunc(%s, measured_at) AS bucket,
+                       AVG(value), MIN(value), MAX(value),
+                       (ARRAY_AGG(value ORDER BY measured_at DESC))[1],
+                       COUNT(*)
+                FROM measurement_values
+                WHERE user_id = %s AND measured_at >= %s AND (%s::TEXT IS NULL OR metric = %s)
+                GROUP BY 1, 2
+                ORDER BY 1, 2
+            ''', (unit, user_id, since or datetime.min, metric, metric))
+            rows = cur.fetchall()
+        conn.close()
+        return [
+            {
+                'metric': row[0],
+                'bucket': row[1],
+                'avg': float(row[2]),
+                'min': float(row[3]),
+                'max': float(row[4]),
+                'last': float(row[5]),
+                'count': row[6],
+            }
+            for row in rows
+        ]
+    except Exception as e:
+        logger.error(f"❌ Ошибка агрегации замеров {user_id}: {e}")
+        return []
+
+# ==================== ГРАФИКИ ====================
+
+# Графики, чьё окно заканчивается сегодняшним днём (charts._trainings_per_week — последние 26 недель)
+WINDOWED_CHARTS = {"trainings_per_week"}
+
+@track_db
+@retry_read
+def get_chart_cache(user_id, chart):
+    """Текущая версия данных пользователя и сохранённый график: (data_version, cached_version, file_id).
+
+    Версия — число завершённых тренировок, последний id упражнения и время последнего замера:
+    любое новое упражнение, завершение тренировки, замер или очистка истории её меняют.
+    У графиков с окном до текущей даты (WINDOWED_CHARTS) в версию входит и начало текущей
+    недели — с новой неделей график рисуется заново, даже если данные не менялись.
+    None — БД недоступна.
+    """
+    today = datetime.now().date()
+    # Неделя считается так же, как в charts.py (локальная дата процесса, а не часовой пояс БД)
+    window = (today - timedelta(days=today.weekday())).isoformat() if chart in WINDOWED_CHARTS else None
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, f'''
+                SELECT
+                    CONCAT_WS(':',
+                        (SELECT COUNT(*) FROM trainings
+                         WHERE user_id = %s AND date_end IS NOT NULL),
+                        (SELECT COALESCE(MAX(te.exercise_id), 0)
+                         FROM training_exercises te JOIN trainings t ON {_exercise_join()}
+                         WHERE t.user_id = %s),
+                        (SELECT COALESCE(EXTRACT(EPOCH FROM MAX(measurement_date))::BIGINT, 0)
+                         FROM user_measurements WHERE user_id = %s),
+                        %s::TEXT
+                    ),
+                    c.data_version,
+                    c.file_id
+                FROM (SELECT 1) AS one
+                LEFT JOIN chart_cache c ON c.user_id = %s AND c.chart = %s
+            ''', (user_id, user_id, user_id, window, user_id, chart))
+            row = cur.fetchone()
+        conn.close()
+        return row
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения кэша графиков {user_id}: {e}")
+        return None
+
+@track_db
+def save_chart_file_id(user_id, chart, data_version, file_id):
+    """Запомнить file_id отправленного графика для этой версии данных"""
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                INSERT INTO chart_cache (user_id, chart, data_version, file_id)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (user_id, chart) DO UPDATE
+                SET data_version = EXCLUDED.data_version,
+                    file_id = EXCLUDED.file_id,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', (user_id, chart, data_version, file_id))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка сохранения кэша графиков {user_id}: {e}")
+        return False
+
+
+# ==================== ФОНОВЫЕ ЗАДАЧИ ====================
+
+@track_db
+def claim_scheduled_job(name, period_key, owner, stale_after):
+    """Захватить запуск задачи за период (атомарно, среди всех воркеров).
+
+    Возвращает (cursor, processed) — с чего продолжить, или None: задача за этот период уже
+    выполнена, выполняется другим процессом (его heartbeat свежее stale_after секунд) или БД недоступна.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                INSERT INTO scheduled_jobs (name, period_key, status, owner, started_at, heartbeat_at)
+                VALUES (%s, %s, 'running', %s, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                ON CONFLICT (name) DO UPDATE SET
+                    cursor = CASE WHEN scheduled_jobs.period_key = EXCLUDED.period_key
+                                  THEN scheduled_jobs.cursor ELSE '' END,
+                    processed = CASE WHEN scheduled_jobs.period_key = EXCLUDED.period_key
+                                     THEN scheduled_jobs.processed ELSE 0 END,
+                    started_at = CASE WHEN scheduled_jobs.period_key = EXCLUDED.period_key
+                                      THEN scheduled_jobs.started_at ELSE EXCLUDED.started_at END,
+                    period_key = EXCLUDED.period_key,
+                    status = 'running',
+                    owner = EXCLUDED.owner,
+                    heartbeat_at = EXCLUDED.heartbeat_at,
+                    finished_at = NULL,
+                    error = NULL
+                WHERE scheduled_jobs.period_key <> EXCLUDED.period_key
+                   OR (scheduled_jobs.status <> 'done'
+                       AND scheduled_jobs.heartbeat_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second')
+                RETURNING cursor, processed
+            ''', (name, period_key, owner, stale_after))
+            row = cur.fetchone()
+        conn.commit()
+        conn.close()
+        return row
+    except Exception as e:
+        logger.error(f"❌ Ошибка захвата фоновой задачи {name}: {e}")
+        return None
+
+@track_db
+def checkpoint_scheduled_job(name, owner, cursor, processed):
+    """Сохранить прогресс задачи. False — задачу перехватил другой процесс (или БД недоступна)."""
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                UPDATE scheduled_jobs
+                SET cursor = %s, processed = %s, heartbeat_at = CURRENT_TIMESTAMP
+                WHERE name = %s AND owner = %s AND status = 'running'
+                RETURNING 1
+            ''', (cursor, processed, name, owner))
+            owned = cur.fetchone() is not None
+        conn.commit()
+        conn.close()
+        return owned
+    except Exception as e:
+        logger.error(f"❌ Ошибка сохранения прогресса задачи {name}: {e}")
+        return False
+
+@track_db
+def finish_scheduled_job(name, owner, processed, error=None):
+    """Отметить запуск завершённым ('done') или упавшим ('failed' — будет повторён позже)"""
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                UPDATE scheduled_jobs
+                SET status = %s, processed = %s, error = %s,
+                    finished_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+                WHERE name = %s AND owner = %s
+            ''', ('failed' if error else 'done', processed, error, name, owner))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка завершения задачи {name}: {e}")
+        return False
+
+@track_db
+def reap_stale_trainings(stale_hours, batch_size):
+    """Одна пачка брошенных тренировок (открыты дольше stale_hours): с упражнениями или замерами —
+    завершить, пустые — удалить. Один запрос, короткая транзакция; строки, занятые другими, пропускаются.
+
+    Возвращает (завершено, удалено) или None при ошибке.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, f'''
+                WITH stale AS (
+                    SELECT training_id
+                    FROM trainings
+                    WHERE date_end IS NULL
+                      AND date_start < CURRENT_TIMESTAMP - %s * INTERVAL '1 hour'
+                    ORDER BY date_start
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                ),
+                finished AS (
+                    UPDATE trainings t
+                    SET date_end = t.date_start + %s * INTERVAL '1 hour',
+                        comment = COALESCE(NULLIF(t.comment, ''), 'Завершена автоматически')
+                    FROM stale s
+                    WHERE t.training_id = s.training_id
+                      AND (EXISTS (SELECT 1 FROM training_exercises te WHERE {_exercise_join()})
+                           OR NULLIF(t.measurements, '') IS NOT NULL)
+                    RETURNING t.training_id
+                ),
+                deleted AS (
+                    DELETE FROM trainings t
+                    USING stale s
+                    WHERE t.training_id = s.training_id
+                      AND NOT EXISTS (SELECT 1 FROM training_exercises te WHERE {_exercise_join()})
+                      AND NULLIF(t.measurements, '') IS NULL
+                    RETURNING t.training_id
+                )
+                SELECT (SELECT COUNT(*) FROM finished), (SELECT COUNT(*) FROM deleted)
+            ''', (stale_hours, batch_size, stale_hours))
+            finished, deleted = cur.fetchone()
+        conn.commit()
+        conn.close()
+        return finished, deleted
+    except Exception as e:
+        logger.error(f"❌ Ошибка очистки брошенных тренировок: {e}")
+        return None
+
+@track_db
+@retry_read
+def get_digest_user_ids(after_user_id, limit, since, until):
+    """Пользователи с завершёнными тренировками в [since, until), по возрастанию id после after_user_id"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                SELECT DISTINCT user_id
+                FROM trainings
+                WHERE user_id > %s AND date_end IS NOT NULL
+                  AND date_start >= %s AND date_start < %s
+                ORDER BY user_id
+                LIMIT %s
+            ''', (after_user_id, since, until, limit))
+            rows = cur.fetchall()
+        conn.close()
+        return [row[0] for row in rows]
+    except Exception as e:
+        logger.error(f"❌ Ошибка выборки пользователей для итогов недели: {e}")
+        return None
+
+_DIGEST_COLUMNS = (
+    'user_id', 'trainings', 'prev_trainings', 'exercises', 'cardio',
+    'volume', 'records', 'top_exercise', 'sent_at',
+)
+
+@track_db
+def compute_weekly_digests(user_ids, week_start, persist=True):
+    """Посчитать и сохранить итоги недели сразу для пачки пользователей (один запрос на пачку).
+
+    Возвращает {user_id: итоги} или None при ошибке. Пересчёт уже посчитанной недели
+    обновляет цифры, но не сбрасывает отметку об отправке. persist=False — только посчитать,
+    без записи в weekly_digests (экран статистики до запуска задачи планировщика).
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+    values = '''COALESCE(t.trainings, 0), COALESCE(t.prev_trainings, 0),
+                       COALESCE(e.exercises, 0), COALESCE(e.cardio, 0),
+                       COALESCE((SELECT SUM(volume) FROM v WHERE v.user_id = u.user_id), 0),
+                       COALESCE(r.records, 0), top_exercise.exercise'''
+    joins = '''FROM users u
+                LEFT JOIN t ON t.user_id = u.user_id
+                LEFT JOIN e ON e.user_id = u.user_id
+                LEFT JOIN r ON r.user_id = u.user_id
+                LEFT JOIN top_exercise ON top_exercise.user_id = u.user_id'''
+    params = [week_start, week_start, week_start, list(user_ids), CARDIO_TYPE]
+    if persist:
+        result = f'''
+                INSERT INTO weekly_digests AS d
+                    (user_id, week_start, trainings, prev_trainings, exercises, cardio, volume, records, top_exercise)
+                SELECT u.user_id, %s::DATE,
+                       {values}
+                {joins}
+                ON CONFLICT (user_id, week_start) DO UPDATE SET
+                    trainings = EXCLUDED.trainings,
+                    prev_trainings = EXCLUDED.prev_trainings,
+                    exercises = EXCLUDED.exercises,
+                    cardio = EXCLUDED.cardio,
+                    volume = EXCLUDED.volume,
+                    records = EXCLUDED.records,
+                    top_exercise = EXCLUDED.top_exercise,
+                    computed_at = CURRENT_TIMESTAMP
+                RETURNING d.user_id, d.trainings, d.prev_trainings, d.exercises, d.cardio,
+                          d.volume, d.records, d.top_exercise, d.sent_at
+        '''
+        params.append(week_start)
+    else:
+        result = f'''
+                SELECT u.user_id,
+                       {values},
+                       NULL::TIMESTAMP
+                {joins}
+        '''
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, f'''
+                WITH bounds AS (
+                    SELECT %s::TIMESTAMP AS week_start,
+                           %s::TIMESTAMP + INTERVAL '7 days' AS week_end,
+                           %s::TIMESTAMP - INTERVAL '7 days' AS prev_start
+                ),
+                users AS (SELECT UNNEST(%s::BIGINT[]) AS user_id),
+                t AS (
+                    SELECT t.user_id,
+                           COUNT(*) FILTER (WHERE t.date_start >= b.week_start) AS trainings,
+                           COUNT(*) FILTER (WHERE t.date_start < b.week_start) AS prev_trainings
+                    FROM trainings t CROSS JOIN bounds b
+                    WHERE t.user_id IN (SELECT user_id FROM users) AND t.date_end IS NOT NULL
+                      AND t.date_start >= b.prev_start AND t.date_start < b.week_end
+                    GROUP BY t.user_id
+                ),
+                e AS (
+                    SELECT t.user_id, COUNT(*) AS exercises,
+                           COUNT(*) FILTER (WHERE te.type = %s) AS cardio
+                    FROM trainings t
+                    JOIN training_exercises te ON {_exercise_join()}
+                    CROSS JOIN bounds b
+                    WHERE t.user_id IN (SELECT user_id FROM users) AND t.date_end IS NOT NULL
+                      AND t.date_start >= b.week_start AND t.date_start < b.week_end
+                    GROUP BY t.user_id
+                ),
+                v AS (
+                    -- Объём только завершённых тренировок, как и в t и e
+                    SELECT p.user_id, p.exercise, SUM(p.volume) AS volume
+                    FROM exercise_progress p
+                    JOIN trainings t ON t.training_id = p.training_id AND t.date_end IS NOT NULL
+                    CROSS JOIN bounds b
+                    WHERE p.user_id IN (SELECT user_id FROM users)
+                      AND p.recorded_at >= b.week_start AND p.recorded_at < b.week_end
+                    GROUP BY p.user_id, p.exercise
+                ),
+                top_exercise AS (
+                    SELECT DISTINCT ON (user_id) user_id, exercise
+                    FROM v ORDER BY user_id, volume DESC
+                ),
+                r AS (
+                    SELECT r.user_id, COUNT(*) AS records
+                    FROM exercise_records r CROSS JOIN bounds b
+                    WHERE r.user_id IN (SELECT user_id FROM users)
+                      AND r.best_1rm_at >= b.week_start AND r.best_1rm_at < b.week_end
+                      AND r.first_at < r.best_1rm_at
+                    GROUP BY r.user_id
+                )
+                {result}
+            ''', params)
+            rows = cur.fetchall()
+        if persist:
+            conn.commit()
+        conn.close()
+        return {row[0]: dict(zip(_DIGEST_COLUMNS, row)) for row in rows}
+    except Exception as e:
+        logger.error(f"❌ Ошибка расчёта итогов недели: {e}")
+        return None
+
+@track_db
+@retry_read
+def get_weekly_digest(user_id, week_start):
+    """Готовые итоги недели пользователя или None (ещё не посчитаны / БД недоступна)"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, f'''
+                SELECT {', '.join(_DIGEST_COLUMNS)}
+                FROM weekly_digests
+                WHERE user_id = %s AND week_start = %s
+            ''', (user_id, week_start))
+            row = cur.fetchone()
+        conn.close()
+        return dict(zip(_DIGEST_COLUMNS, row)) if row else None
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения итогов недели {user_id}: {e}")
+        return None
+
+@track_db
+def mark_digests_sent(user_ids, week_start):
+    """Отметить итоги недели отправленными (при продолжении прерванной рассылки они пропускаются)"""
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                UPDATE weekly_digests SET sent_at = CURRENT_TIMESTAMP
+                WHERE week_start = %s AND user_id = ANY(%s::BIGINT[])
+            ''', (week_start, list(user_ids)))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка отметки отправки итогов недели: {e}")
+        return False
+
+
+# ==================== СЕКЦИОНИРОВАНИЕ (partitioning.py) ====================
+
+# Таблицы истории: (столбец id, ключ секционирования — начало тренировки)
+PARTITIONED_TABLES = {
+    "trainings": ("training_id", "date_start"),
+    "training_exercises": ("exercise_id", "training_start"),
+}
+
+# Начало тренировки для новой строки training_exercises (параметр — training_id)
+_TRAINING_START = "SELECT date_start FROM trainings WHERE training_id = %s"
+
+# Секционированы ли таблицы истории; None — ещё не проверяли
+_partitioned = None
+
+
+def _detect_partitioning(cur):
+    global _partitioned
+    _execute(cur, '''
+        SELECT COUNT(*) FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = ANY(%s::TEXT[]) AND pg_table_is_visible(c.oid)
+    ''', (list(PARTITIONED_TABLES),))
+    _partitioned = cur.fetchone()[0] == len(PARTITIONED_TABLES)
+    return _partitioned
+
+
+def _forget_partitioning():
+    """Запись истории не удалась: возможно, таблицы секционировали (или вернули) на ходу —
+    следующий вызов проверит заново."""
+    global _partitioned
+    _partitioned = None
+
+
+def trainings_partitioned() -> bool:
+    """Секционированы ли trainings и training_exercises (проверяется один раз на процесс и заново
+    после ошибки записи истории)"""
+    if _partitioned is not None:
+        return _partitioned
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cur:
+            partitioned = _detect_partitioning(cur)
+        conn.close()
+        return partitioned
+    except Exception as e:
+        logger.error(f"❌ Ошибка проверки секционирования: {e}")
+        return False
+
+
+def _exercise_join():
+    """Условие соединения упражнений te с тренировкой t. У секционированных таблиц — ещё и по ключу
+    секций: упражнения тренировки ищутся только в секции её периода."""
+    if trainings_partitioned():
+        return "te.training_id = t.training_id AND te.training_start = t.date_start"
+    return "te.training_id = t.training_id"
+
+
+def _exercise_conflict():
+    # Уникальный индекс секционированной таблицы обязан включать ключ секционирования
+    return "(idempotency_key, training_start)" if trainings_partitioned() else "(idempotency_key)"
+
+
+@track_db
+@retry_read
+def get_partitions(table):
+    """Секции таблицы: [(имя, оценка числа строк)] по имени; [] — таблица не секционирована, None — ошибка"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                SELECT c.relname, GREATEST(c.reltuples, 0)::BIGINT
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = to_regclass(%s)
+                ORDER BY c.relname
+            ''', (table,))
+            rows = cur.fetchall()
+        conn.close()
+        return [tuple(row) for row in rows]
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения секций {table}: {e}")
+        return None
+
+
+def _create_partitions(cur, parent, table, ranges):
+    for suffix, lower, upper in ranges:
+        # Границы — даты, посчитанные в partitioning.py; DDL не принимает параметры запроса
+        _execute(cur, f'''
+            CREATE TABLE IF NOT EXISTS {table}_{suffix} PARTITION OF {parent}
+            FOR VALUES FROM ('{lower:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')
+        ''')
+
+
+@track_db
+def create_partitions(table, ranges):
+    """Создать секции table: ranges — [(суффикс имени, начало, конец)], каждая в своей транзакции.
+    Возвращает число созданных или None при ошибке."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    created = 0
+    try:
+        with conn.cursor() as cur:
+            for partition in ranges:
+                # Создание секции ненадолго блокирует таблицу — не ждать дольше lock_timeout
+                _execute(cur, "SET LOCAL lock_timeout = '5s'")
+                _create_partitions(cur, table, table, [partition])
+                conn.commit()
+                created += 1
+        conn.close()
+        return created
+    except Exception as e:
+        logger.error(f"❌ Ошибка создания секций {table}: {e}")
+        return None
+
+
+@track_db
+@retry_read
+def get_training_start_range():
+    """(первая, последняя) date_start в trainings; (None, None) — тренировок нет, None — ошибка"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, "SELECT MIN(date_start), MAX(date_start) FROM trainings")
+            row = cur.fetchone()
+        conn.close()
+        return tuple(row)
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения диапазона тренировок: {e}")
+        return None
+
+
+@track_db
+def create_partitioned_tables(ranges):
+    """Пустые секционированные копии таблиц истории ({table}_partitioned) с секциями ranges
+    [(суффикс, начало, конец)], секцией по умолчанию и индексами. Уже созданные не трогаются.
+    Индексы получают суффикс _new и переименовываются при подмене таблиц."""
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cur:
+            for table, (id_column, key) in PARTITIONED_TABLES.items():
+                new = f"{table}_partitioned"
+                _execute(cur, "SELECT to_regclass(%s) IS NOT NULL", (new,))
+                if cur.fetchone()[0]:
+                    continue
+                _execute(cur, "SELECT pg_get_serial_sequence(%s, %s)", (table, id_column))
+                if cur.fetchone()[0] is None:
+                    raise RuntimeError(f"{table}.{id_column} не SERIAL: перенос последовательности не поддерживается")
+                # Умолчания (nextval той же последовательности) и NOT NULL переходят из исходной таблицы
+                _execute(cur, f'''
+                    CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS)
+                    PARTITION BY RANGE ({key})
+                ''')
+                _execute(cur, f"ALTER TABLE {new} ALTER COLUMN {key} SET NOT NULL")
+                _execute(cur, f"ALTER TABLE {new} ADD CONSTRAINT {table}_pkey_new PRIMARY KEY ({id_column}, {key})")
+                _execute(cur, f'''
+                    CREATE UNIQUE INDEX {table}_idempotency_key_new ON {new} (idempotency_key, {key})
+                ''')
+                _create_partitions(cur, new, table, ranges)
+                _execute(cur, f"CREATE TABLE {table}_default PARTITION OF {new} DEFAULT")
+            _execute(cur, '''
+                CREATE INDEX trainings_user_start_new ON trainings_partitioned (user_id, date_start DESC)
+            ''')
+            _execute(cur, '''
+                CREATE INDEX trainings_open_new
+                ON trainings_partitioned (user_id, date_start DESC) WHERE date_end IS NULL
+            ''')
+            _execute(cur, '''
+                CREATE INDEX training_exercises_training_new
+                ON training_exercises_partitioned (training_id, training_start)
+            ''')
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка создания секционированных таблиц: {e}")
+        return False
+
+
+def _copy_to_partitioned(cur, table, after, limit=None):
+    """Перенести строки с id > after (не больше limit) в {table}_partitioned: (перенесено, последний id)."""
+    id_column, key = PARTITIONED_TABLES[table]
+    _execute(cur, '''
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = %s AND table_schema = current_schema()
+        ORDER BY ordinal_position
+    ''', (table,))
+    columns = [row[0] for row in cur.fetchall()]
+    values = [f"x.{column}" for column in columns]
+    join = ""
+    if table == "training_exercises":
+        # Начало тренировки берётся из trainings; упражнения без тренировки попадают в секцию по умолчанию
+        values[columns.index(key)] = f"COALESCE(t.date_start, x.{key}, TIMESTAMP 'epoch')"
+        join = "LEFT JOIN trainings t ON t.training_id = x.training_id"
+    _execute(cur, f'''
+        SELECT MAX({id_column}) FROM (
+            SELECT {id_column} FROM {table} WHERE {id_column} > %s ORDER BY {id_column} LIMIT %s
+        ) batch
+    ''', (after, limit))
+    last = cur.fetchone()[0]
+    if last is None:
+        return 0, after
+    _execute(cur, f'''
+        INSERT INTO {table}_partitioned ({", ".join(columns)})
+        SELECT {", ".join(values)}
+        FROM {table} x {join}
+        WHERE x.{id_column} > %s AND x.{id_column} <= %s
+    ''', (after, last))
+    return cur.rowcount, last
+
+
+@track_db
+def copy_to_partitioned(table, batch_size=5000):
+    """Перенести строки table в {table}_partitioned пачками по id, каждая в своей транзакции.
+    Продолжает с последнего перенесённого id. Возвращает число строк или None при ошибке."""
+    id_column, _ = PARTITIONED_TABLES[table]
+    conn = get_db_connection()
+    if not conn:
+        return None
+    copied = 0
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, f"SELECT COALESCE(MAX({id_column}), 0) FROM {table}_partitioned")
+            last = cur.fetchone()[0]
+            while True:
+                rows, last = _copy_to_partitioned(cur, table, last, batch_size)
+                if not rows:
+                    break
+                conn.commit()
+                copied += rows
+                logger.info("%s: перенесено %s строк (до %s=%s)", table, copied, id_column, last)
+        conn.close()
+        return copied
+    except Exception as e:
+        logger.error(f"❌ Ошибка переноса {table} в секции: {e}")
+        return None
+
+
+@track_db
+def swap_partitioned_tables():
+    """Последний шаг миграции, одной транзакцией: перенести строки, добавленные после копирования,
+    переименовать старые таблицы в *_legacy, а секционированные — на их место."""
+    global _partitioned
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, "LOCK TABLE trainings, training_exercises IN ACCESS EXCLUSIVE MODE")
+            for table, (id_column, _) in PARTITIONED_TABLES.items():
+                _execute(cur, f"SELECT COALESCE(MAX({id_column}), 0) FROM {table}_partitioned")
+                _copy_to_partitioned(cur, table, cur.fetchone()[0])
+            for table, (id_column, _) in PARTITIONED_TABLES.items():
+                _execute(cur, "SELECT indexname FROM pg_indexes WHERE tablename = %s", (table,))
+                for (index,) in cur.fetchall():
+                    _execute(cur, f"ALTER INDEX {index} RENAME TO {index}_legacy")
+                _execute(cur, f"ALTER TABLE {table} RENAME TO {table}_legacy")
+                _execute(cur, f"ALTER TABLE {table}_partitioned RENAME TO {table}")
+                _execute(cur, "SELECT indexname FROM pg_indexes WHERE tablename = %s AND indexname LIKE %s",
+                         (table, '%\\_new'))
+                for (index,) in cur.fetchall():
+                    _execute(cur, f"ALTER INDEX {index} RENAME TO {index[:-len('_new')]}")
+                # Последовательность id принадлежит новой таблице — удаление *_legacy её не заденет
+                _execute(cur, "SELECT pg_get_serial_sequence(%s, %s)", (f"{table}_legacy", id_column))
+                _execute(cur, f"ALTER SEQUENCE {cur.fetchone()[0]} OWNED BY {table}.{id_column}")
+        conn.commit()
+        conn.close()
+        _partitioned = True
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка подмены таблиц секционированными: {e}")
+        return False
+
+
+@track_db
+def count_bot_sessions():
+    """Число соединений запущенного бота (application_name BOT_APPLICATION_NAME), None — ошибка"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                SELECT COUNT(*) FROM pg_stat_activity
+                WHERE datname = current_database() AND application_name = %s AND pid <> pg_backend_pid()
+            ''', (BOT_APPLICATION_NAME,))
+            count = cur.fetchone()[0]
+        conn.close()
+        return count
+    except Exception as e:
+        logger.error(f"❌ Ошибка проверки соединений бота: {e}")
+        return None
+
+
+@track_db
+def drop_legacy_tables():
+    """Удалить старые несекционированные таблицы, оставшиеся после миграции"""
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, "DROP TABLE IF EXISTS training_exercises_legacy, trainings_legacy")
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка удаления старых таблиц: {e}")
+        return False
+
+
+# ==================== АРХИВ ИСТОРИИ (history_archive.py) ====================
+
+def _archived_exercise_rows(cur, user_id, since=None):
+    """Строки get_user_exercise_rows из архива пользователя (с since — только нужные блоки)"""
+    sql = "SELECT data FROM training_archive WHERE user_id = %s"
+    params = [user_id]
+    if since is not None:
+        sql += " AND last_at >= %s"
+        params.append(since)
+    _execute(cur, sql + " ORDER BY period_start", params)
+    trainings = [training for (data,) in cur.fetchall() for training in history_archive.unpack(data)]
+    if since is not None:
+        trainings = [training for training in trainings if training[1] >= since]
+    return history_archive.exercise_rows(trainings)
+
+
+@track_db
+@retry_read
+def get_archive_user_ids(before, after_user_id, limit):
+    """Пользователи с завершёнными тренировками, начатыми до before, по возрастанию id после after_user_id.
+    Пользователи, чья история сейчас очищается, пропускаются. None — ошибка."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                SELECT DISTINCT user_id
+                FROM trainings
+                WHERE date_end IS NOT NULL AND date_start < %s AND user_id > %s
+                  AND user_id NOT IN (SELECT user_id FROM deletion_requests WHERE status = 'running')
+                ORDER BY user_id
+                LIMIT %s
+            ''', (before, after_user_id, limit))
+            user_ids = [row[0] for row in cur.fetchall()]
+        conn.close()
+        return user_ids
+    except Exception as e:
+        logger.error(f"❌ Ошибка выборки пользователей для архива: {e}")
+        return None
+
+
+@track_db
+def archive_user_trainings(user_id, before, limit):
+    """Перенести до limit завершённых тренировок пользователя, начатых до before, в training_archive.
+
+    Одна транзакция: тренировки с упражнениями дописываются в блоки своих месяцев (блок
+    распаковывается, дополняется и сжимается заново) и удаляются из горячих таблиц.
+    Возвращает число перенесённых тренировок или None при ошибке.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                SELECT training_id, date_start, date_end, comment, measurements
+                FROM trainings
+                WHERE user_id = %s AND date_end IS NOT NULL AND date_start < %s
+                  AND NOT EXISTS (SELECT 1 FROM deletion_requests WHERE user_id = %s AND status = 'running')
+                ORDER BY date_start
+                LIMIT %s
+                FOR UPDATE
+            ''', (user_id, before, user_id, limit))
+            trainings = [list(row) + [[]] for row in cur.fetchall()]
+            if not trainings:
+                conn.close()
+                return 0
+            by_id = {training[0]: training for training in trainings}
+            training_ids = list(by_id)
+            _execute(cur, '''
+                SELECT training_id, exercise_id, name, type, sets, time_minutes,
+                       distance_meters, speed_kmh, details
+                FROM training_exercises
+                WHERE training_id = ANY(%s::BIGINT[])
+                ORDER BY exercise_id
+            ''', (training_ids,))
+            for training_id, *exercise in cur.fetchall():
+                by_id[training_id][5].append(exercise)
+
+            months = {}
+            for training in trainings:
+                months.setdefault(history_archive.month_of(training[1]), []).append(training)
+            for month, block in months.items():
+                _execute(cur, '''
+                    SELECT data FROM training_archive WHERE user_id = %s AND period_start = %s FOR UPDATE
+                ''', (user_id, month))
+                existing = cur.fetchone()
+                if existing:
+                    block = history_archive.merge(history_archive.unpack(existing[0]), block)
+                _execute(cur, '''
+                    INSERT INTO training_archive (user_id, period_start, trainings, first_at, last_at, data)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (user_id, period_start) DO UPDATE SET
+                        trainings = EXCLUDED.trainings,
+                        first_at = EXCLUDED.first_at,
+                        last_at = EXCLUDED.last_at,
+                        data = EXCLUDED.data,
+                        archived_at = CURRENT_TIMESTAMP
+                ''', (user_id, month, len(block), block[0][1], block[-1][1], history_archive.pack(block)))
+
+            _execute(cur, "DELETE FROM training_exercises WHERE training_id = ANY(%s::BIGINT[])", (training_ids,))
+            # Условие на date_start — чтобы у секционированной таблицы читались только старые секции
+            _execute(cur, '''
+                DELETE FROM trainings WHERE training_id = ANY(%s::BIGINT[]) AND date_start < %s
+            ''', (training_ids, before))
+        conn.commit()
+        conn.close()
+        return len(trainings)
+    except Exception as e:
+        logger.error(f"❌ Ошибка архивации тренировок {user_id}: {e}")
+        return None
+
+
+# ==================== СОСТОЯНИЕ ДИАЛОГОВ (несколько воркеров) ====================
+
+@track_db
+@retry_read
+def load_conversation_states(name, worker_index=0, worker_count=1):
+    """Состояния диалогов пользователей этого воркера: {(chat_id, user_id): state}."""
+    conn = get_db_connection()
+    if not conn:
+        return {}
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                SELECT chat_id, user_id, state
+                FROM bot_conversations
+                WHERE name = %s AND user_id %% %s = %s
+            ''', (name, worker_count, worker_index))
+            rows = cur.fetchall()
+        conn.close()
+        return {(chat_id, user_id): state for chat_id, user_id, state in rows}
+    except Exception as e:
+        logger.error(f"❌ Ошибка загрузки состояний диалога {name}: {e}")
+        return {}
+
+@track_db
+def save_conversation_state(name, chat_id, user_id, state):
+    """Сохранить состояние диалога; state=None — диалог завершён, запись удаляется."""
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cur:
+            if state is None:
+                _execute(cur, '''
+                    DELETE FROM bot_conversations
+                    WHERE name = %s AND chat_id = %s AND user_id = %s
+                ''', (name, chat_id, user_id))
+            else:
+                _execute(cur, '''
+                    INSERT INTO bot_conversations (name, chat_id, user_id, state)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (name, chat_id, user_id)
+                    DO UPDATE SET state = EXCLUDED.state, updated_at = CURRENT_TIMESTAMP
+                ''', (name, chat_id, user_id, state))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка сохранения состояния диалога {user_id}: {e}")
+        return False
+
+@track_db
+@retry_read
+def load_user_data(worker_index=0, worker_count=1):
+    """user_data пользователей этого воркера: {user_id: dict}."""
+    conn = get_db_connection()
+    if not conn:
+        return {}
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                SELECT user_id, data FROM bot_user_data
+                WHERE user_id %% %s = %s
+            ''', (worker_count, worker_index))
+            rows = cur.fetchall()
+        conn.close()
+        return {
+            user_id: data if isinstance(data, dict) else json.loads(data)
+            for user_id, data in rows
+        }
+    except Exception as e:
+        logger.error(f"❌ Ошибка загрузки user_data: {e}")
+        return {}
+
+@track_db
+def save_user_data(user_id, data):
+    """Сохранить user_data пользователя (значения, не сериализуемые в JSON, — строкой)."""
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, '''
+                INSERT INTO bot_user_data (user_id, data)
+                VALUES (%s, %s)
+                ON CONFLICT (user_id)
+                DO UPDATE SET data = EXCLUDED.data, updated_at = CURRENT_TIMESTAMP
+            ''', (user_id, json.dumps(data, ensure_ascii=False, default=str)))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка сохранения user_data {user_id}: {e}")
+        return False
+
+@track_db
+def delete_user_data(user_id):
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cur:
+            _execute(cur, "DELETE FROM bot_user_data WHERE user_id = %s", (user_id,))
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка удаления user_data {user_id}: {e}")
+        return False
@@ -0,0 +1,118 @@
+"""
+Итоги прошлой недели, посчитанные заранее.
+
+Задача планировщика "weekly_digest" в ночь на понедельник (после DIGEST_HOUR) обходит
+пользователей с тренировками за последние DIGEST_ACTIVE_WEEKS недель пачками по
+DIGEST_BATCH_SIZE: каждая пачка считается одним SQL-запросом и сохраняется в
+weekly_digests, после пачки курсор (последний user_id) фиксируется — прерванный запуск
+продолжается с места остановки. Экран «📅 Текущая неделя» читает готовую строку по ключу.
+
+При DIGEST_PUSH=1 итоги ещё и отправляются пользователям — с низким приоритетом
+рассылки (rate_limiter.PRIORITY_BULK) и не более DIGEST_SEND_CONCURRENCY отправок
+одновременно; отправленные отмечаются и при продолжении не дублируются.
+
+Переменные окружения:
+    DIGEST_HOUR             — час (по времени сервера), после которого в понедельник считаются итоги (4)
+    DIGEST_BATCH_SIZE       — пользователей в пачке (200)
+    DIGEST_ACTIVE_WEEKS     — кого считать активным: тренировки за столько недель (4)
+    DIGEST_PUSH             — 1 — отправлять итоги в чат (0)
+    DIGEST_SEND_CONCURRENCY — одновременных отправок (5)
+"""
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+from database import compute_weekly_digests, get_digest_user_ids, get_weekly_digest, mark_digests_sent
+from metrics import inc
+from rate_limiter import PRIORITY_BULK
+
+logger = logging.getLogger(__name__)
+
+DIGEST_HOUR = int(os.getenv('DIGEST_HOUR', '4'))
+BATCH_SIZE = int(os.getenv('DIGEST_BATCH_SIZE', '200'))
+ACTIVE_WEEKS = int(os.getenv('DIGEST_ACTIVE_WEEKS', '4'))
+PUSH = os.getenv('DIGEST_PUSH', '0') == '1'
+SEND_CONCURRENCY = int(os.getenv('DIGEST_SEND_CONCURRENCY', '5'))
+
+
+def last_week_start(day: date) -> date:
+    """Понедельник недели, предшествующей дню day."""
+    return day - timedelta(days=day.weekday() + 7)
+
+
+def period(now):
+    """Ключ периода для планировщика: прошлая неделя, начиная с понедельника DIGEST_HOUR:00."""
+    return last_week_start((now - timedelta(hours=DIGEST_HOUR)).date()).isoformat()
+
+
+def format_digest(digest) -> str:
+    """Текст итогов недели."""
+    if not digest['trainings']:
+        return "🗓 Прошлая неделя прошла без тренировок — самое время вернуться! 💪"
+    text = f"🗓 Прошлая неделя — тренировок: {digest['trainings']}"
+    change = digest['trainings'] - digest['prev_trainings']
+    if change:
+        text += f" ({change:+d} к позапрошлой)"
+    text += f"\n💪 Упражнений: {digest['exercises']}, из них кардио: {digest['cardio']}\n"
+    if digest['volume']:
+        text += f"📦 Объём: {digest['volume']:,.0f}".replace(",", " ") + "кг"
+        if digest['top_exercise']:
+            text += f", больше всего — {digest['top_exercise']}"
+        text += "\n"
+    if digest['records']:
+        text += f"🏆 Новых рекордов: {digest['records']}\n"
+    return text
+
+
+def weekly_digest(user_id, now=None):
+    """Итоги прошлой недели пользователя: из weekly_digests, а если ещё не посчитаны — посчитать
+    сейчас без сохранения (экран статистики только читает; сохраняет задача планировщика)."""
+    week = last_week_start((now or datetime.now()).date())
+    digest = get_weekly_digest(user_id, week)
+    if digest is None:
+        digest = (compute_weekly_digests([user_id], week, persist=False) or {}).get(user_id)
+    return digest
+
+
+async def _push(bot, digests, week):
+    semaphore = asyncio.Semaphore(SEND_CONCURRENCY)
+    sent = []
+
+    async def send(user_id, digest):
+        async with semaphore:
+            try:
+                await bot.send_message(user_id, format_digest(digest), rate_limit_args=PRIORITY_BULK)
+                sent.append(user_id)
+                inc("weekly_digest_sent_total", result="ok")
+            except Exception as e:
+                # Бот заблокирован, чат удалён и т.п. — не повод останавливать рассылку
+                logger.debug("Итоги недели пользователю %s не отправлены: %s", user_id, e)
+                inc("weekly_digest_sent_total", result="error")
+
+    await asyncio.gather(*(
+        send(user_id, digest) for user_id, digest in digests.items() if digest['sent_at'] is None
+    ))
+    if sent:
+        await asyncio.to_thread(mark_digests_sent, sent, week)
+
+
+async def run_weekly_digest(run):
+    """Задача планировщика: итоги недели run.period для всех активных пользователей."""
+    week = date.fromisoformat(run.period)
+    since = week - timedelta(weeks=ACTIVE_WEEKS - 1)
+    until = week + timedelta(weeks=1)
+    after = int(run.cursor or 0)
+    while True:
+        user_ids = await asyncio.to_thread(get_digest_user_ids, after, BATCH_SIZE, since, until)
+        if user_ids is None:
+            raise RuntimeError("БД недоступна при выборке пользователей")
+        if not user_ids:
+            break
+        digests = await asyncio.to_thread(compute_weekly_digests, user_ids, week)
+        if digests is None:
+            raise RuntimeError(f"Не удалось посчитать пачку после user_id={after}")
+        if PUSH:
+            await _push(run.application.bot, digests, week)
+        after = user_ids[-1]
+        await run.checkpoint(str(after), len(user_ids))
@@ -1,11 +1,15 @@
 import logging
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram import Update, ReplyKeyboardRemove
 from telegram.ext import ContextTypes
 
 from database import (
     create_user, get_custom_exercises, get_user_trainings, 
     get_current_training, finish_training, create_training,
-    delete_all_user_data
+)
+import data_deletion
+from keyboards import (
+    MAIN_MENU_KEYBOARD, WELCOME_NEW_USER_KEYBOARD, WELCOME_WITH_TRAINING_KEYBOARD,
+    WELCOME_WITHOUT_TRAINING_KEYBOARD, CONTINUE_KEYBOARD, CLEAR_DATA_CONFIRM_KEYBOARD,
 )
 from utils_constants import *
 
@@ -56,11 +60,9 @@ async def show_welcome_new_user(update: Update, context: ContextTypes.DEFAULT_TY
 Нажми кнопку «🚀 Начать», чтобы начать работу!
     """
     
-    keyboard = [['🚀 Начать']]
-    
     await update.message.reply_text(
         welcome_text,
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
+        reply_markup=WELCOME_NEW_USER_KEYBOARD
     )
     return INACTIVE
 
@@ -89,15 +91,9 @@ async def show_welcome_with_current_training(update: Update, context: ContextTyp
 Выберите действие:
     """
     
-    keyboard = [
-        ['🏃‍♂️ Продолжить тренировку'],
-        ['🆕 Начать новую тренировку'],
-        ['🗑️ Очистить историю']
-    ]
-    
     await update.message.reply_text(
         welcome_text,
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
+        reply_markup=WELCOME_WITH_TRAINING_KEYBOARD
     )
     return INACTIVE
 
@@ -113,14 +109,9 @@ async def show_welcome_without_current_training(update: Update, context: Context
 Выберите действие:
     """
     
-    keyboard = [
-        ['🚀 Продолжить'],
-        ['🗑️ Очистить историю']
-    ]
-    
     await update.message.reply_text(
         welcome_text,
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
+        reply_markup=WELCOME_WITHOUT_TRAINING_KEYBOARD
     )
     return INACTIVE
 
@@ -146,73 +137,45 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 Выберите действие:
     """
     
-    keyboard = [
-        ['💪 Начать тренировку', '📊 История тренировок'],
-        ['📝 Мои упражнения', '📈 Статистика', '📏 Мои замеры'],
-        ['📤 Выгрузка данных', '❓ Помощь']
-    ]
-    
     await update.message.reply_text(
         welcome_text,
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup=MAIN_MENU_KEYBOARD
     )
     return MAIN_MENU
 
-# Тексты кнопок главного меню (если пользователь в INACTIVE, но клавиатура осталась от главного меню)
-_MAIN_MENU_BUTTON_TEXTS = frozenset(
-    {
-        "💪 Начать тренировку",
-        "📊 История тренировок",
-        "📝 Мои упражнения",
-        "📈 Статистика",
-        "📏 Мои замеры",
-        "📤 Выгрузка данных",
-        "❓ Помощь",
-    }
-)
-
-
 async def handle_clear_data_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка выбора в неактивном состоянии"""
-    choice = (update.message.text or "").strip()
+    from routing import dispatch
+
+    return await dispatch(INACTIVE, update, context)
+
+
+async def start_new_training(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Завершить незавершённую тренировку и начать новую"""
     user_id = update.message.from_user.id
-    
-    if choice == '🚀 Начать':
-        return await start(update, context)
-    
-    elif choice == '🚀 Продолжить':
-        return await start(update, context)
-    
-    elif choice == '🏃‍♂️ Продолжить тренировку':
-        from handlers_training import continue_training
-        return await continue_training(update, context)
-    
-    elif choice == '🆕 Начать новую тренировку':
-        # Завершаем текущую тренировку и начинаем новую
-        current_training = get_current_training(user_id)
-        if current_training:
-            finish_training(current_training['training_id'], "Автозавершена")
-        
-        from handlers_training import start_training
-        return await start_training(update, context)
-    
-    elif choice == '🗑️ Очистить историю':
-        return await show_clear_data_confirmation(update, context)
+    current_training = get_current_training(user_id)
+    if current_training:
+        finish_training(current_training['training_id'], "Автозавершена")
 
-    elif choice in _MAIN_MENU_BUTTON_TEXTS:
-        context.user_data["in_conversation"] = True
-        return await handle_main_menu(update, context)
-    
-    else:
-        # Показываем соответствующие кнопки
-        if is_new_user(user_id):
-            return await show_welcome_new_user(update, context)
-        else:
-            current_training = get_current_training(user_id)
-            if current_training:
-                return await show_welcome_with_current_training(update, context, current_training)
-            else:
-                return await show_welcome_without_current_training(update, context)
+    from handlers_training import start_training
+    return await start_training(update, context)
+
+
+async def resume_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Кнопка главного меню, нажатая в неактивном состоянии (клавиатура осталась от меню)"""
+    context.user_data["in_conversation"] = True
+    return await handle_main_menu(update, context)
+
+
+async def show_welcome_for_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Показать приветствие с кнопками, подходящими пользователю"""
+    user_id = update.message.from_user.id
+    if is_new_user(user_id):
+        return await show_welcome_new_user(update, context)
+    current_training = get_current_training(user_id)
+    if current_training:
+        return await show_welcome_with_current_training(update, context, current_training)
+    return await show_welcome_without_current_training(update, context)
 
 async def show_clear_data_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показ подтверждения очистки данных"""
@@ -228,52 +191,49 @@ async def show_clear_data_confirmation(update: Update, context: ContextTypes.DEF
 Подтвердите действие:
     """
     
-    keyboard = [
-        ['✅ Да, удалить все данные'],
-        ['❌ Отмена']
-    ]
-    
     await update.message.reply_text(
         warning_text,
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup=CLEAR_DATA_CONFIRM_KEYBOARD
     )
     return CLEAR_DATA_CONFIRM
 
 async def handle_clear_data_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка подтверждения очистки данных"""
-    choice = update.message.text
+    from routing import dispatch
+
+    return await dispatch(CLEAR_DATA_CONFIRM, update, context)
+
+
+async def confirm_clear_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Удаление всех данных пользователя после подтверждения"""
     user_id = update.message.from_user.id
-    
-    if choice == '❌ Отмена':
-        return await start(update, context)
-    
-    elif choice == '✅ Да, удалить все данные':
-        # Удаляем все данные пользователя
-        success = delete_all_user_data(user_id)
-        
-        if success:
-            await update.message.reply_text(
-                "✅ Все ваши данные успешно удалены!",
-                reply_markup=ReplyKeyboardRemove()
-            )
-            # Показываем приветствие для нового пользователя
-            return await show_welcome_new_user(update, context)
-        else:
-            await update.message.reply_text(
-                "❌ Ошибка при удалении данных. Попробуйте позже.",
-                reply_markup=ReplyKeyboardMarkup([['🚀 Продолжить']], resize_keyboard=True)
-            )
-            return INACTIVE
-    
+    request = await data_deletion.queue_deletion(user_id)
+
+    if request:
+        # Объёмные данные удаляются в фоне порциями; это сообщение обновляется по ходу удаления
+        message = await update.message.reply_text(
+            "✅ Очистка истории запущена — можно продолжать пользоваться ботом.\n"
+            + data_deletion.progress_text(0, request['total_trainings']),
+            reply_markup=ReplyKeyboardRemove()
+        )
+        request['message_id'] = message.message_id
+        context.application.create_task(data_deletion.run_deletion(context.bot, request))
+        # Показываем приветствие для нового пользователя
+        return await show_welcome_new_user(update, context)
     else:
         await update.message.reply_text(
-            "❌ Пожалуйста, используйте кнопки для подтверждения",
-            reply_markup=ReplyKeyboardMarkup([
-                ['✅ Да, удалить все данные'],
-                ['❌ Отмена']
-            ], resize_keyboard=True)
+            "❌ Ошибка при удалении данных. Попробуйте позже.",
+            reply_markup=CONTINUE_KEYBOARD
         )
-        return CLEAR_DATA_CONFIRM
+        return INACTIVE
+
+
+async def clear_data_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text(
+        "❌ Пожалуйста, используйте кнопки для подтверждения",
+        reply_markup=CLEAR_DATA_CONFIRM_KEYBOARD
+    )
+    return CLEAR_DATA_CONFIRM
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Помощь"""
@@ -304,39 +264,17 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 
 async def handle_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка главного меню"""
+    from routing import dispatch
+
+    return await dispatch(MAIN_MENU, update, context)
+
+
+async def main_menu_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     msg = update.effective_message
     if not msg:
         return MAIN_MENU
-    text = (msg.text or "").strip()
-    user_id = msg.from_user.id
-    
-    if text == '💪 Начать тренировку':
-        from handlers_training import start_training
-        return await start_training(update, context)
-    elif text == '📊 История тренировок':
-        from handlers_training import show_training_history
-        return await show_training_history(update, context)
-    elif text == '📝 Мои упражнения':
-        from handlers_exercises import show_exercises_management
-        return await show_exercises_management(update, context)
-    elif text == '📈 Статистика':
-        from handlers_statistics import show_statistics_menu
-        return await show_statistics_menu(update, context)
-    elif text == '📏 Мои замеры':
-        from handlers_measurements import show_measurements_history
-        return await show_measurements_history(update, context)
-    elif text == '📤 Выгрузка данных':
-        from handlers_export import show_export_menu
-        return await show_export_menu(update, context)
-    elif text == '❓ Помощь':
-        return await help_command(update, context)
-    else:
-        await msg.reply_text(
-            "❌ Пожалуйста, используйте кнопки меню",
-            reply_markup=ReplyKeyboardMarkup([
-                ['💪 Начать тренировку', '📊 История тренировок'],
-                ['📝 Мои упражнения', '📈 Статистика', '📏 Мои замеры'],
-                ['📤 Выгрузка данных', '❓ Помощь']
-            ], resize_keyboard=True)
-        )
-        return MAIN_MENU
+    await msg.reply_text(
+        "❌ Пожалуйста, используйте кнопки меню",
+        reply_markup=MAIN_MENU_KEYBOARD
+    )
+    return MAIN_MENU
@@ -1,7 +1,6 @@
 import logging
-from telegram import Update, ReplyKeyboardMarkup
+from telegram import Update, ReplyKeyboardRemove
 from telegram.ext import ContextTypes
-from handlers_common import start
 
 from database import (
     get_custom_exercises,
@@ -9,6 +8,9 @@ from database import (
     get_visible_exercise_lists,
     remove_exercise_from_user_catalog,
 )
+from keyboards import (
+    EXERCISES_MANAGEMENT_KEYBOARD, ADD_EXERCISE_TYPE_MGMT_KEYBOARD, delete_exercise_keyboard,
+)
 from utils_constants import *
 
 logger = logging.getLogger(__name__)
@@ -29,76 +31,54 @@ async def show_exercises_management(update: Update, context: ContextTypes.DEFAUL
     for ex in all_cardio:
         exercises_text += f"• {ex}\n"
     
-    keyboard = [
-        ['➕ Добавить упражнение', '🗑️ Удалить упражнение'],
-        ['🔙 Главное меню']
-    ]
-    
     await update.message.reply_text(
         exercises_text,
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup=EXERCISES_MANAGEMENT_KEYBOARD
     )
     return EXERCISES_MANAGEMENT
 
 async def handle_exercises_management_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка выбора в управлении упражнениями"""
-    text = update.message.text
-    
-    if text == '➕ Добавить упражнение':
-        return await choose_exercise_type_mgmt(update, context)
-    
-    elif text == '🗑️ Удалить упражнение':
-        return await show_delete_exercise_menu(update, context)
-    
-    elif text == '🔙 Главное меню':
-        return await start(update, context)
-    
-    else:
-        return await show_exercises_management(update, context)
-                                              
+    from routing import dispatch
+
+    return await dispatch(EXERCISES_MANAGEMENT, update, context)
+
 async def choose_exercise_type_mgmt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Выбор типа упражнения для добавления (из управления)"""
-    keyboard = [
-        ['💪 Силовое упражнение', '🏃 Кардио упражнение'],
-        ['🔙 Назад к управлению упражнениями']
-    ]
-    
     await update.message.reply_text(
         "Выберите тип упражнения для добавления:",
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup=ADD_EXERCISE_TYPE_MGMT_KEYBOARD
     )
     return ADD_EXERCISE_TYPE_MGMT
 
 async def add_custom_exercise_mgmt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка выбора типа упражнения в управлении"""
-    choice = update.message.text
-    
-    if choice == '🔙 Назад к управлению упражнениями':
-        return await show_exercises_management(update, context)
-    
-    if '💪 Силовое' in choice:
-        context.user_data['adding_exercise_type'] = STRENGTH_TYPE
-        await update.message.reply_text(
-            "Введите название нового силового упражнения:",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return INPUT_NEW_STRENGTH_EXERCISE_MGMT
-    elif '🏃 Кардио' in choice:
-        context.user_data['adding_exercise_type'] = CARDIO_TYPE
-        await update.message.reply_text(
-            "Введите название нового кардио упражнения:",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return INPUT_NEW_CARDIO_EXERCISE_MGMT
-    else:
-        await update.message.reply_text(
-            "❌ Пожалуйста, используйте кнопки для выбора типа упражнения",
-            reply_markup=ReplyKeyboardMarkup([
-                ['💪 Силовое упражнение', '🏃 Кардио упражнение'],
-                ['🔙 Назад к управлению упражнениями']
-            ], resize_keyboard=True)
-        )
-        return ADD_EXERCISE_TYPE_MGMT
+    from routing import dispatch
+
+    return await dispatch(ADD_EXERCISE_TYPE_MGMT, update, context)
+
+async def ask_new_strength_exercise_mgmt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['adding_exercise_type'] = STRENGTH_TYPE
+    await update.message.reply_text(
+        "Введите название нового силового упражнения:",
+        reply_markup=ReplyKeyboardRemove()
+    )
+    return INPUT_NEW_STRENGTH_EXERCISE_MGMT
+
+async def ask_new_cardio_exercise_mgmt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['adding_exercise_type'] = CARDIO_TYPE
+    await update.message.reply_text(
+        "Введите название нового кардио упражнения:",
+        reply_markup=ReplyKeyboardRemove()
+    )
+    return INPUT_NEW_CARDIO_EXERCISE_MGMT
+
+async def add_exercise_type_mgmt_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text(
+        "❌ Пожалуйста, используйте кнопки для выбора типа упражнения",
+        reply_markup=ADD_EXERCISE_TYPE_MGMT_KEYBOARD
+    )
+    return ADD_EXERCISE_TYPE_MGMT
 
 async def save_new_strength_exercise_mgmt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Сохранение нового силового упражнения из управления"""
@@ -118,10 +98,7 @@ async def save_new_exercise_mgmt(update: Update, context: ContextTypes.DEFAULT_T
     if exercise_name in visible[key]:
         await update.message.reply_text(
             f"❌ Упражнение «{exercise_name}» уже есть в вашем списке.",
-            reply_markup=ReplyKeyboardMarkup([
-                ['➕ Добавить упражнение', '🗑️ Удалить упражнение'],
-                ['🔙 Главное меню']
-            ], resize_keyboard=True)
+            reply_markup=EXERCISES_MANAGEMENT_KEYBOARD
         )
         return EXERCISES_MANAGEMENT
     
@@ -131,18 +108,12 @@ async def save_new_exercise_mgmt(update: Update, context: ContextTypes.DEFAULT_T
     if success:
         await update.message.reply_text(
             f"✅ Упражнение '{exercise_name}' добавлено в ваш список!",
-            reply_markup=ReplyKeyboardMarkup([
-                ['➕ Добавить упражнение', '🗑️ Удалить упражнение'],
-                ['🔙 Главное меню']
-            ], resize_keyboard=True)
+            reply_markup=EXERCISES_MANAGEMENT_KEYBOARD
         )
     else:
         await update.message.reply_text(
             "❌ Не удалось добавить упражнение.",
-            reply_markup=ReplyKeyboardMarkup([
-                ['➕ Добавить упражнение', '🗑️ Удалить упражнение'],
-                ['🔙 Главное меню']
-            ], resize_keyboard=True)
+            reply_markup=EXERCISES_MANAGEMENT_KEYBOARD
         )
     
     # Очищаем временные данные
@@ -158,25 +129,14 @@ async def show_delete_exercise_menu(update: Update, context: ContextTypes.DEFAUL
     if not visible["strength"] and not visible["cardio"]:
         await update.message.reply_text(
             "❌ В списке нет упражнений. Добавьте своё или сбросьте скрытые через поддержку.",
-            reply_markup=ReplyKeyboardMarkup([
-                ['➕ Добавить упражнение', '🗑️ Удалить упражнение'],
-                ['🔙 Главное меню']
-            ], resize_keyboard=True)
+            reply_markup=EXERCISES_MANAGEMENT_KEYBOARD
         )
         return EXERCISES_MANAGEMENT
     
-    keyboard = []
-    for ex in visible["strength"]:
-        keyboard.append([f"💪 {ex}"])
-    for ex in visible["cardio"]:
-        keyboard.append([f"🏃 {ex}"])
-    
-    keyboard.append(['🔙 Назад к управлению упражнениями'])
-    
     await update.message.reply_text(
         "🗑️ Выберите упражнение, чтобы убрать его из списка:\n"
         "(свои — удаляются из базы, стандартные — скрываются для вас)",
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup=delete_exercise_keyboard(visible)
     )
     return DELETE_EXERCISE_MENU
 
@@ -185,9 +145,6 @@ async def delete_exercise_handler(update: Update, context: ContextTypes.DEFAULT_
     user_id = update.message.from_user.id
     exercise_with_emoji = update.message.text
     
-    if exercise_with_emoji == '🔙 Назад к управлению упражнениями':
-        return await show_exercises_management(update, context)
-    
     # Извлекаем название упражнения и тип из текста
     if exercise_with_emoji.startswith('💪 '):
         exercise_name = exercise_with_emoji[3:]  # Убираем "💪 "
@@ -198,10 +155,7 @@ async def delete_exercise_handler(update: Update, context: ContextTypes.DEFAULT_
     else:
         await update.message.reply_text(
             "❌ Не удалось распознать упражнение.",
-            reply_markup=ReplyKeyboardMarkup([
-                ['➕ Добавить упражнение', '🗑️ Удалить упражнение'],
-                ['🔙 Главное меню']
-            ], resize_keyboard=True)
+            reply_markup=EXERCISES_MANAGEMENT_KEYBOARD
         )
         return EXERCISES_MANAGEMENT
     
@@ -210,18 +164,12 @@ async def delete_exercise_handler(update: Update, context: ContextTypes.DEFAULT_
     if success:
         await update.message.reply_text(
             f"✅ Упражнение '{exercise_name}' удалено!",
-            reply_markup=ReplyKeyboardMarkup([
-                ['➕ Добавить упражнение', '🗑️ Удалить упражнение'],
-                ['🔙 Главное меню']
-            ], resize_keyboard=True)
+            reply_markup=EXERCISES_MANAGEMENT_KEYBOARD
         )
     else:
         await update.message.reply_text(
             f"❌ Не удалось удалить упражнение '{exercise_name}'.",
-            reply_markup=ReplyKeyboardMarkup([
-                ['➕ Добавить упражнение', '🗑️ Удалить упражнение'],
-                ['🔙 Главное меню']
-            ], resize_keyboard=True)
+            reply_markup=EXERCISES_MANAGEMENT_KEYBOARD
         )
     
 
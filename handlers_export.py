@@ -4,11 +4,13 @@ import csv
 from collections import Counter
 from datetime import datetime
 
-from telegram import Update, ReplyKeyboardMarkup, InputFile
+from telegram import Update, InputFile
 from telegram.ext import ContextTypes
 
 from database import get_user_trainings
 from bot_utils import parse_training_datetime, normalize_exercise_sets
+from keyboards import MAIN_MENU_KEYBOARD, EXPORT_MENU_KEYBOARD
+from process_pool import run_job
 from utils_constants import *
 
 logger = logging.getLogger(__name__)
@@ -316,15 +318,12 @@ def generate_csv_export(user_id, period_type="all_time"):
     return output.getvalue()
 
 
-def _main_menu_keyboard():
-    return ReplyKeyboardMarkup(
-        [
-            ["💪 Начать тренировку", "📊 История тренировок"],
-            ["📝 Мои упражнения", "📈 Статистика", "📏 Мои замеры"],
-            ["📤 Выгрузка данных", "❓ Помощь"],
-        ],
-        resize_keyboard=True,
-    )
+def generate_csv_bytes(user_id, period_type="all_time"):
+    """CSV-выгрузка в байтах (UTF-8 с BOM — корректно открывается в Excel)."""
+    csv_data = generate_csv_export(user_id, period_type)
+    if not csv_data:
+        return None
+    return csv_data.encode("utf-8-sig")
 
 
 async def show_export_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -339,17 +338,11 @@ async def show_export_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     if trainings:
         stats_text = "\n💾 В базе есть сохранённые тренировки.\n"
 
-    keyboard = [
-        ["📗 Excel — вся история", "📗 Excel — текущий месяц"],
-        ["📄 CSV — вся история", "📄 CSV — текущий месяц"],
-        ["🔙 Главное меню"],
-    ]
-
     await msg.reply_text(
         f"📤 Выгрузка отчёта{stats_text}\n"
         "📗 Excel (.xlsx) — сводка, список тренировок и все подходы (удобно для Google Таблиц).\n"
         "📄 CSV — те же детали подходов в текстовом файле.",
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True),
+        reply_markup=EXPORT_MENU_KEYBOARD,
     )
     return EXPORT_MENU
 
@@ -364,11 +357,11 @@ async def _send_excel(
     msg = update.effective_message
     if not msg:
         return MAIN_MENU
-    blob = generate_excel_report(user_id, period_type)
+    blob = await run_job("excel_report", user_id, period_type=period_type)
     if not blob:
         await msg.reply_text(
             f"❌ Нет данных для выгрузки ({period_label}) или не установлен openpyxl на сервере.",
-            reply_markup=_main_menu_keyboard(),
+            reply_markup=MAIN_MENU_KEYBOARD,
         )
         return MAIN_MENU
 
@@ -381,13 +374,13 @@ async def _send_excel(
                 "Листы: «Сводка», «Тренировки», «Детали подходов». "
                 "В Google Таблицах: Файл → Импорт → Загрузка."
             ),
-            reply_markup=_main_menu_keyboard(),
+            reply_markup=MAIN_MENU_KEYBOARD,
         )
     except Exception as e:
         logger.error("Ошибка отправки Excel: %s", e, exc_info=True)
         await msg.reply_text(
             "❌ Не удалось сформировать или отправить Excel. Попробуйте позже.",
-            reply_markup=_main_menu_keyboard(),
+            reply_markup=MAIN_MENU_KEYBOARD,
         )
     return MAIN_MENU
 
@@ -402,75 +395,63 @@ async def _send_csv(
     msg = update.effective_message
     if not msg:
         return MAIN_MENU
-    csv_data = generate_csv_export(user_id, period_type)
-    if not csv_data:
+    blob = await run_job("csv_export", user_id, period_type=period_type)
+    if not blob:
         await msg.reply_text(
             f"❌ Нет данных для выгрузки ({period_label}).",
-            reply_markup=_main_menu_keyboard(),
+            reply_markup=MAIN_MENU_KEYBOARD,
         )
         return MAIN_MENU
 
     filename = f"nextset_details_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
     try:
-        with open(filename, "w", encoding="utf-8-sig", newline="") as f:
-            f.write(csv_data)
-        with open(filename, "rb") as f:
-            await msg.reply_document(
-                document=f,
-                filename=filename,
-                caption=f"📄 Детали подходов (CSV) — {period_label}",
-                reply_markup=_main_menu_keyboard(),
-            )
+        await msg.reply_document(
+            document=InputFile(io.BytesIO(blob), filename=filename),
+            caption=f"📄 Детали подходов (CSV) — {period_label}",
+            reply_markup=MAIN_MENU_KEYBOARD,
+        )
     except Exception as e:
         logger.error("Ошибка выгрузки CSV: %s", e, exc_info=True)
         await msg.reply_text(
             "❌ Ошибка при создании CSV.",
-            reply_markup=_main_menu_keyboard(),
+            reply_markup=MAIN_MENU_KEYBOARD,
         )
-    finally:
-        import os
-
-        if os.path.exists(filename):
-            os.remove(filename)
     return MAIN_MENU
 
 
-async def handle_export_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Выбор типа и периода выгрузки."""
-    msg = update.effective_message
-    if not msg:
-        return EXPORT_MENU
-    text = (msg.text or "").strip()
+async def export_excel_all_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    user_id = update.effective_message.from_user.id
+    return await _send_excel(update, context, user_id, "all_time", "вся история")
 
-    if text == "🔙 Главное меню":
-        from handlers_common import start
 
-        return await start(update, context)
+async def export_excel_current_month(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    user_id = update.effective_message.from_user.id
+    return await _send_excel(update, context, user_id, "current_month", "текущий месяц")
 
-    user_id = msg.from_user.id
 
-    if text == "📗 Excel — вся история":
-        return await _send_excel(update, context, user_id, "all_time", "вся история")
-    if text == "📗 Excel — текущий месяц":
-        return await _send_excel(
-            update, context, user_id, "current_month", "текущий месяц"
-        )
-    if text == "📄 CSV — вся история":
-        return await _send_csv(update, context, user_id, "all_time", "вся история")
-    if text == "📄 CSV — текущий месяц":
-        return await _send_csv(
-            update, context, user_id, "current_month", "текущий месяц"
-        )
+async def export_csv_all_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    user_id = update.effective_message.from_user.id
+    return await _send_csv(update, context, user_id, "all_time", "вся история")
+
+
+async def export_csv_current_month(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    user_id = update.effective_message.from_user.id
+    return await _send_csv(update, context, user_id, "current_month", "текущий месяц")
+
+
+async def handle_export_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Выбор типа и периода выгрузки."""
+    from routing import dispatch
+
+    return await dispatch(EXPORT_MENU, update, context)
+
 
+async def export_menu_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    msg = update.effective_message
+    if not msg:
+        return EXPORT_MENU
     await msg.reply_text(
         "❌ Пожалуйста, используйте кнопки меню.",
-        reply_markup=ReplyKeyboardMarkup(
-            [
-                ["📗 Excel — вся история", "📗 Excel — текущий месяц"],
-                ["📄 CSV — вся история", "📄 CSV — текущий месяц"],
-                ["🔙 Главное меню"],
-            ],
-            resize_keyboard=True,
-        ),
+        reply_markup=EXPORT_MENU_KEYBOARD,
     )
     return EXPORT_MENU
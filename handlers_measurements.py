@@ -1,8 +1,11 @@
 import logging
-from telegram import Update, ReplyKeyboardMarkup
+from datetime import datetime, timedelta
+from telegram import Update
 from telegram.ext import ContextTypes
 
-from database import get_measurements_history
+from body_metrics import TREND_WEEKS, measurement_trends, format_trends
+from database import get_measurements_history, get_measurement_buckets
+from keyboards import MAIN_MENU_KEYBOARD, MEASUREMENTS_KEYBOARD
 from utils_constants import *
 
 logger = logging.getLogger(__name__)
@@ -16,11 +19,7 @@ async def show_measurements_history(update: Update, context: ContextTypes.DEFAUL
         await update.message.reply_text(
             "📏 У вас пока нет сохраненных замеров.\n"
             "Замеры сохраняются автоматически при начале тренировки.",
-            reply_markup=ReplyKeyboardMarkup([
-                ['💪 Начать тренировку', '📊 История тренировок'],
-                ['📝 Мои упражнения', '📈 Статистика', '📏 Мои замеры'],
-                ['📤 Выгрузка данных', '❓ Помощь']
-            ], resize_keyboard=True)
+            reply_markup=MAIN_MENU_KEYBOARD
         )
         return MAIN_MENU
     
@@ -34,10 +33,35 @@ async def show_measurements_history(update: Update, context: ContextTypes.DEFAUL
     
     await update.message.reply_text(
         measurements_text,
-        reply_markup=ReplyKeyboardMarkup([
-            ['💪 Начать тренировку', '📊 История тренировок'],
-            ['📝 Мои упражнения', '📈 Статистика', '📏 Мои замеры'],
-            ['📤 Выгрузка данных', '❓ Помощь']
-        ], resize_keyboard=True)
+        reply_markup=MEASUREMENTS_KEYBOARD
     )
-    return MAIN_MENU
\ No newline at end of file
+    return MEASUREMENTS_HISTORY
+
+async def show_measurement_trends(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Динамика замеров за 4/12/52 недели по недельным агрегатам из БД"""
+    user_id = update.message.from_user.id
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    this_week = today - timedelta(days=today.weekday())
+    weekly = get_measurement_buckets(user_id, "week", since=this_week - timedelta(weeks=max(TREND_WEEKS)))
+    trends = measurement_trends(weekly, this_week)
+    
+    if not trends:
+        await update.message.reply_text(
+            "📉 Пока нет распознанных замеров за последний год.\n"
+            "Вводите замеры с названиями, например: вес 65кг, талия 70см.",
+            reply_markup=MEASUREMENTS_KEYBOARD
+        )
+        return MEASUREMENTS_HISTORY
+    
+    await update.message.reply_text(
+        format_trends(trends),
+        reply_markup=MEASUREMENTS_KEYBOARD
+    )
+    return MEASUREMENTS_HISTORY
+
+async def measurements_menu_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text(
+        "❌ Пожалуйста, используйте кнопки меню.",
+        reply_markup=MEASUREMENTS_KEYBOARD
+    )
+    return MEASUREMENTS_HISTORY
@@ -1,10 +1,18 @@
+import io
 import logging
 from datetime import datetime, timedelta
-from telegram import Update, ReplyKeyboardMarkup
+from telegram import Update, InputFile
 from telegram.ext import ContextTypes
 
-from database import get_user_trainings, get_custom_exercises
+import analytics
+from analytics import load_user_history
+from database import get_progress_exercises, get_exercise_progress, get_chart_cache, save_chart_file_id
 from bot_utils import parse_training_datetime, normalize_exercise_sets
+from keyboards import STATS_MENU_KEYBOARD, CHARTS_KEYBOARD, progress_exercises_keyboard
+from progression import format_progress
+from digest import weekly_digest, format_digest
+from metrics import inc
+from process_pool import run_job
 from utils_constants import *
 
 logger = logging.getLogger(__name__)
@@ -15,98 +23,69 @@ async def show_statistics_menu(update: Update, context: ContextTypes.DEFAULT_TYP
     msg = update.effective_message
     if not msg:
         return STATS_MENU
-    keyboard = [
-        ['📊 Общая статистика', '📅 Текущая неделя'],
-        ['📅 Текущий месяц', '📅 Текущий год'],
-        ['📋 Статистика по упражнениям'],
-        ['🔙 Главное меню']
-    ]
-    
     await msg.reply_text(
         "📈 Выберите тип статистики:",
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup=STATS_MENU_KEYBOARD
     )
     return STATS_MENU
 
+def _start_of_week(now):
+    return (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _start_of_month(now):
+    return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def _start_of_year(now):
+    return now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
 async def show_general_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Показать общую статистику"""
     user_id = update.message.from_user.id
-    trainings = get_user_trainings(user_id, limit=1000)  # Получаем все тренировки
+    history = load_user_history(user_id)  # Вся история одним запросом
     
-    if not trainings:
+    if not len(history):
         await update.message.reply_text(
             "📊 У вас пока нет данных для статистики.\n"
             "Завершите несколько тренировок, чтобы увидеть статистику.",
-            reply_markup=ReplyKeyboardMarkup([
-                ['📊 Общая статистика', '📅 Текущая неделя'],
-                ['📅 Текущий месяц', '📅 Текущий год'],
-                ['📋 Статистика по упражнениям'],
-                ['🔙 Главное меню']
-            ], resize_keyboard=True)
+            reply_markup=STATS_MENU_KEYBOARD
         )
         return STATS_MENU
     
     # Вычисляем статистику
-    total_trainings = len(trainings)
-    total_exercises = 0
-    total_strength_exercises = 0
-    total_cardio_exercises = 0
-    
-    for training in trainings:
-        total_exercises += len(training['exercises'])
-        for exercise in training['exercises']:
-            if exercise.get('is_cardio'):
-                total_cardio_exercises += 1
-            else:
-                total_strength_exercises += 1
+    totals = analytics.period_summary(history)
     
     stats_text = "📊 ВАША СТАТИСТИКА\n\n"
     stats_text += "🏆 ОБЩАЯ СТАТИСТИКА:\n"
-    stats_text += f"• Тренировок: {total_trainings}\n"
-    stats_text += f"• Упражнений: {total_exercises}\n"
-    stats_text += f"• Силовых упражнений: {total_strength_exercises}\n"
-    stats_text += f"• Кардио упражнений: {total_cardio_exercises}\n"
+    stats_text += f"• Тренировок: {totals['trainings']}\n"
+    stats_text += f"• Упражнений: {totals['exercises']}\n"
+    stats_text += f"• Силовых упражнений: {totals['strength']}\n"
+    stats_text += f"• Кардио упражнений: {totals['cardio']}\n"
     
     # Статистика за текущую неделю
-    week_stats = calculate_weekly_stats(trainings)
+    week_stats = analytics.period_summary(history, _start_of_week(datetime.now()))
     if week_stats['trainings'] > 0:
-        stats_text += f"\n📅 НА ЭТОЙ НЕДЕЛЕ:\n"
+        stats_text += "\n📅 НА ЭТОЙ НЕДЕЛЕ:\n"
         stats_text += f"• Тренировок: {week_stats['trainings']}\n"
         stats_text += f"• Упражнений: {week_stats['exercises']}\n"
     
+    records = analytics.personal_records(history, limit=3)
+    if records:
+        stats_text += "\n🏅 ПОСЛЕДНИЕ РЕКОРДЫ (расчётный 1ПМ):\n"
+        for date, name, one_rm, weight, reps in records:
+            stats_text += f"• {date.strftime('%d.%m.%Y')} {name}: {one_rm:g}кг ({weight:g}кг × {reps})\n"
+    
     await update.message.reply_text(
         stats_text,
-        reply_markup=ReplyKeyboardMarkup([
-            ['📊 Общая статистика', '📅 Текущая неделя'],
-            ['📅 Текущий месяц', '📅 Текущий год'],
-            ['📋 Статистика по упражнениям'],
-            ['🔙 Главное меню']
-        ], resize_keyboard=True)
+        reply_markup=STATS_MENU_KEYBOARD
     )
     return STATS_MENU
 
 async def show_weekly_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Показать статистику за текущую неделю"""
     user_id = update.message.from_user.id
-    trainings = get_user_trainings(user_id, limit=1000)
-
-    try:
-        week_stats = calculate_weekly_stats(trainings)
-    except (ValueError, TypeError, KeyError) as e:
-        logger.exception("Ошибка расчёта недельной статистики: %s", e)
-        await update.message.reply_text(
-            "❌ Не удалось посчитать статистику за неделю. Проверьте формат данных или попробуйте позже.",
-            reply_markup=ReplyKeyboardMarkup(
-                [
-                    ["📊 Общая статистика", "📅 Текущая неделя"],
-                    ["📅 Текущий месяц", "📅 Текущий год"],
-                    ["📋 Статистика по упражнениям"],
-                    ["🔙 Главное меню"],
-                ],
-                resize_keyboard=True,
-            ),
-        )
-        return STATS_MENU
+    start_of_week = _start_of_week(datetime.now())
+    history = load_user_history(user_id, start_of_week)
+    week_stats = analytics.period_summary(history, start_of_week)
     
     stats_text = "📅 СТАТИСТИКА ЗА ТЕКУЩУЮ НЕДЕЛЮ\n\n"
     
@@ -119,28 +98,29 @@ async def show_weekly_stats(update: Update, context: ContextTypes.DEFAULT_TYPE)
         stats_text += f"📈 Силовых: {week_stats['strength']}\n"
         stats_text += f"🏃 Кардио: {week_stats['cardio']}\n"
         
-        if week_stats['trainings_list']:
-            stats_text += f"\n📋 Тренировки этой недели:\n"
-            for training in week_stats['trainings_list'][:5]:  # Показываем до 5 тренировок
-                stats_text += f"• {training['date_start']}: {len(training['exercises'])} упражнений\n"
+        stats_text += "\n📋 Тренировки этой недели:\n"
+        # Показываем до 5 тренировок
+        for date_start, exercises in analytics.recent_trainings(history, start_of_week, limit=5):
+            stats_text += f"• {date_start.strftime('%d.%m.%Y %H:%M')}: {exercises} упражнений\n"
+    
+    # Итоги прошлой недели посчитаны заранее (digest.py) — чтение одной строки
+    digest = weekly_digest(user_id)
+    if digest:
+        stats_text += "\n" + format_digest(digest)
     
     await update.message.reply_text(
         stats_text,
-        reply_markup=ReplyKeyboardMarkup([
-            ['📊 Общая статистика', '📅 Текущая неделя'],
-            ['📅 Текущий месяц', '📅 Текущий год'],
-            ['📋 Статистика по упражнениям'],
-            ['🔙 Главное меню']
-        ], resize_keyboard=True)
+        reply_markup=STATS_MENU_KEYBOARD
     )
     return STATS_MENU
 
 async def show_monthly_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Показать статистику за текущий месяц"""
     user_id = update.message.from_user.id
-    trainings = get_user_trainings(user_id, limit=1000)
+    start_of_month = _start_of_month(datetime.now())
+    history = load_user_history(user_id, start_of_month)
     
-    month_stats = calculate_monthly_stats(trainings)
+    month_stats = analytics.period_summary(history, start_of_month, top=3)
     
     stats_text = "📅 СТАТИСТИКА ЗА ТЕКУЩИЙ МЕСЯЦ\n\n"
     
@@ -155,27 +135,29 @@ async def show_monthly_stats(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         # Самые популярные упражнения
         if month_stats['popular_exercises']:
-            stats_text += f"\n🎯 Популярные упражнения:\n"
-            for exercise, count in month_stats['popular_exercises'][:3]:  # Топ-3
+            stats_text += "\n🎯 Популярные упражнения:\n"
+            for exercise, count in month_stats['popular_exercises']:  # Топ-3
                 stats_text += f"• {exercise}: {count} раз\n"
+        
+        volume = analytics.volume_by_exercise(history, start_of_month, top=3)
+        if volume:
+            stats_text += "\n🏋️ Объём (вес × повторения):\n"
+            for exercise, kg in volume:
+                stats_text += f"• {exercise}: {kg:g}кг\n"
     
     await update.message.reply_text(
         stats_text,
-        reply_markup=ReplyKeyboardMarkup([
-            ['📊 Общая статистика', '📅 Текущая неделя'],
-            ['📅 Текущий месяц', '📅 Текущий год'],
-            ['📋 Статистика по упражнениям'],
-            ['🔙 Главное меню']
-        ], resize_keyboard=True)
+        reply_markup=STATS_MENU_KEYBOARD
     )
     return STATS_MENU
 
 async def show_yearly_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Показать статистику за текущий год"""
     user_id = update.message.from_user.id
-    trainings = get_user_trainings(user_id, limit=1000)
+    start_of_year = _start_of_year(datetime.now())
+    history = load_user_history(user_id, start_of_year)
     
-    year_stats = calculate_yearly_stats(trainings)
+    year_stats = analytics.period_summary(history, start_of_year)
     
     stats_text = "📅 СТАТИСТИКА ЗА ТЕКУЩИЙ ГОД\n\n"
     
@@ -189,40 +171,176 @@ async def show_yearly_stats(update: Update, context: ContextTypes.DEFAULT_TYPE)
         stats_text += f"🏃 Кардио: {year_stats['cardio']}\n"
         
         # Статистика по месяцам
-        if year_stats['monthly_stats']:
-            stats_text += f"\n📊 По месяцам:\n"
-            for month, count in year_stats['monthly_stats'].items():
-                stats_text += f"• {month}: {count} тренировок\n"
+        stats_text += "\n📊 По месяцам:\n"
+        for month, count in analytics.trainings_by_period(history, "M", start_of_year):
+            stats_text += f"• {month.strftime('%B')}: {count} тренировок\n"
     
     await update.message.reply_text(
         stats_text,
-        reply_markup=ReplyKeyboardMarkup([
-            ['📊 Общая статистика', '📅 Текущая неделя'],
-            ['📅 Текущий месяц', '📅 Текущий год'],
-            ['📋 Статистика по упражнениям'],
-            ['🔙 Главное меню']
-        ], resize_keyboard=True)
+        reply_markup=STATS_MENU_KEYBOARD
     )
     return STATS_MENU
 
 async def show_exercise_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Показать статистику по упражнениям"""
     user_id = update.message.from_user.id
-    trainings = get_user_trainings(user_id, limit=1000)
+    # Разбор всей истории — CPU-работа, выполняется в пуле процессов
+    exercise_stats = await run_job("exercise_stats", user_id)
     
-    if not trainings:
+    if exercise_stats is None:
         await update.message.reply_text(
             "📊 У вас пока нет данных для статистики по упражнениям.",
-            reply_markup=ReplyKeyboardMarkup([
-                ['📊 Общая статистика', '📅 Текущая неделя'],
-                ['📅 Текущий месяц', '📅 Текущий год'],
-                ['📋 Статистика по упражнениям'],
-                ['🔙 Главное меню']
-            ], resize_keyboard=True)
+            reply_markup=STATS_MENU_KEYBOARD
         )
         return STATS_MENU
     
-    # Собираем статистику по упражнениям
+    if not exercise_stats:
+        await update.message.reply_text(
+            "❌ Нет данных по упражнениям.",
+            reply_markup=STATS_MENU_KEYBOARD
+        )
+        return STATS_MENU
+    
+    stats_text = "📊 СТАТИСТИКА ПО УПРАЖНЕНИЯМ\n\n"
+    
+    # Сортируем по популярности
+    sorted_exercises = sorted(exercise_stats.items(), key=lambda x: x[1]['count'], reverse=True)
+    
+    for exercise_name, stats in sorted_exercises[:10]:  # Показываем топ-10
+        emoji = "🏃" if stats['type'] == 'cardio' else "💪"
+        stats_text += f"{emoji} {exercise_name}\n"
+        stats_text += f"   Выполнено: {stats['count']} раз\n"
+        
+        if stats['type'] == 'strength' and stats['max_weight'] > 0:
+            stats_text += f"   Макс. вес: {stats['max_weight']}кг\n"
+            if stats['total_sets'] > 0:
+                avg_reps = stats['total_reps'] / stats['total_sets']
+                stats_text += f"   Ср. повторений: {avg_reps:.1f}\n"
+        
+        stats_text += "\n"
+    
+    await update.message.reply_text(
+        stats_text,
+        reply_markup=STATS_MENU_KEYBOARD
+    )
+    return STATS_MENU
+
+async def show_progress_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Выбор упражнения для экрана прогресса"""
+    user_id = update.message.from_user.id
+    exercises = get_progress_exercises(user_id)
+    
+    if not exercises:
+        await update.message.reply_text(
+            "📈 Пока нет данных о прогрессе.\n"
+            "Сохраните силовое упражнение с подходами, и здесь появятся рекорды и динамика.",
+            reply_markup=STATS_MENU_KEYBOARD
+        )
+        return STATS_MENU
+    
+    await update.message.reply_text(
+        "📈 Выберите упражнение:",
+        reply_markup=progress_exercises_keyboard(exercises)
+    )
+    return EXERCISE_STATS_SELECTION
+
+async def show_exercise_progress(update: Update, context: ContextTypes.DEFAULT_TYPE, exercise: str = None) -> int:
+    """Рекорды и динамика по одному упражнению (данные заранее посчитаны при сохранении)"""
+    user_id = update.message.from_user.id
+    exercise = (exercise or update.message.text).strip()
+    progress = get_exercise_progress(user_id, exercise)
+    
+    if not progress:
+        await update.message.reply_text(
+            f"❌ Нет данных о прогрессе в упражнении «{exercise}».",
+            reply_markup=progress_exercises_keyboard(get_progress_exercises(user_id))
+        )
+        return EXERCISE_STATS_SELECTION
+    
+    await update.message.reply_text(
+        format_progress(exercise, progress),
+        reply_markup=progress_exercises_keyboard(get_progress_exercises(user_id))
+    )
+    return EXERCISE_STATS_SELECTION
+
+async def show_charts_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Выбор графика"""
+    await update.message.reply_text(
+        "📉 Выберите график:",
+        reply_markup=CHARTS_KEYBOARD
+    )
+    return CHARTS_MENU
+
+async def _send_chart(update: Update, chart: str, caption: str) -> int:
+    """Отправить график: по file_id, если данные не менялись, иначе нарисовать в пуле процессов"""
+    msg = update.message
+    user_id = msg.from_user.id
+    cache = get_chart_cache(user_id, chart)
+    if cache is None:
+        await msg.reply_text("❌ Не удалось построить график. Попробуйте позже.", reply_markup=CHARTS_KEYBOARD)
+        return CHARTS_MENU
+    data_version, cached_version, file_id = cache
+
+    if file_id and cached_version == data_version:
+        try:
+            await msg.reply_photo(photo=file_id, caption=caption, reply_markup=CHARTS_KEYBOARD)
+            inc("chart_cache_total", chart=chart, result="hit")
+            return CHARTS_MENU
+        except Exception as e:
+            # file_id мог стать недействительным (например, сменился токен бота) — рисуем заново
+            logger.warning("График %s по file_id не отправлен: %s", chart, e)
+    inc("chart_cache_total", chart=chart, result="miss")
+
+    png = await run_job("chart", user_id, chart=chart)
+    if not png:
+        await msg.reply_text(
+            "📉 Для этого графика пока недостаточно данных.",
+            reply_markup=CHARTS_KEYBOARD
+        )
+        return CHARTS_MENU
+
+    try:
+        sent = await msg.reply_photo(
+            photo=InputFile(io.BytesIO(png), filename=f"{chart}.png"),
+            caption=caption,
+            reply_markup=CHARTS_KEYBOARD
+        )
+    except Exception as e:
+        logger.error("Ошибка отправки графика %s: %s", chart, e, exc_info=True)
+        await msg.reply_text("❌ Не удалось отправить график. Попробуйте позже.", reply_markup=CHARTS_KEYBOARD)
+        return CHARTS_MENU
+    # Версия взята до рендера: если данные успели измениться, следующий просмотр просто нарисует заново
+    save_chart_file_id(user_id, chart, data_version, sent.photo[-1].file_id)
+    return CHARTS_MENU
+
+async def show_trainings_per_week_chart(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    return await _send_chart(update, "trainings_per_week", "📊 Тренировки по неделям")
+
+async def show_volume_per_exercise_chart(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    return await _send_chart(update, "volume_per_exercise", "🏋️ Объём по упражнениям")
+
+async def show_body_weight_chart(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    return await _send_chart(update, "body_weight", "⚖️ Вес тела")
+
+async def charts_menu_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text(
+        "❌ Пожалуйста, выберите график кнопкой.",
+        reply_markup=CHARTS_KEYBOARD
+    )
+    return CHARTS_MENU
+
+# Вспомогательные функции для расчетов статистики
+# (calculate_*_stats — исходные расчёты по спискам тренировок; экраны считают через analytics.py,
+# эти функции остаются эталоном для bench_analytics.py)
+def exercise_stats_for_user(user_id):
+    """Статистика по упражнениям за всю историю (None — тренировок нет). Задача пула процессов."""
+    history = load_user_history(user_id)
+    if not len(history):
+        return None
+    return analytics.exercise_stats(history)
+
+def calculate_exercise_stats(trainings):
+    """Сводка по каждому упражнению: число выполнений, тип, макс. вес, повторения и подходы"""
     exercise_stats = {}
     
     for training in trainings:
@@ -258,48 +376,8 @@ async def show_exercise_stats(update: Update, context: ContextTypes.DEFAULT_TYPE
                 exercise_stats[name]['total_reps'] += sum(reps)
                 exercise_stats[name]['total_sets'] += len(sets_list)
     
-    if not exercise_stats:
-        await update.message.reply_text(
-            "❌ Нет данных по упражнениям.",
-            reply_markup=ReplyKeyboardMarkup([
-                ['📊 Общая статистика', '📅 Текущая неделя'],
-                ['📅 Текущий месяц', '📅 Текущий год'],
-                ['📋 Статистика по упражнениям'],
-                ['🔙 Главное меню']
-            ], resize_keyboard=True)
-        )
-        return STATS_MENU
-    
-    stats_text = "📊 СТАТИСТИКА ПО УПРАЖНЕНИЯМ\n\n"
-    
-    # Сортируем по популярности
-    sorted_exercises = sorted(exercise_stats.items(), key=lambda x: x[1]['count'], reverse=True)
-    
-    for exercise_name, stats in sorted_exercises[:10]:  # Показываем топ-10
-        emoji = "🏃" if stats['type'] == 'cardio' else "💪"
-        stats_text += f"{emoji} {exercise_name}\n"
-        stats_text += f"   Выполнено: {stats['count']} раз\n"
-        
-        if stats['type'] == 'strength' and stats['max_weight'] > 0:
-            stats_text += f"   Макс. вес: {stats['max_weight']}кг\n"
-            if stats['total_sets'] > 0:
-                avg_reps = stats['total_reps'] / stats['total_sets']
-                stats_text += f"   Ср. повторений: {avg_reps:.1f}\n"
-        
-        stats_text += "\n"
-    
-    await update.message.reply_text(
-        stats_text,
-        reply_markup=ReplyKeyboardMarkup([
-            ['📊 Общая статистика', '📅 Текущая неделя'],
-            ['📅 Текущий месяц', '📅 Текущий год'],
-            ['📋 Статистика по упражнениям'],
-            ['🔙 Главное меню']
-        ], resize_keyboard=True)
-    )
-    return STATS_MENU
+    return exercise_stats
 
-# Вспомогательные функции для расчетов статистики
 def calculate_weekly_stats(trainings):
     """Рассчитать статистику за текущую неделю"""
     now = datetime.now()
@@ -407,44 +485,25 @@ def calculate_yearly_stats(trainings):
 
 async def handle_statistics_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Маршрутизация сообщений внутри экрана статистики."""
+    from routing import dispatch
+
+    return await dispatch(STATS_MENU, update, context)
+
+
+async def statistics_menu_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     msg = update.effective_message
     if not msg:
         return STATS_MENU
-    text = (msg.text or "").strip()
-
-    if text == "📊 Общая статистика":
-        return await show_general_statistics(update, context)
-    if text == "📅 Текущая неделя":
-        return await show_weekly_stats(update, context)
-    if text == "📅 Текущий месяц":
-        return await show_monthly_stats(update, context)
-    if text == "📅 Текущий год":
-        return await show_yearly_stats(update, context)
-    if text == "📋 Статистика по упражнениям":
-        return await show_exercise_stats(update, context)
-    if text == "🔙 Главное меню":
-        from handlers_common import start
-
-        return await start(update, context)
-
-    # Осталась клавиатура главного меню (несовпадение состояния) — обрабатываем как главное меню
-    from handlers_common import _MAIN_MENU_BUTTON_TEXTS, handle_main_menu
-
-    if text in _MAIN_MENU_BUTTON_TEXTS:
-        return await handle_main_menu(update, context)
-    if text == "📈 Статистика":
-        return await show_statistics_menu(update, context)
-
+    # «прогресс в Румынская тяга» / «прогресс Румынская тяга»
+    words = (msg.text or "").split(maxsplit=1)
+    if len(words) == 2 and words[0].lower() == "прогресс":
+        exercise = words[1]
+        for prefix in ("в ", "по "):
+            if exercise.lower().startswith(prefix):
+                exercise = exercise[len(prefix):]
+        return await show_exercise_progress(update, context, exercise)
     await msg.reply_text(
         "❌ Пожалуйста, используйте кнопки меню.",
-        reply_markup=ReplyKeyboardMarkup(
-            [
-                ["📊 Общая статистика", "📅 Текущая неделя"],
-                ["📅 Текущий месяц", "📅 Текущий год"],
-                ["📋 Статистика по упражнениям"],
-                ["🔙 Главное меню"],
-            ],
-            resize_keyboard=True,
-        ),
+        reply_markup=STATS_MENU_KEYBOARD,
     )
-    return STATS_MENU
\ No newline at end of file
+    return STATS_MENU
@@ -1,16 +1,33 @@
 import logging
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram import Update, ReplyKeyboardRemove
 from telegram.ext import ContextTypes
 
 from database import (
     create_user, get_current_training, create_training, save_training_measurements,
-    add_exercise_to_training, get_training_exercises, finish_training, get_user_trainings,
+    get_training_exercises, finish_training, get_user_trainings,
     save_measurement, add_custom_exercise, get_visible_exercise_lists,
 )
+import journal
+from body_metrics import parse_measurements, format_value
+from keyboards import (
+    MAIN_MENU_KEYBOARD, TRAINING_MENU_KEYBOARD, MEASUREMENTS_CHOICE_KEYBOARD,
+    FINISH_CONFIRM_KEYBOARD, FINISH_CONFIRM_SHORT_KEYBOARD, SETS_ACTIONS_KEYBOARD,
+    CARDIO_FORMAT_KEYBOARD, ADD_EXERCISE_TYPE_KEYBOARD,
+    strength_exercises_keyboard, cardio_exercises_keyboard,
+)
 from utils_constants import *
 
 logger = logging.getLogger(__name__)
 
+def idempotency_key(update: Update, scope: str) -> str:
+    """Ключ записи из user_id и update_id: повторная доставка того же апдейта даёт тот же ключ.
+    update_id не уникален глобально (Telegram начинает нумерацию заново после недели простоя,
+    одну БД могут делить несколько ботов), поэтому ключ включает пользователя."""
+    return f"{scope}:{update.effective_user.id}:{update.update_id}"
+
+
+QUEUED_NOTE = "\n📡 Нет связи с базой — запись сохранена на сервере бота и будет отправлена автоматически."
+
 # ==================== ОСНОВНЫЕ ФУНКЦИИ ТРЕНИРОВКИ ====================
 
 async def start_training(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -29,20 +46,15 @@ async def start_training(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         context.user_data['current_training'] = current_training
         context.user_data['training_id'] = current_training['training_id']
         
-        keyboard = [
-            ['💪 Силовые упражнения', '🏃 Кардио'],
-            ['✏️ Добавить свое упражнение', '🏁 Завершить тренировку']
-        ]
-        
         await update.message.reply_text(
             f"🎯 Продолжаем тренировку от {current_training['date_start']}!\n\n"
             "Выберите тип упражнения:",
-            reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            reply_markup=TRAINING_MENU_KEYBOARD
         )
         return TRAINING_MENU
     else:
         # Создаем новую тренировку
-        new_training = create_training(user_id)
+        new_training = create_training(user_id, idempotency_key=idempotency_key(update, "training"))
         if not new_training:
             await update.message.reply_text("❌ Не удалось создать тренировку. Попробуйте позже.")
             return MAIN_MENU
@@ -50,16 +62,11 @@ async def start_training(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         context.user_data['current_training'] = new_training
         context.user_data['training_id'] = new_training['training_id']
         
-        keyboard = [
-            ['📝 Ввести замеры', '⏭️ Пропустить замеры'],
-            ['🔙 Главное меню']
-        ]
-        
         await update.message.reply_text(
             f"🎯 Отлично стартуем! Сегодня {new_training['date_start']}\n\n"
             "📏 Хотите ли ввести замеры перед тренировкой?\n"
             "(например: вес 65кг, талия 70см, бедра 95см)",
-            reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            reply_markup=MEASUREMENTS_CHOICE_KEYBOARD
         )
         return INPUT_MEASUREMENTS_CHOICE
 
@@ -73,14 +80,14 @@ async def show_finish_summary(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     # Получаем текущую тренировку с упражнениями
     current_training = get_current_training(update.message.from_user.id)
+    if current_training:
+        # Упражнения из локального журнала, ещё не дошедшие до БД
+        current_training['exercises'] += journal.pending_exercises(training_id)
     
     if not current_training or not current_training['exercises']:
         await update.message.reply_text(
             "❌ В тренировке нет упражнений. Добавьте хотя бы одно упражнение перед завершением.",
-            reply_markup=ReplyKeyboardMarkup([
-                ['💪 Силовые упражнения', '🏃 Кардио'],
-                ['✏️ Добавить свое упражнение', '🏁 Завершить тренировку']
-            ], resize_keyboard=True)
+            reply_markup=TRAINING_MENU_KEYBOARD
         )
         return TRAINING_MENU
     
@@ -113,106 +120,69 @@ async def show_finish_summary(update: Update, context: ContextTypes.DEFAULT_TYPE
     report += f"• Силовых: {strength_count}\n"
     report += f"• Кардио: {cardio_count}\n"
     
-    keyboard = [
-        ['✅ Точно завершить', '✏️ Скорректировать'],
-        ['🔙 Продолжить тренировку']
-    ]
-    
     await update.message.reply_text(
         report,
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup=FINISH_CONFIRM_KEYBOARD
     )
     return CONFIRM_FINISH
 
 async def show_training_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Показать меню тренировки"""
-    keyboard = [
-        ['💪 Силовые упражнения', '🏃 Кардио'],
-        ['✏️ Добавить свое упражнение', '🏁 Завершить тренировку']
-    ]
-    
     await update.message.reply_text(
         "Выберите тип упражнения:",
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup=TRAINING_MENU_KEYBOARD
     )
     return TRAINING_MENU
 
 async def handle_finish_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка подтверждения завершения тренировки"""
-    choice = update.message.text
+    from routing import dispatch
+
+    return await dispatch(CONFIRM_FINISH, update, context)
+
+async def show_edit_not_available(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    # TODO: Реализовать редактирование тренировки
+    await update.message.reply_text(
+        "Функция редактирования будет реализована в следующем обновлении.",
+        reply_markup=FINISH_CONFIRM_SHORT_KEYBOARD
+    )
+    return CONFIRM_FINISH
+
+async def confirm_finish_training(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Завершение тренировки после подтверждения"""
     training_id = context.user_data.get('training_id')
-    user_id = update.message.from_user.id
+    success = finish_training(training_id)
     
-    if choice == '🔙 Продолжить тренировку':
-        return await show_training_menu(update, context)
-    
-    elif choice == '✏️ Скорректировать':
-        # TODO: Реализовать редактирование тренировки
-        await update.message.reply_text(
-            "Функция редактирования будет реализована в следующем обновлении.",
-            reply_markup=ReplyKeyboardMarkup([
-                ['✅ Точно завершить'],
-                ['🔙 Продолжить тренировку']
-            ], resize_keyboard=True)
-        )
-        return CONFIRM_FINISH
-    
-    elif choice == '✅ Точно завершить':
-        # ЯВНО импортируем функцию из database.py
-        from database import finish_training as db_finish_training
-        
-        # Завершаем тренировку через БД функцию
-        success = db_finish_training(training_id)
-        
-        if success:
-            # Очищаем данные тренировки
-            context.user_data.pop('current_training', None)
-            context.user_data.pop('training_id', None)
-            context.user_data.pop('current_exercise', None)
-            context.user_data.pop('cardio_format', None)
-            
-            await update.message.reply_text(
-                "🏆 Тренировка завершена и сохранена! 🏆",
-                reply_markup=ReplyKeyboardMarkup([
-                    ['💪 Начать тренировку', '📊 История тренировок'],
-                    ['📝 Мои упражнения', '📈 Статистика', '📏 Мои замеры'],
-                    ['📤 Выгрузка данных', '❓ Помощь']
-                ], resize_keyboard=True)
-            )
-        else:
-            await update.message.reply_text("❌ Не удалось завершить тренировку.")
+    if success:
+        # Очищаем данные тренировки
+        context.user_data.pop('current_training', None)
+        context.user_data.pop('training_id', None)
+        context.user_data.pop('current_exercise', None)
+        context.user_data.pop('exercise_key', None)
+        context.user_data.pop('cardio_format', None)
         
-        return MAIN_MENU
-    
-    else:  # ← ОДИН раз, а не два!
         await update.message.reply_text(
-            "❌ Пожалуйста, используйте кнопки для выбора действия",
-            reply_markup=ReplyKeyboardMarkup([
-                ['✅ Точно завершить', '✏️ Скорректировать'],
-                ['🔙 Продолжить тренировку']
-            ], resize_keyboard=True)
+            "🏆 Тренировка завершена и сохранена! 🏆",
+            reply_markup=MAIN_MENU_KEYBOARD
         )
-        return CONFIRM_FINISH
+    else:
+        await update.message.reply_text("❌ Не удалось завершить тренировку.")
+    
+    return MAIN_MENU
+
+async def finish_confirmation_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text(
+        "❌ Пожалуйста, используйте кнопки для выбора действия",
+        reply_markup=FINISH_CONFIRM_KEYBOARD
+    )
+    return CONFIRM_FINISH
 
 # ==================== ОБРАБОТЧИКИ МЕНЮ ТРЕНИРОВКИ ====================
 async def handle_training_menu_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Обработка выбора в меню тренировки - УПРОЩЕННАЯ ВЕРСИЯ"""
-    text = update.message.text
-    
-    if text == '💪 Силовые упражнения':
-        return await show_strength_exercises(update, context)
-        
-    elif text == '🏃 Кардио':
-        return await show_cardio_exercises(update, context)
-        
-    elif text == '✏️ Добавить свое упражнение':
-        return await choose_exercise_type(update, context)
-        
-    elif text == '🏁 Завершить тренировку':
-        return await show_finish_summary(update, context)
-        
-    else:
-        return await handle_training_menu_fallback(update, context)
+    """Обработка выбора в меню тренировки"""
+    from routing import dispatch
+
+    return await dispatch(TRAINING_MENU, update, context)
 
 async def handle_training_menu_fallback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка нераспознанных сообщений в меню тренировки"""
@@ -221,53 +191,37 @@ async def handle_training_menu_fallback(update: Update, context: ContextTypes.DE
     logger.info("TRAINING_MENU fallback для текста длиной %s", len(text or ""))
     
     # Показываем меню тренировки снова с подсказкой
-    keyboard = [
-        ['💪 Силовые упражнения', '🏃 Кардио'],
-        ['✏️ Добавить свое упражнение', '🏁 Завершить тренировку']
-    ]
-    
     await update.message.reply_text(
         "❌ Пожалуйста, используйте кнопки меню тренировки:\n\n"
         "Выберите тип упражнения:",
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup=TRAINING_MENU_KEYBOARD
     )
     
     return TRAINING_MENU
 
 async def handle_measurements_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка выбора ввода замеров перед тренировкой"""
-    choice = update.message.text
-    user_id = update.message.from_user.id
-    print(f"🔧 DEBUG INPUT_MEASUREMENTS_CHOICE: пользователь {user_id} выбрал '{choice}'")
-    
-    if choice == '📝 Ввести замеры':
-        await update.message.reply_text(
-            "📏 Введите ваши замеры в произвольном формате:\n"
-            "• Например: вес 65кг, талия 70см, грудь 95см\n"
-            "• Или: 65/70/95\n"
-            "• Или просто: 65кг",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return INPUT_MEASUREMENTS
-        
-    elif choice == '⏭️ Пропустить замеры':
-        print(f"🔧 DEBUG: пользователь {user_id} пропустил замеры, переходим к тренировке")
-        return await show_training_menu(update, context)
-        
-    elif choice == '🔙 Главное меню':
-        print(f"🔧 DEBUG: пользователь {user_id} вернулся в главное меню")
-        return await start(update, context)
-        
-    else:
-        # Если получен неизвестный текст, показываем клавиатуру снова
-        await update.message.reply_text(
-            "❌ Пожалуйста, используйте кнопки для выбора:",
-            reply_markup=ReplyKeyboardMarkup([
-                ['📝 Ввести замеры', '⏭️ Пропустить замеры'],
-                ['🔙 Главное меню']
-            ], resize_keyboard=True)
-        )
-        return INPUT_MEASUREMENTS_CHOICE
+    from routing import dispatch
+
+    return await dispatch(INPUT_MEASUREMENTS_CHOICE, update, context)
+
+async def ask_measurements(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text(
+        "📏 Введите ваши замеры в произвольном формате:\n"
+        "• Например: вес 65кг, талия 70см, грудь 95см\n"
+        "• Или: 65/70/95\n"
+        "• Или просто: 65кг",
+        reply_markup=ReplyKeyboardRemove()
+    )
+    return INPUT_MEASUREMENTS
+
+async def measurements_choice_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    # Если получен неизвестный текст, показываем клавиатуру снова
+    await update.message.reply_text(
+        "❌ Пожалуйста, используйте кнопки для выбора:",
+        reply_markup=MEASUREMENTS_CHOICE_KEYBOARD
+    )
+    return INPUT_MEASUREMENTS_CHOICE
 
 async def save_measurements(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Сохранение замеров пользователя"""
@@ -275,37 +229,33 @@ async def save_measurements(update: Update, context: ContextTypes.DEFAULT_TYPE)
     measurements_text = update.message.text
     training_id = context.user_data.get('training_id')
     
-    print(f"🔧 DEBUG save_measurements: пользователь {user_id} ввел замеры: '{measurements_text}'")
+    logger.debug("save_measurements: user=%s, длина текста %s", user_id, len(measurements_text or ""))
     
     if training_id:
         # Сохраняем замеры в тренировку
         success = save_training_measurements(training_id, measurements_text)
-        if success:
-            print(f"✅ Замеры сохранены для тренировки {training_id}")
-        else:
-            print(f"❌ Не удалось сохранить замеры для тренировки {training_id}")
+        if not success:
+            logger.warning("Не удалось сохранить замеры для тренировки %s", training_id)
     
     # Также сохраняем в отдельную таблицу замеров
-    save_success = save_measurement(user_id, measurements_text)
+    save_success = save_measurement(
+        user_id, measurements_text, idempotency_key=idempotency_key(update, "measurement")
+    )
     
     if save_success:
+        recognized = parse_measurements(measurements_text)
+        recognized_text = ", ".join(format_value(metric, value) for metric, (value, _) in recognized.items())
         await update.message.reply_text(
-            f"✅ Замеры сохранены!\n\n📏 Ваши замеры: {measurements_text}",
-            reply_markup=ReplyKeyboardMarkup([
-                ['💪 Силовые упражнения', '🏃 Кардио'],
-                ['✏️ Добавить свое упражнение', '🏁 Завершить тренировку']
-            ], resize_keyboard=True)
+            f"✅ Замеры сохранены!\n\n📏 Ваши замеры: {measurements_text}"
+            + (f"\n📊 Распознано: {recognized_text}" if recognized_text else ""),
+            reply_markup=TRAINING_MENU_KEYBOARD
         )
-        print(f"✅ Общие замеры пользователя {user_id} сохранены")
     else:
         await update.message.reply_text(
             "❌ Не удалось сохранить замеры. Переходим к тренировке...",
-            reply_markup=ReplyKeyboardMarkup([
-                ['💪 Силовые упражнения', '🏃 Кардио'],
-                ['✏️ Добавить свое упражнение', '🏁 Завершить тренировку']
-            ], resize_keyboard=True)
+            reply_markup=TRAINING_MENU_KEYBOARD
         )
-        print(f"❌ Не удалось сохранить общие замеры пользователя {user_id}")
+        logger.warning("Не удалось сохранить общие замеры пользователя %s", user_id)
     
     return TRAINING_MENU
 
@@ -316,20 +266,9 @@ async def show_strength_exercises(update: Update, context: ContextTypes.DEFAULT_
     user_id = update.message.from_user.id
     
     try:
-        all_strength_exercises = get_visible_exercise_lists(user_id)["strength"]
-        
-        # Создаем клавиатуру с упражнениями
-        keyboard = []
-        for i in range(0, len(all_strength_exercises), 2):
-            row = all_strength_exercises[i:i+2]
-            keyboard.append(row)
-        
-        keyboard.append(['✏️ Добавить силовое упражнение'])
-        keyboard.append(['🔙 Назад к тренировке'])
-        
         await update.message.reply_text(
             "💪 Выберите силовое упражнение:",
-            reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            reply_markup=strength_exercises_keyboard(user_id)
         )
         
         return CHOOSE_STRENGTH_EXERCISE
@@ -337,39 +276,32 @@ async def show_strength_exercises(update: Update, context: ContextTypes.DEFAULT_
     except Exception as e:
         logger.exception("Ошибка в show_strength_exercises: %s", e)
         # В случае ошибки возвращаемся в меню тренировки
-        keyboard = [
-            ['💪 Силовые упражнения', '🏃 Кардио'],
-            ['✏️ Добавить свое упражнение', '🏁 Завершить тренировку']
-        ]
         await update.message.reply_text(
             f"Ошибка при загрузке упражнений: {e}\nВозвращаюсь в меню тренировки...",
-            reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            reply_markup=TRAINING_MENU_KEYBOARD
         )
         return TRAINING_MENU
 
+async def ask_new_strength_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['adding_exercise_type'] = STRENGTH_TYPE
+    await update.message.reply_text(
+        "Введите название нового силового упражнения:",
+        reply_markup=ReplyKeyboardRemove()
+    )
+    return INPUT_NEW_STRENGTH_EXERCISE
+
 async def handle_strength_exercise_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка выбора силового упражнения"""
     exercise_name = update.message.text
 
-    # ОБРАБОТКА ДОБАВЛЕНИЯ НОВОГО УПРАЖНЕНИЯ
-    if exercise_name == '✏️ Добавить силовое упражнение':
-        context.user_data['adding_exercise_type'] = STRENGTH_TYPE
-        
-        await update.message.reply_text(
-            "Введите название нового силового упражнения:",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return INPUT_NEW_STRENGTH_EXERCISE
-    
-    if exercise_name == '🔙 Назад к тренировке':
-        return await show_training_menu(update, context)
-    
     # Сохраняем выбранное упражнение
     context.user_data['current_exercise'] = {
         'name': exercise_name,
         'type': STRENGTH_TYPE,
         'sets': []
     }
+    # Ключ упражнения — от апдейта выбора: повторное «💾 Сохранить» того же упражнения не создаст дубль
+    context.user_data['exercise_key'] = idempotency_key(update, "exercise")
     
     await update.message.reply_text(
         f"💪 Выбрано: {exercise_name}\n\n"
@@ -430,14 +362,12 @@ async def handle_set_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         if errors:
             error_text = "\n❌ Ошибки:\n" + "\n".join(errors) + "\n"
         
-        keyboard = [['✅ Добавить еще подходы', '💾 Сохранить упражнение'], ['❌ Отменить упражнение']]
-        
         await update.message.reply_text(
             f"{sets_text}\n"
             f"Всего подходов: {sets_count}\n"
             f"{error_text}\n"
             "Выберите действие:",
-            reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+            reply_markup=SETS_ACTIONS_KEYBOARD
         )
         
         return INPUT_SETS
@@ -477,10 +407,13 @@ async def save_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     
     exercise_data = context.user_data['current_exercise']
     
-    # Сохраняем упражнение в БД
-    success = add_exercise_to_training(training_id, exercise_data)
+    # Сохраняем упражнение в БД (при недоступности БД — в локальный журнал)
+    saved = journal.save_exercise(
+        training_id, exercise_data,
+        context.user_data.get('exercise_key') or idempotency_key(update, "exercise"),
+    )
     
-    if success:
+    if saved:
         # Формируем текст сохраненного упражнения
         exercise_text = f"💪 {exercise_data['name']}:\n"
         for i, set_data in enumerate(exercise_data['sets'], 1):
@@ -488,13 +421,11 @@ async def save_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         
         # Очищаем временные данные
         context.user_data.pop('current_exercise', None)
+        context.user_data.pop('exercise_key', None)
         
         await update.message.reply_text(
-            f"✅ Упражнение сохранено!\n\n{exercise_text}",
-            reply_markup=ReplyKeyboardMarkup([
-                ['💪 Силовые упражнения', '🏃 Кардио'],
-                ['✏️ Добавить свое упражнение', '🏁 Завершить тренировку']
-            ], resize_keyboard=True)
+            f"✅ Упражнение сохранено!{QUEUED_NOTE if saved == 'queued' else ''}\n\n{exercise_text}",
+            reply_markup=TRAINING_MENU_KEYBOARD
         )
     else:
         await update.message.reply_text("❌ Не удалось сохранить упражнение.")
@@ -506,88 +437,70 @@ async def save_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 async def show_cardio_exercises(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Показать кардио упражнения"""
     user_id = update.message.from_user.id
-    all_cardio_exercises = get_visible_exercise_lists(user_id)["cardio"]
-    
-    keyboard = [[exercise] for exercise in all_cardio_exercises]
-    keyboard.append(['✏️ Добавить кардио упражнение'])
-    keyboard.append(['🔙 Назад к тренировке'])
-    
     await update.message.reply_text(
         "🏃 Выберите кардио упражнение:",
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup=cardio_exercises_keyboard(user_id)
     )
     return CHOOSE_CARDIO_EXERCISE
 
+async def ask_new_cardio_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['adding_exercise_type'] = CARDIO_TYPE
+    await update.message.reply_text(
+        "Введите название нового кардио упражнения:",
+        reply_markup=ReplyKeyboardRemove()
+    )
+    return INPUT_NEW_CARDIO_EXERCISE
+
 async def handle_cardio_exercise_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка выбора кардио упражнения"""
     exercise_name = update.message.text
     
-    if exercise_name == '✏️ Добавить кардио упражнение':
-        
-        context.user_data['adding_exercise_type'] = CARDIO_TYPE
-        
-        await update.message.reply_text(
-            "Введите название нового кардио упражнения:",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return INPUT_NEW_CARDIO_EXERCISE
-    
-    if exercise_name == '🔙 Назад к тренировке':
-        return await show_training_menu(update, context)
-    
     # Сохраняем выбранное кардио упражнение
     context.user_data['current_exercise'] = {
         'name': exercise_name,
         'type': CARDIO_TYPE
     }
-    
-    keyboard = [
-        ['⏱️ Мин/Метры', '🚀 Км/Час'],
-        ['🔙 Назад к кардио']
-    ]
+    context.user_data['exercise_key'] = idempotency_key(update, "exercise")
     
     await update.message.reply_text(
         f"🏃 Выбрано: {exercise_name}\n\n"
         "Выберите формат ввода:",
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup=CARDIO_FORMAT_KEYBOARD
     )
     return CARDIO_TYPE_SELECTION
 
 async def handle_cardio_type_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка выбора формата кардио"""
-    choice = update.message.text
-    
-    if choice == '🔙 Назад к кардио':
-        return await show_cardio_exercises(update, context)
-    
-    if choice not in ['⏱️ Мин/Метры', '🚀 Км/Час']:
-        await update.message.reply_text(
-            "❌ Пожалуйста, используйте кнопки для выбора формата",
-            reply_markup=ReplyKeyboardMarkup([
-                ['⏱️ Мин/Метры', '🚀 Км/Час'],
-                ['🔙 Назад к кардио']
-            ], resize_keyboard=True)
-        )
-        return CARDIO_TYPE_SELECTION
-    
-    context.user_data['cardio_format'] = choice
-    
-    if choice == '⏱️ Мин/Метры':
-        await update.message.reply_text(
-            "Введите время и дистанцию в формате:\n"
-            "**Время_в_минутах Дистанция_в_метрах**\n\n"
-            "📝 Пример: 30 5000 (30 минут, 5000 метров)",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return INPUT_CARDIO_MIN_METERS
-    elif choice == '🚀 Км/Час':
-        await update.message.reply_text(
-            "Введите время и скорость в формате:\n"
-            "**Время_в_минутах Скорость_км/ч**\n\n"
-            "📝 Пример: 30 10 (30 минут, 10 км/ч)",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return INPUT_CARDIO_KM_H
+    from routing import dispatch
+
+    return await dispatch(CARDIO_TYPE_SELECTION, update, context)
+
+async def ask_cardio_min_meters(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['cardio_format'] = update.message.text
+    await update.message.reply_text(
+        "Введите время и дистанцию в формате:\n"
+        "**Время_в_минутах Дистанция_в_метрах**\n\n"
+        "📝 Пример: 30 5000 (30 минут, 5000 метров)",
+        reply_markup=ReplyKeyboardRemove()
+    )
+    return INPUT_CARDIO_MIN_METERS
+
+async def ask_cardio_km_h(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['cardio_format'] = update.message.text
+    await update.message.reply_text(
+        "Введите время и скорость в формате:\n"
+        "**Время_в_минутах Скорость_км/ч**\n\n"
+        "📝 Пример: 30 10 (30 минут, 10 км/ч)",
+        reply_markup=ReplyKeyboardRemove()
+    )
+    return INPUT_CARDIO_KM_H
+
+async def cardio_type_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text(
+        "❌ Пожалуйста, используйте кнопки для выбора формата",
+        reply_markup=CARDIO_FORMAT_KEYBOARD
+    )
+    return CARDIO_TYPE_SELECTION
 
 async def handle_cardio_min_meters_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработка ввода кардио в формате минуты/метры"""
@@ -633,20 +546,22 @@ async def save_cardio_exercise(update: Update, context: ContextTypes.DEFAULT_TYP
                 'details': f"{time_minutes} минут, {value} км/ч"
             })
         
-        # Сохраняем упражнение в БД
-        success = add_exercise_to_training(training_id, exercise_data)
+        # Сохраняем упражнение в БД (при недоступности БД — в локальный журнал)
+        saved = journal.save_exercise(
+            training_id, exercise_data,
+            context.user_data.get('exercise_key') or idempotency_key(update, "exercise"),
+        )
         
-        if success:
+        if saved:
             # Очищаем временные данные
             context.user_data.pop('current_exercise', None)
+            context.user_data.pop('exercise_key', None)
             context.user_data.pop('cardio_format', None)
             
             await update.message.reply_text(
-                f"✅ Кардио сохранено!\n{exercise_data['name']}: {exercise_data['details']}",
-                reply_markup=ReplyKeyboardMarkup([
-                    ['💪 Силовые упражнения', '🏃 Кардио'],
-                    ['✏️ Добавить свое упражнение', '🏁 Завершить тренировку']
-                ], resize_keyboard=True)
+                f"✅ Кардио сохранено!{QUEUED_NOTE if saved == 'queued' else ''}\n"
+                f"{exercise_data['name']}: {exercise_data['details']}",
+                reply_markup=TRAINING_MENU_KEYBOARD
             )
         else:
             await update.message.reply_text("❌ Не удалось сохранить кардио.")
@@ -673,48 +588,24 @@ async def save_cardio_exercise(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def choose_exercise_type(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Выбор типа упражнения для добавления"""
-    keyboard = [
-        ['💪 Силовое упражнение', '🏃 Кардио упражнение'],
-        ['🔙 Назад к тренировке']
-    ]
-    
     await update.message.reply_text(
         "Выберите тип упражнения для добавления:",
-        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+        reply_markup=ADD_EXERCISE_TYPE_KEYBOARD
     )
     return ADD_EXERCISE_TYPE
 
 async def add_custom_exercise_from_training(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Добавление пользовательского упражнения из тренировки"""
-    choice = update.message.text
-    
-    if choice == '🔙 Назад к тренировке':
-        return await show_training_menu(update, context)
-    
-    if '💪 Силовое' in choice:
-        context.user_data['adding_exercise_type'] = STRENGTH_TYPE
-        await update.message.reply_text(
-            "Введите название нового силового упражнения:",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return INPUT_NEW_STRENGTH_EXERCISE
-        
-    elif '🏃 Кардио' in choice:
-        context.user_data['adding_exercise_type'] = CARDIO_TYPE
-        await update.message.reply_text(
-            "Введите название нового кардио упражнения:",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        return INPUT_NEW_CARDIO_EXERCISE
-    else:
-        await update.message.reply_text(
-            "❌ Пожалуйста, используйте кнопки для выбора типа упражнения",
-            reply_markup=ReplyKeyboardMarkup([
-                ['💪 Силовое упражнение', '🏃 Кардио упражнение'],
-                ['🔙 Назад к тренировке']
-            ], resize_keyboard=True)
-        )
-        return ADD_EXERCISE_TYPE
+    from routing import dispatch
+
+    return await dispatch(ADD_EXERCISE_TYPE, update, context)
+
+async def add_exercise_type_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text(
+        "❌ Пожалуйста, используйте кнопки для выбора типа упражнения",
+        reply_markup=ADD_EXERCISE_TYPE_KEYBOARD
+    )
+    return ADD_EXERCISE_TYPE
 
 async def save_new_exercise_from_training(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Сохранение нового упражнения из тренировки"""
@@ -762,11 +653,7 @@ async def show_training_history(update: Update, context: ContextTypes.DEFAULT_TY
         info_text = "💾 Все ваши будущие тренировки будут автоматически сохраняться в базе данных."
         await update.message.reply_text(
             f"📝 У вас пока нет завершенных тренировок.\n\n{info_text}",
-            reply_markup=ReplyKeyboardMarkup([
-                ['💪 Начать тренировку', '📊 История тренировок'],
-                ['📝 Мои упражнения', '📈 Статистика', '📏 Мои замеры'],
-                ['📤 Выгрузка данных', '❓ Помощь']
-            ], resize_keyboard=True)
+            reply_markup=MAIN_MENU_KEYBOARD
         )
         return MAIN_MENU
     
@@ -795,14 +682,12 @@ async def cancel_exercise(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Отмена текущего упражнения"""
     exercise_name = context.user_data.get('current_exercise', {}).get('name', 'упражнение')
     context.user_data.pop('current_exercise', None)
+    context.user_data.pop('exercise_key', None)
     context.user_data.pop('cardio_format', None)
     
     await update.message.reply_text(
         f"❌ {exercise_name} - удалено",
-        reply_markup=ReplyKeyboardMarkup([
-            ['💪 Силовые упражнения', '🏃 Кардио'],
-            ['✏️ Добавить свое упражнение', '🏁 Завершить тренировку']
-        ], resize_keyboard=True)
+        reply_markup=TRAINING_MENU_KEYBOARD
     )
     
     return TRAINING_MENU
@@ -815,10 +700,7 @@ async def continue_training(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if not current_training:
         await update.message.reply_text(
             "❌ Текущая тренировка не найдена. Начинаем новую.",
-            reply_markup=ReplyKeyboardMarkup([
-                ['💪 Силовые упражнения', '🏃 Кардио'],
-                ['✏️ Добавить свое упражнение', '🏁 Завершить тренировку']
-            ], resize_keyboard=True)
+            reply_markup=TRAINING_MENU_KEYBOARD
         )
         return TRAINING_MENU
     
@@ -833,56 +715,6 @@ async def continue_training(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     await update.message.reply_text(
         training_info,
-        reply_markup=ReplyKeyboardMarkup([
-            ['💪 Силовые упражнения', '🏃 Кардио'],
-            ['✏️ Добавить свое упражнение', '🏁 Завершить тренировку']
-        ], resize_keyboard=True)
+        reply_markup=TRAINING_MENU_KEYBOARD
     )
     return TRAINING_MENU
-
-async def handle_training_menu_simple(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Упрощенный обработчик меню тренировки"""
-    text = update.message.text
-    
-    if text == '💪 Силовые упражнения':
-        await update.message.reply_text("✅ Переходим к силовым упражнениям!")
-        return await show_strength_exercises(update, context)
-    elif text == '🏃 Кардио':
-        await update.message.reply_text("✅ Переходим к кардио!")
-        return await show_cardio_exercises(update, context)
-    elif text == '✏️ Добавить свое упражнение':
-        await update.message.reply_text("✅ Добавляем упражнение!")
-        return await choose_exercise_type(update, context)
-    elif text == '🏁 Завершить тренировку':
-        await update.message.reply_text("✅ Завершаем тренировку!")
-        return await show_finish_summary(update, context)
-    else:
-        # Показываем меню снова
-        keyboard = [
-            ['💪 Силовые упражнения', '🏃 Кардио'],
-            ['✏️ Добавить свое упражнение', '🏁 Завершить тренировку']
-        ]
-        
-        await update.message.reply_text(
-            f"Получено: '{text}'. Используйте кнопки тренировки:",
-            reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        )
-        return TRAINING_MENU
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
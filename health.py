@@ -0,0 +1,170 @@
+"""
+Проверки живости и готовности для платформы (Railway/Render/Kubernetes).
+
+    GET /healthz — процесс жив и event loop отвечает (200, пока лаг цикла приемлем)
+    GET /readyz  — бот может работать: БД и Telegram доступны, polling свежий (иначе 503)
+
+Обе ручки только читают закэшированное состояние: проверки БД и Telegram выполняются
+фоновой задачей раз в HEALTH_PROBE_INTERVAL секунд, поэтому частые запросы платформы
+не добавляют нагрузки на PostgreSQL и Bot API.
+
+Переменные окружения:
+    HEALTH_PROBE_INTERVAL — период фоновых проверок, сек (15)
+    HEALTH_MAX_LOOP_LAG   — лаг event loop, после которого /healthz отвечает 503, сек (5)
+    HEALTH_POLL_MAX_AGE   — максимальный возраст последнего успешного getUpdates, сек (120)
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+
+from metrics import set_gauge
+
+logger = logging.getLogger(__name__)
+
+PROBE_INTERVAL = float(os.getenv('HEALTH_PROBE_INTERVAL', '15'))
+MAX_LOOP_LAG = float(os.getenv('HEALTH_MAX_LOOP_LAG', '5'))
+POLL_MAX_AGE = float(os.getenv('HEALTH_POLL_MAX_AGE', '120'))
+
+_LAG_TICK = 0.5
+
+_application = None
+_started_at = time.monotonic()
+_loop_lag = {"current": 0.0, "max_recent": 0.0}
+_probes = {
+    "database": {"ok": None, "latency_ms": None, "checked_ago_s": None},
+    "telegram": {"ok": None, "pending_update_count": None, "checked_ago_s": None},
+}
+_probe_times = {}
+_last_update_at = None
+
+# Дополнительные источники состояния (circuit breaker, пул соединений, ...): имя -> () -> dict
+_status_providers = {}
+
+
+def add_status_provider(name: str, provider):
+    """Добавить раздел в ответ /readyz (функция без аргументов, возвращает dict)."""
+    _status_providers[name] = provider
+
+
+def record_poll():
+    """Успешный getUpdates (или апдейт от ingress у воркера)."""
+    global _last_update_at
+    _last_update_at = time.monotonic()
+
+
+async def _watch_loop_lag():
+    """Сколько event loop опаздывает с пробуждением по таймеру — мера его загруженности."""
+    window_max = 0.0
+    ticks = 0
+    while True:
+        expected = time.monotonic() + _LAG_TICK
+        await asyncio.sleep(_LAG_TICK)
+        lag = max(0.0, time.monotonic() - expected)
+        window_max = max(window_max, lag)
+        _loop_lag["current"] = lag
+        _loop_lag["max_recent"] = window_max
+        set_gauge("event_loop_lag_seconds", lag)
+        ticks += 1
+        if ticks * _LAG_TICK >= 60:
+            window_max, ticks = 0.0, 0
+
+
+async def _probe_database():
+    from database import ping_database
+
+    started = time.perf_counter()
+    ok = await asyncio.to_thread(ping_database)
+    _probes["database"].update(ok=ok, latency_ms=round((time.perf_counter() - started) * 1000, 1))
+    _probe_times["database"] = time.monotonic()
+
+
+async def _probe_telegram():
+    try:
+        info = await _application.bot.get_webhook_info()
+        _probes["telegram"].update(ok=True, pending_update_count=info.pending_update_count)
+    except Exception as e:
+        logger.warning("Проверка Telegram не прошла: %s", e)
+        _probes["telegram"].update(ok=False)
+    _probe_times["telegram"] = time.monotonic()
+
+
+async def _probe_forever():
+    while True:
+        await asyncio.gather(_probe_database(), _probe_telegram(), return_exceptions=True)
+        set_gauge("health_database_ok", int(bool(_probes["database"]["ok"])))
+        set_gauge("health_telegram_ok", int(bool(_probes["telegram"]["ok"])))
+        await asyncio.sleep(PROBE_INTERVAL)
+
+
+def _age(moment):
+    return None if moment is None else round(time.monotonic() - moment, 1)
+
+
+def snapshot():
+    """Текущее состояние без обращений к внешним сервисам."""
+    for name, probe in _probes.items():
+        probe["checked_ago_s"] = _age(_probe_times.get(name))
+    status = {
+        "uptime_s": round(time.monotonic() - _started_at, 1),
+        "event_loop_lag_ms": {
+            "current": round(_loop_lag["current"] * 1000, 1),
+            "max_recent": round(_loop_lag["max_recent"] * 1000, 1),
+        },
+        "update_queue": _application.update_queue.qsize() if _application else None,
+        "last_poll_ago_s": _age(_last_update_at),
+        **{name: dict(probe) for name, probe in _probes.items()},
+    }
+    for name, provider in _status_providers.items():
+        try:
+            status[name] = provider()
+        except Exception as e:
+            status[name] = {"error": str(e)}
+    return status
+
+
+def _json(status_code, payload):
+    return status_code, "application/json", json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+async def _healthz(body: bytes):
+    lag = _loop_lag["current"]
+    return _json(200 if lag < MAX_LOOP_LAG else 503, {
+        "status": "ok" if lag < MAX_LOOP_LAG else "lagging",
+        "event_loop_lag_ms": round(lag * 1000, 1),
+    })
+
+
+async def _readyz(body: bytes):
+    status = snapshot()
+    problems = []
+    if status["database"]["ok"] is False:
+        problems.append("database")
+    if status["telegram"]["ok"] is False:
+        problems.append("telegram")
+    poll_age = status["last_poll_ago_s"]
+    # Без polling (воркер кластера) свежесть апдейтов не проверяем: их может просто не быть
+    if _application is not None and _application.updater is not None:
+        stale = poll_age > POLL_MAX_AGE if poll_age is not None else status["uptime_s"] > POLL_MAX_AGE
+        if stale:
+            problems.append("polling")
+    status["status"] = "ok" if not problems else "degraded"
+    status["problems"] = problems
+    return _json(200 if not problems else 503, status)
+
+
+def register_http_routes():
+    """Подключить /healthz и /readyz к служебному HTTP-серверу."""
+    from http_server import add_route
+
+    add_route("GET", "/healthz", _healthz)
+    add_route("GET", "/readyz", _readyz)
+
+
+def start_health_monitor(application):
+    """Запустить фоновое измерение лага цикла и кэшируемые проверки зависимостей."""
+    global _application
+    _application = application
+    application.create_task(_watch_loop_lag())
+    application.create_task(_probe_forever())
@@ -0,0 +1,73 @@
+"""
+Холодный архив истории: старые тренировки в сжатом виде, блок на пользователя и месяц.
+
+Тренировки старше ARCHIVE_AFTER_MONTHS месяцев задача планировщика "history_archive"
+(maintenance.py) переносит из trainings и training_exercises в training_archive — по
+строке (user_id, месяц) со сжатым zlib JSON-массивом тренировок вместе с упражнениями.
+Горячие таблицы и их индексы остаются размером в последние месяцы, а архивная строка
+занимает в разы меньше места, чем те же тренировки построчно с индексами.
+
+Чтение прозрачное: get_user_trainings (история, экспорт) дочитывает архив, когда
+горячих тренировок меньше limit, а get_user_exercise_rows (статистика за всё время)
+добавляет архивные строки к горячим. Агрегаты прогресса (exercise_progress,
+exercise_records) и замеры не архивируются.
+"""
+import json
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+
+# Поля тренировки в блоке; упражнения — строки в порядке EXERCISE_FIELDS
+TRAINING_FIELDS = ("training_id", "date_start", "date_end", "comment", "measurements", "exercises")
+EXERCISE_FIELDS = (
+    "exercise_id", "name", "type", "sets", "time_minutes", "distance_meters", "speed_kmh", "details",
+)
+
+COMPRESSION_LEVEL = 6
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} не сериализуется в архив")
+
+
+def pack(trainings) -> bytes:
+    """Сжать список тренировок [[training_id, date_start, ..., [упражнения]]]."""
+    data = json.dumps(trainings, default=_default, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(data.encode(), COMPRESSION_LEVEL)
+
+
+def unpack(blob) -> list:
+    """Тренировки блока с datetime в date_start и date_end."""
+    trainings = json.loads(zlib.decompress(bytes(blob)))
+    for training in trainings:
+        training[1] = datetime.fromisoformat(training[1])
+        training[2] = datetime.fromisoformat(training[2]) if training[2] else None
+    return trainings
+
+
+def merge(*blocks) -> list:
+    """Объединить тренировки нескольких блоков без повторов, по времени начала."""
+    by_id = {}
+    for block in blocks:
+        for training in block:
+            by_id[training[0]] = training
+    return sorted(by_id.values(), key=lambda training: (training[1], training[0]))
+
+
+def month_of(moment) -> date:
+    return date(moment.year, moment.month, 1)
+
+
+def exercise_rows(trainings) -> list:
+    """Строки для analytics.from_rows: (training_id, date_start, name, type, sets), как в get_user_exercise_rows."""
+    rows = []
+    for training_id, date_start, *_, exercises in trainings:
+        if not exercises:
+            rows.append((training_id, date_start, None, None, None))
+        for exercise in exercises:
+            rows.append((training_id, date_start, exercise[1], exercise[2], exercise[3]))
+    return rows
@@ -0,0 +1,80 @@
+"""Минимальный HTTP-сервер на asyncio для служебных эндпоинтов (без внешних зависимостей)."""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+_STATUS_TEXT = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+# (method, path) -> (async handler(body: bytes[, headers: dict]) -> (status, content_type, payload: bytes),
+#                    передавать ли заголовки)
+_routes = {}
+
+
+def add_route(method: str, path: str, handler, with_headers: bool = False):
+    """Зарегистрировать обработчик служебного эндпоинта (with_headers — вторым аргументом
+    передаются заголовки запроса, имена в нижнем регистре)."""
+    _routes[(method.upper(), path)] = (handler, with_headers)
+
+
+async def _handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        parts = request_line.decode("latin-1").split()
+        if len(parts) < 2:
+            return
+        method, path = parts[0].upper(), parts[1].split("?", 1)[0]
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        content_length = int(headers.get("content-length") or 0)
+        body = await reader.readexactly(content_length) if content_length else b""
+
+        route = _routes.get((method, path))
+        if route is None:
+            known_path = any(p == path for _, p in _routes)
+            status, content_type, payload = (405 if known_path else 404), "text/plain", b""
+        else:
+            handler, with_headers = route
+            try:
+                if with_headers:
+                    status, content_type, payload = await handler(body, headers)
+                else:
+                    status, content_type, payload = await handler(body)
+            except Exception:
+                logger.exception("Ошибка служебного эндпоинта %s %s", method, path)
+                status, content_type, payload = 500, "text/plain", b""
+
+        head = (
+            f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_http_server(port: int, host: str = "0.0.0.0"):
+    """Запустить сервер в текущем event loop. Возвращает asyncio.Server."""
+    server = await asyncio.start_server(_handle_client, host, port)
+    logger.info("Служебный HTTP-сервер слушает %s:%s", host, port)
+    return server
@@ -0,0 +1,235 @@
+"""
+Локальный журнал записей тренировки на случай недоступности PostgreSQL.
+
+Если упражнение не удалось записать из-за недоступности БД (сетевой сбой, разомкнутый
+circuit breaker) или у этой тренировки в журнале уже есть неотправленные записи — чтобы
+не нарушить порядок, — оно дописывается в SQLite-файл на диске и пользователь сразу
+получает подтверждение. Постоянные ошибки (тренировка удалена, нарушено ограничение)
+в журнал не попадают: пользователь видит, что упражнение не сохранено. Фоновая задача
+replay_forever отправляет записи по порядку внутри каждой тренировки, как только circuit
+breaker снова пропускает запросы; неудача одной тренировки не задерживает остальные.
+Каждая запись несёт ключ идемпотентности: повторная отправка не создаёт дубликатов,
+даже если предыдущая попытка дошла до БД, но ответ потерялся.
+
+Переменные окружения:
+    JOURNAL_PATH            — файл журнала (bot_journal_<WORKER_INDEX>.sqlite3)
+    JOURNAL_REPLAY_INTERVAL — период попыток отправки, сек (5)
+    JOURNAL_MAX_ATTEMPTS    — после стольких временных сбоев запись откладывается как «failed» (20)
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from database import STRENGTH_TYPE, add_exercise_to_training, call_noting_transient, database_available
+from metrics import inc, set_gauge
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATH = os.getenv('JOURNAL_PATH') or f"bot_journal_{os.getenv('WORKER_INDEX', '0')}.sqlite3"
+REPLAY_INTERVAL = float(os.getenv('JOURNAL_REPLAY_INTERVAL', '5'))
+MAX_ATTEMPTS = int(os.getenv('JOURNAL_MAX_ATTEMPTS', '20'))
+
+_lock = threading.Lock()
+_conn = None
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(JOURNAL_PATH, check_same_thread=False, isolation_level=None)
+        # WAL + synchronous=NORMAL: запись без fsync на каждый коммит, но без потерь при падении процесса
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                training_id INTEGER
+            )
+            """
+        )
+        # Журналы, созданные до появления столбца training_id
+        columns = {row[1] for row in _conn.execute("PRAGMA table_info(journal)")}
+        if "training_id" not in columns:
+            _conn.execute("ALTER TABLE journal ADD COLUMN training_id INTEGER")
+            _conn.execute("UPDATE journal SET training_id = json_extract(payload, '$.training_id')")
+        _conn.execute("CREATE INDEX IF NOT EXISTS journal_pending_training ON journal (training_id, op, status)")
+    return _conn
+
+
+def _append(op, payload, key):
+    with _lock:
+        _db().execute(
+            "INSERT OR IGNORE INTO journal (op, idempotency_key, payload, created_at, training_id)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (op, key, json.dumps(payload, ensure_ascii=False, default=str), time.time(), payload["training_id"]),
+        )
+    inc("journal_appended_total", op=op)
+    _update_gauge()
+
+
+def _pending(limit=None):
+    with _lock:
+        sql = "SELECT seq, op, idempotency_key, payload, attempts FROM journal WHERE status = 'pending' ORDER BY seq"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return _db().execute(sql).fetchall()
+
+
+def pending_count() -> int:
+    with _lock:
+        return _db().execute("SELECT COUNT(*) FROM journal WHERE status = 'pending'").fetchone()[0]
+
+
+def _update_gauge():
+    set_gauge("journal_pending", pending_count())
+
+
+def status() -> dict:
+    """Раздел для /readyz."""
+    with _lock:
+        rows = dict(_db().execute("SELECT status, COUNT(*) FROM journal GROUP BY status").fetchall())
+        oldest = _db().execute("SELECT MIN(created_at) FROM journal WHERE status = 'pending'").fetchone()[0]
+    return {
+        "path": JOURNAL_PATH,
+        "pending": rows.get("pending", 0),
+        "failed": rows.get("failed", 0),
+        "oldest_pending_age_s": round(time.time() - oldest, 1) if oldest else None,
+    }
+
+
+# ==================== ОПЕРАЦИИ ====================
+
+def _apply_add_exercise(payload, key):
+    """(успех, временный ли сбой)."""
+    return call_noting_transient(
+        add_exercise_to_training, payload["training_id"], payload["exercise"], idempotency_key=key,
+    )
+
+
+_OPS = {
+    "add_exercise": _apply_add_exercise,
+}
+
+
+def _order_key(op, payload):
+    """Записи с одним ключом отправляются строго по порядку (упражнения — в пределах тренировки)."""
+    return (op, payload["training_id"])
+
+
+def _has_pending(op, payload) -> bool:
+    with _lock:
+        return _db().execute(
+            "SELECT 1 FROM journal WHERE status = 'pending' AND op = ? AND training_id = ? LIMIT 1",
+            (op, payload["training_id"]),
+        ).fetchone() is not None
+
+
+def save_exercise(training_id, exercise_data, idempotency_key=None) -> str:
+    """Записать упражнение: сразу в БД, а если не вышло — в журнал.
+
+    Возвращает "saved" (в БД), "queued" (в журнале, уйдёт в БД позже) или "" (не сохранено).
+    """
+    key = idempotency_key or uuid.uuid4().hex
+    payload = {"training_id": training_id, "exercise": exercise_data}
+    try:
+        # Пока у тренировки есть неотправленное, её новые записи идут следом — порядок сохраняется
+        if not _has_pending("add_exercise", payload):
+            ok, transient = _apply_add_exercise(payload, key)
+            if ok:
+                return "saved"
+            if not transient:
+                return ""
+        _append("add_exercise", payload, key)
+        logger.warning("Упражнение тренировки %s записано в локальный журнал", training_id)
+        return "queued"
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка записи в локальный журнал: {e}")
+        return ""
+
+
+def pending_exercises(training_id) -> list:
+    """Неотправленные упражнения тренировки — в формате get_training_exercises."""
+    with _lock:
+        rows = _db().execute(
+            "SELECT payload FROM journal WHERE status = 'pending' AND op = 'add_exercise' AND training_id = ?"
+            " ORDER BY seq",
+            (training_id,),
+        ).fetchall()
+    exercises = []
+    for (payload,) in rows:
+        exercise = dict(json.loads(payload)["exercise"])
+        exercise["is_cardio"] = exercise.get("type") != STRENGTH_TYPE
+        exercise["pending"] = True
+        exercises.append(exercise)
+    return exercises
+
+
+# ==================== ОТПРАВКА В БД ====================
+
+def _fail(seq, op, reason):
+    _db().execute(
+        "UPDATE journal SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE seq = ?",
+        (reason, seq),
+    )
+    logger.error("Запись журнала %s (%s) не отправлена: %s", seq, op, reason)
+
+
+def replay_pending(batch_size: int = 100) -> int:
+    """Отправить записи журнала по порядку внутри каждой тренировки. После временного сбоя
+    остальные записи той же тренировки ждут следующего раза, другие — отправляются.
+    Возвращает число отправленных."""
+    sent = 0
+    blocked = set()
+    for seq, op, key, payload, attempts in _pending(batch_size):
+        if not database_available():
+            break
+        data = json.loads(payload)
+        order_key = _order_key(op, data)
+        if order_key in blocked:
+            continue
+        ok, transient = _OPS[op](data, key)
+        with _lock:
+            if ok:
+                _db().execute("DELETE FROM journal WHERE seq = ?", (seq,))
+            elif not transient:
+                # Повтор не поможет (тренировка удалена, нарушено ограничение) — для ручного разбора
+                _fail(seq, op, "permanent error")
+            elif attempts + 1 >= MAX_ATTEMPTS:
+                _fail(seq, op, f"{MAX_ATTEMPTS} attempts")
+            else:
+                _db().execute("UPDATE journal SET attempts = attempts + 1 WHERE seq = ?", (seq,))
+                blocked.add(order_key)
+        if not ok:
+            inc("journal_replay_errors_total", op=op, kind="transient" if transient else "permanent")
+            continue
+        sent += 1
+        inc("journal_replayed_total", op=op)
+    if sent:
+        logger.info("Из локального журнала отправлено в БД записей: %s", sent)
+    _update_gauge()
+    return sent
+
+
+async def replay_forever(interval: float = REPLAY_INTERVAL):
+    """Фоновая задача: досылать журнал, пока он не опустеет; затем ждать новых записей."""
+    _update_gauge()
+    while True:
+        try:
+            if pending_count():
+                await asyncio.to_thread(replay_pending)
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки локального журнала: {e}")
+        await asyncio.sleep(interval)
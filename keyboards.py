@@ -0,0 +1,174 @@
+"""
+Реестр клавиатур.
+
+Статические клавиатуры собираются один раз при импорте; объекты telegram неизменяемы,
+поэтому один экземпляр безопасно отдавать во все ответы. Клавиатуры каталога упражнений
+строятся из get_visible_exercise_lists (кэш по версии каталога пользователя) и
+мемоизируются по содержимому — пользователи с одинаковым каталогом делят один объект.
+"""
+from functools import lru_cache
+
+from telegram import ReplyKeyboardMarkup
+
+from database import get_visible_exercise_lists
+
+
+def _kb(rows, one_time=False):
+    return ReplyKeyboardMarkup(rows, resize_keyboard=True, one_time_keyboard=one_time)
+
+
+# ==================== ОБЩИЕ ====================
+
+MAIN_MENU_KEYBOARD = _kb([
+    ['💪 Начать тренировку', '📊 История тренировок'],
+    ['📝 Мои упражнения', '📈 Статистика', '📏 Мои замеры'],
+    ['📤 Выгрузка данных', '❓ Помощь'],
+])
+
+WELCOME_NEW_USER_KEYBOARD = _kb([['🚀 Начать']], one_time=True)
+
+WELCOME_WITH_TRAINING_KEYBOARD = _kb([
+    ['🏃‍♂️ Продолжить тренировку'],
+    ['🆕 Начать новую тренировку'],
+    ['🗑️ Очистить историю'],
+], one_time=True)
+
+WELCOME_WITHOUT_TRAINING_KEYBOARD = _kb([
+    ['🚀 Продолжить'],
+    ['🗑️ Очистить историю'],
+], one_time=True)
+
+CONTINUE_KEYBOARD = _kb([['🚀 Продолжить']])
+
+CLEAR_DATA_CONFIRM_KEYBOARD = _kb([
+    ['✅ Да, удалить все данные'],
+    ['❌ Отмена'],
+])
+
+# ==================== ТРЕНИРОВКА ====================
+
+TRAINING_MENU_KEYBOARD = _kb([
+    ['💪 Силовые упражнения', '🏃 Кардио'],
+    ['✏️ Добавить свое упражнение', '🏁 Завершить тренировку'],
+])
+
+MEASUREMENTS_CHOICE_KEYBOARD = _kb([
+    ['📝 Ввести замеры', '⏭️ Пропустить замеры'],
+    ['🔙 Главное меню'],
+])
+
+FINISH_CONFIRM_KEYBOARD = _kb([
+    ['✅ Точно завершить', '✏️ Скорректировать'],
+    ['🔙 Продолжить тренировку'],
+])
+
+FINISH_CONFIRM_SHORT_KEYBOARD = _kb([
+    ['✅ Точно завершить'],
+    ['🔙 Продолжить тренировку'],
+])
+
+SETS_ACTIONS_KEYBOARD = _kb([
+    ['✅ Добавить еще подходы', '💾 Сохранить упражнение'],
+    ['❌ Отменить упражнение'],
+])
+
+CARDIO_FORMAT_KEYBOARD = _kb([
+    ['⏱️ Мин/Метры', '🚀 Км/Час'],
+    ['🔙 Назад к кардио'],
+])
+
+ADD_EXERCISE_TYPE_KEYBOARD = _kb([
+    ['💪 Силовое упражнение', '🏃 Кардио упражнение'],
+    ['🔙 Назад к тренировке'],
+])
+
+MEASUREMENTS_KEYBOARD = _kb([
+    ['📉 Динамика замеров'],
+    ['🔙 Главное меню'],
+])
+
+# ==================== УПРАВЛЕНИЕ УПРАЖНЕНИЯМИ ====================
+
+EXERCISES_MANAGEMENT_KEYBOARD = _kb([
+    ['➕ Добавить упражнение', '🗑️ Удалить упражнение'],
+    ['🔙 Главное меню'],
+])
+
+ADD_EXERCISE_TYPE_MGMT_KEYBOARD = _kb([
+    ['💪 Силовое упражнение', '🏃 Кардио упражнение'],
+    ['🔙 Назад к управлению упражнениями'],
+])
+
+# ==================== СТАТИСТИКА И ВЫГРУЗКА ====================
+
+STATS_MENU_KEYBOARD = _kb([
+    ['📊 Общая статистика', '📅 Текущая неделя'],
+    ['📅 Текущий месяц', '📅 Текущий год'],
+    ['📋 Статистика по упражнениям', '📈 Прогресс по упражнению'],
+    ['📉 Графики', '🔙 Главное меню'],
+])
+
+CHARTS_KEYBOARD = _kb([
+    ['📊 Тренировки по неделям', '🏋️ Объём по упражнениям'],
+    ['⚖️ Вес тела'],
+    ['🔙 Назад к статистике'],
+])
+
+EXPORT_MENU_KEYBOARD = _kb([
+    ['📗 Excel — вся история', '📗 Excel — текущий месяц'],
+    ['📄 CSV — вся история', '📄 CSV — текущий месяц'],
+    ['🔙 Главное меню'],
+])
+
+
+# ==================== КАТАЛОГ УПРАЖНЕНИЙ ====================
+
+@lru_cache(maxsize=512)
+def _strength_keyboard(names: tuple):
+    rows = [list(names[i:i + 2]) for i in range(0, len(names), 2)]
+    rows.append(['✏️ Добавить силовое упражнение'])
+    rows.append(['🔙 Назад к тренировке'])
+    return _kb(rows)
+
+
+@lru_cache(maxsize=512)
+def _cardio_keyboard(names: tuple):
+    rows = [[name] for name in names]
+    rows.append(['✏️ Добавить кардио упражнение'])
+    rows.append(['🔙 Назад к тренировке'])
+    return _kb(rows)
+
+
+@lru_cache(maxsize=512)
+def _delete_exercise_keyboard(strength: tuple, cardio: tuple):
+    rows = [[f"💪 {name}"] for name in strength]
+    rows.extend([f"🏃 {name}"] for name in cardio)
+    rows.append(['🔙 Назад к управлению упражнениями'])
+    return _kb(rows)
+
+
+@lru_cache(maxsize=512)
+def _progress_keyboard(names: tuple):
+    rows = [list(names[i:i + 2]) for i in range(0, len(names), 2)]
+    rows.append(['🔙 Назад к статистике'])
+    return _kb(rows)
+
+
+def progress_exercises_keyboard(names):
+    """Упражнения с данными о прогрессе по два в ряд + возврат в статистику."""
+    return _progress_keyboard(tuple(names))
+
+
+def strength_exercises_keyboard(user_id):
+    """Силовые упражнения пользователя по два в ряд + действия."""
+    return _strength_keyboard(tuple(get_visible_exercise_lists(user_id)["strength"]))
+
+
+def cardio_exercises_keyboard(user_id):
+    """Кардио-упражнения пользователя по одному в ряд + действия."""
+    return _cardio_keyboard(tuple(get_visible_exercise_lists(user_id)["cardio"]))
+
+
+def delete_exercise_keyboard(visible):
+    """Клавиатура удаления по уже загруженному каталогу {'strength': [...], 'cardio': [...]}."""
+    return _delete_exercise_keyboard(tuple(visible["strength"]), tuple(visible["cardio"]))
@@ -0,0 +1,156 @@
+"""
+Неблокирующее структурированное логирование.
+
+Записи уходят в ограниченную очередь (QueueHandler), а в stdout их пишет отдельный
+поток QueueListener — хендлеры никогда не ждут вывода. При переполнении очереди
+записи отбрасываются и учитываются в метрике log_dropped_total.
+
+Переменные окружения:
+    LOG_LEVEL              — уровень корневого логгера (INFO)
+    LOG_LEVELS             — уровни по модулям: "database=DEBUG,httpx=WARNING"
+    LOG_FORMAT             — json (по умолчанию) или text
+    LOG_DEBUG_SAMPLE_RATE  — доля DEBUG-записей, которые реально пишутся (1.0)
+    LOG_QUEUE_SIZE         — размер очереди (10000)
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+# Идентификатор апдейта, в рамках которого пишется запись
+_correlation = contextvars.ContextVar("log_correlation", default=None)
+
+# Шумные библиотечные логгеры (httpx пишет каждый getUpdates на INFO)
+_DEFAULT_LEVELS = {"httpx": "WARNING", "apscheduler": "WARNING"}
+
+_listener = None
+
+
+def bind_update(update):
+    """Привязать correlation ID текущего апдейта; возвращает токен для reset_update()."""
+    update_id = getattr(update, "update_id", None)
+    user = getattr(update, "effective_user", None)
+    return _correlation.set({
+        "update_id": update_id,
+        "user_id": getattr(user, "id", None),
+    })
+
+
+def reset_update(token):
+    _correlation.reset(token)
+
+
+def current_user_id():
+    """Пользователь текущего апдейта (None вне обработчика)."""
+    ctx = _correlation.get()
+    return ctx["user_id"] if ctx else None
+
+
+class _CorrelationFilter(logging.Filter):
+    def filter(self, record):
+        ctx = _correlation.get()
+        record.update_id = ctx["update_id"] if ctx else None
+        record.user_id = ctx["user_id"] if ctx else None
+        return True
+
+
+class _DebugSampler(logging.Filter):
+    """Пропускает только долю DEBUG-записей, остальные уровни — всегда."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который при полной очереди отбрасывает запись вместо ожидания."""
+
+    def prepare(self, record):
+        # Слушатель живёт в том же процессе: достаточно подставить аргументы,
+        # форматирование (JSON, traceback) выполняется уже в фоновом потоке
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            import metrics
+
+            metrics.inc("log_dropped_total")
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна JSON-строка."""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "update_id", None) is not None:
+            payload["update_id"] = record.update_id
+        if getattr(record, "user_id", None) is not None:
+            payload["user_id"] = record.user_id
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def _parse_levels(spec: str):
+    levels = dict(_DEFAULT_LEVELS)
+    for item in (spec or "").split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Настроить корневой логгер: очередь + фоновый поток вывода. Повторный вызов — no-op."""
+    global _listener
+    if _listener is not None:
+        return
+
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        formatter = logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - [upd=%(update_id)s] %(message)s"
+        )
+    else:
+        formatter = JsonFormatter()
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    queue_handler = _DroppingQueueHandler(log_queue)
+    # Фильтры на стороне источника: сначала сэмплирование, затем correlation ID из контекста апдейта
+    queue_handler.addFilter(_DebugSampler(float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))))
+    queue_handler.addFilter(_CorrelationFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    for name, level in _parse_levels(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -1,213 +1,158 @@
+import time
+
+# Отсчёт времени холодного старта — до всех остальных импортов
+_STARTED = time.perf_counter()
+
+import asyncio
 import os
 import logging
 from dotenv import load_dotenv
+
+# Загружаем переменные окружения до импорта модулей, читающих настройки из env
+load_dotenv()
+
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ConversationHandler, ContextTypes
 from telegram import Update
 
 # БАЗОВЫЕ ИМПОРТЫ
 from utils_constants import *
-from database import ensure_bot_schema
-from handlers_common import (
-    start,
-    start_from_button,
-    handle_main_menu,
-    handle_clear_data_choice,
-    handle_clear_data_confirmation,
-)
-from handlers_statistics import handle_statistics_menu
-from handlers_export import handle_export_menu
-from handlers_training import (
-    start_training, 
-    handle_training_menu_choice,
-    handle_training_menu_fallback, 
-    show_strength_exercises,
-    show_cardio_exercises, 
-    choose_exercise_type,
-    handle_strength_exercise_selection, 
-    handle_set_input,
-    handle_cardio_exercise_selection, 
-    show_finish_summary,           # ← ДОБАВИТЬ эту функцию
-    handle_finish_confirmation,
-    save_exercise, 
-    cancel_exercise, 
-    save_new_exercise_from_training, 
-    handle_cardio_type_selection,
-    handle_cardio_min_meters_input,
-    handle_cardio_km_h_input,
-    handle_measurements_choice,
-    save_measurements,
-    add_custom_exercise_from_training,
-)
-from handlers_exercises import (
-    show_exercises_management,
-    handle_exercises_management_choice,
-    choose_exercise_type_mgmt,
-    add_custom_exercise_mgmt,
-    save_new_strength_exercise_mgmt,
-    save_new_cardio_exercise_mgmt,
-    show_delete_exercise_menu,
-    delete_exercise_handler
-)
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from database import REPLICA_URL, close_pool, db_breaker, ensure_bot_schema, pool_status, replica_breaker
+from metrics import instrument_application, register_http_routes, log_summary_forever
+from http_server import start_http_server
+import health
+from process_pool import shutdown_pool
+from rate_limiter import OutboundRateLimiter
+from logging_setup import setup_logging
+import cluster
+import journal
+import scheduler
+import digest
+import maintenance
+import data_deletion
+import partitioning
+from handlers_common import start, start_from_button
+from routing import ENTRY_BUTTONS, FALLBACK_BUTTONS, build_states, guard_db, preload
+# Настройка логирования: JSON в stdout через фоновую очередь
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# polling — один процесс; ingress/worker — несколько воркеров (см. cluster.py)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Модули обработчиков (выгрузки, статистика, ...) импортируются при первом обращении;
+# 0 — импортировать всё при старте
+LAZY_IMPORTS = os.getenv('BOT_LAZY_IMPORTS', '1') != '0'
+
 
 async def _log_errors(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Логирует необработанные исключения в хендлерах (важно для Render и отладки кнопок)."""
     logger.error("Ошибка в обработчике Telegram:", exc_info=context.error)
 
 
-# Загружаем переменные окружения
-load_dotenv()
+async def _post_init(application: Application) -> None:
+    """Служебные фоновые задачи: /metrics, /healthz, /readyz и периодическая сводка метрик."""
+    health.start_health_monitor(application)
+    health.add_status_provider("database_breaker", db_breaker.snapshot)
+    health.add_status_provider("database_pool", pool_status)
+    if REPLICA_URL:
+        health.add_status_provider("database_replica_breaker", replica_breaker.snapshot)
+    health.add_status_provider("journal", journal.status)
+    application.create_task(journal.replay_forever())
+    if scheduler.ENABLED:
+        scheduler.register("weekly_digest", digest.period, digest.run_weekly_digest)
+        scheduler.register(
+            "stale_training_reaper",
+            scheduler.every(maintenance.REAPER_INTERVAL_MINUTES),
+            maintenance.run_stale_training_reaper,
+        )
+        scheduler.register("user_data_deletion", scheduler.every(1), data_deletion.run_stale_deletions)
+        scheduler.register("partition_maintenance", scheduler.every(24 * 60), partitioning.run_partition_maintenance)
+        if maintenance.ARCHIVE_AFTER_MONTHS > 0:
+            scheduler.register("history_archive", scheduler.every(24 * 60), maintenance.run_history_archive)
+        health.add_status_provider("scheduler", scheduler.status)
+        application.create_task(scheduler.run_forever(application))
+    metrics_port = os.getenv('METRICS_PORT')
+    if metrics_port:
+        register_http_routes()
+        health.register_http_routes()
+        application.bot_data['http_server'] = await start_http_server(int(metrics_port))
+
+    log_interval = float(os.getenv('METRICS_LOG_INTERVAL', '0') or 0)
+    if log_interval > 0:
+        application.create_task(log_summary_forever(log_interval))
+
+    if BOT_MODE != 'worker':
+        application.create_task(_warm_up())
+
+
+async def _warm_up() -> None:
+    """Проверка схемы БД и прогрев модулей — в фоне, уже после начала приёма апдейтов."""
+    started = time.perf_counter()
+    await asyncio.to_thread(ensure_bot_schema)
+    if LAZY_IMPORTS:
+        await asyncio.to_thread(preload)
+    logger.info("Фоновый прогрев завершён за %.0f мс", (time.perf_counter() - started) * 1000)
+
+
+async def _post_shutdown(application: Application) -> None:
+    server = application.bot_data.pop('http_server', None)
+    if server:
+        server.close()
+        await server.wait_closed()
+    # Дождаться выполняемых выгрузок и остановить процессы пула
+    await asyncio.to_thread(shutdown_pool)
+    close_pool()
+
 
 def main():
     """Основная функция запуска"""
-    print("=" * 50)
-    print("ЗАПУСК FITNESS TRACKER BOT - МИНИМАЛЬНАЯ ВЕРСИЯ")
-    print("=" * 50)
+    logger.info("Запуск Fitness Tracker Bot")
     
     # Проверка токена
     TOKEN = os.getenv('BOT_TOKEN')
     if not TOKEN:
-        print("ОШИБКА: BOT_TOKEN не установлен!")
+        logger.error("BOT_TOKEN не установлен!")
         return None
 
-    ensure_bot_schema()
+    if BOT_MODE == 'worker':
+        # Воркер загружает состояния диалогов при инициализации — таблицы нужны сразу
+        ensure_bot_schema()
+    if not LAZY_IMPORTS:
+        preload()
 
     try:
         # Создаем приложение
-        application = Application.builder().token(TOKEN).build()
-        
-        # СОЗДАЕМ ПРОСТУЮ ВЕРСИЮ handle_input_sets_choice
-        async def handle_input_sets_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-            """Обработка выбора при вводе подходов"""
-            text = update.message.text
-            
-            if text == '✅ Добавить еще подходы':
-                await update.message.reply_text("Введите следующие подходы...")
-                return INPUT_SETS
-            elif text == '💾 Сохранить упражнение':
-                # Сохраняем упражнение в БД
-                return await save_exercise(update, context)
-            elif text == '❌ Отменить упражнение':
-                # Отменяем упражнение
-                return await cancel_exercise(update, context)
-            else:
-                return await handle_set_input(update, context)
+        builder = (
+            Application.builder()
+            .token(TOKEN)
+            .post_init(_post_init)
+            .post_shutdown(_post_shutdown)
+            # Лимиты Telegram на исходящие сообщения: общий и на чат, с приоритетами
+            .rate_limiter(OutboundRateLimiter.from_env(cluster.WORKER_COUNT))
+        )
+        # Воркер кластера: апдейты приходят от ingress, состояние диалогов — в PostgreSQL
+        worker_mode = BOT_MODE == 'worker'
+        if worker_mode:
+            from persistence import PostgresPersistence
+            builder = builder.updater(None).persistence(
+                PostgresPersistence(cluster.WORKER_INDEX, cluster.WORKER_COUNT)
+            )
+        application = builder.build()
         
-        # Создаем УПРОЩЕННЫЙ ConversationHandler
+        # Состояния и переходы по кнопкам описаны таблицей в routing.py
         conv_handler = ConversationHandler(
             entry_points=[
-                CommandHandler('start', start),
-                MessageHandler(filters.Regex('^(🚀 Начать|🚀 Продолжить|🏃‍♂️ Продолжить тренировку|🆕 Начать новую тренировку)$'), start_from_button),
+                CommandHandler('start', guard_db(start)),
+                MessageHandler(filters.Text(ENTRY_BUTTONS), guard_db(start_from_button)),
             ],
-            states={
-                INACTIVE: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_clear_data_choice),
-                ],
-                MAIN_MENU: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_main_menu),
-                ],
-                STATS_MENU: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_statistics_menu),
-                ],
-                EXPORT_MENU: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_export_menu),
-                ],
-                CLEAR_DATA_CONFIRM: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_clear_data_confirmation),
-                ],
-                
-                # Модуль тренировки - ОСНОВНОЙ FLOW
-                TRAINING_MENU: [
-                    MessageHandler(filters.Regex('^(💪 Силовые упражнения|🏃 Кардио|✏️ Добавить свое упражнение|🏁 Завершить тренировку)$'), handle_training_menu_choice),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_training_menu_fallback),
-                ],
-
-                ADD_EXERCISE_TYPE: [
-                    MessageHandler(filters.Regex('^(💪 Силовое упражнение|🏃 Кардио упражнение|🔙 Назад к тренировке)$'), add_custom_exercise_from_training),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, add_custom_exercise_from_training),
-                ],
-                
-                INPUT_MEASUREMENTS_CHOICE: [
-                    MessageHandler(filters.Regex('^(📝 Ввести замеры|⏭️ Пропустить замеры|🔙 Главное меню)$'), handle_measurements_choice),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_measurements_choice),
-                ],
-
-                INPUT_MEASUREMENTS: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, save_measurements),  
-                ],
-                
-                CHOOSE_STRENGTH_EXERCISE: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_strength_exercise_selection),
-                ],
-                
-                INPUT_SETS: [
-                    MessageHandler(filters.Regex('^(✅ Добавить еще подходы|💾 Сохранить упражнение|❌ Отменить упражнение)$'), handle_input_sets_choice),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_set_input),
-                ],
-                
-                CHOOSE_CARDIO_EXERCISE: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_cardio_exercise_selection),
-                ],
-                
-                INPUT_NEW_CARDIO_EXERCISE: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, save_new_exercise_from_training),
-                ],
-                
-                INPUT_NEW_STRENGTH_EXERCISE: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, save_new_exercise_from_training),
-                ],
-
-                CARDIO_TYPE_SELECTION: [
-                    MessageHandler(filters.Regex('^(⏱️ Мин/Метры|🚀 Км/Час|🔙 Назад к кардио)$'), handle_cardio_type_selection),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_cardio_type_selection),
-                ],
-
-                INPUT_CARDIO_MIN_METERS: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_cardio_min_meters_input),
-                ],
-
-                INPUT_CARDIO_KM_H: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_cardio_km_h_input),
-                ],
-
-                DELETE_EXERCISE_MENU: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, delete_exercise_handler),
-                ],
-
-                EXERCISES_MANAGEMENT: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_exercises_management_choice),
-                ],
-                
-                ADD_EXERCISE_TYPE_MGMT: [
-                    MessageHandler(filters.Regex('^(💪 Силовое упражнение|🏃 Кардио упражнение|🔙 Назад к управлению упражнениями)$'), add_custom_exercise_mgmt),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, add_custom_exercise_mgmt),
-                ],
-
-                INPUT_NEW_STRENGTH_EXERCISE_MGMT: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, save_new_strength_exercise_mgmt),
-                ],
-                INPUT_NEW_CARDIO_EXERCISE_MGMT: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, save_new_cardio_exercise_mgmt),
-                ],
-                
-                CONFIRM_FINISH: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_finish_confirmation),
-                ],
-            },
+            states=build_states(),
             fallbacks=[
-                CommandHandler('start', start),
-                MessageHandler(
-                    filters.Regex('^(🚀 Начать|🚀 Продолжить)$'),
-                    start_from_button,
-                ),
+                CommandHandler('start', guard_db(start)),
+                MessageHandler(filters.Text(FALLBACK_BUTTONS), guard_db(start_from_button)),
             ],
-            allow_reentry=True
+            allow_reentry=True,
+            name='main',
+            persistent=worker_mode,
         )
         
         application.add_handler(conv_handler)
@@ -218,36 +163,35 @@ def main():
             await update.message.reply_text("✅ Бот работает! Используйте кнопки меню.")
         
         application.add_handler(CommandHandler("test", test))
+
+        # Латентность и походы в БД по каждому хендлеру
+        instrument_application(application)
         
-        print("✅ Приложение настроено успешно!")
+        logger.info("Приложение настроено за %.0f мс от старта процесса",
+                    (time.perf_counter() - _STARTED) * 1000)
         return application
         
-    except Exception as e:
-        logger.error(f"Ошибка при создании приложения: {e}")
-        import traceback
-        traceback.print_exc()
-        print(f"Критическая ошибка: {e}")
+    except Exception:
+        logger.exception("Ошибка при создании приложения")
         return None
 
 if __name__ == '__main__':
-    app = main()
-    if app:
-        print("🚀 Бот запущен и готов к работе!")
-        print("📱 Отправьте /start в Telegram")
-        app.run_polling(
-            drop_pending_updates=True,
-            allowed_updates=Update.ALL_TYPES
-        )
+    if BOT_MODE == 'ingress':
+        token = os.getenv('BOT_TOKEN')
+        worker_urls = [u.strip() for u in os.getenv('WORKER_URLS', '').split(',') if u.strip()]
+        if not token or not worker_urls:
+            logger.error("Для ingress нужны BOT_TOKEN и WORKER_URLS")
+        else:
+            asyncio.run(cluster.run_ingress(token, worker_urls))
     else:
-        print("❌ Не удалось запустить бота")
-
-
-
-
-
-
-
-
-
-
-
+        app = main()
+        if not app:
+            logger.error("Не удалось запустить бота")
+        elif BOT_MODE == 'worker':
+            asyncio.run(cluster.run_worker(app, int(os.getenv('WORKER_PORT', '8081'))))
+        else:
+            logger.info("Бот запущен, ожидаем апдейты")
+            app.run_polling(
+                drop_pending_updates=True,
+                allowed_updates=Update.ALL_TYPES
+            )
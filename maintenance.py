@@ -0,0 +1,88 @@
+"""
+Обслуживающие задачи планировщика (scheduler.py).
+
+stale_training_reaper — брошенные тренировки. Тренировка, которую забыли завершить,
+оставалась открытой навсегда: бот снова и снова предлагал «продолжить» её. Раз в
+REAPER_INTERVAL_MINUTES тренировки, открытые дольше TRAINING_STALE_HOURS, обрабатываются
+пачками по REAPER_BATCH_SIZE одним SQL-запросом на пачку: с упражнениями или замерами —
+завершаются (date_end = начало + TRAINING_STALE_HOURS, комментарий «Завершена автоматически»),
+пустые — удаляются. Время работы и число строк — в логе, метриках и /readyz.
+
+history_archive — холодный архив (history_archive.py). Раз в сутки завершённые тренировки,
+начатые раньше, чем ARCHIVE_AFTER_MONTHS полных месяцев назад, переносятся в сжатые блоки
+training_archive: пользователи обходятся по возрастанию id, курсор — последний
+обработанный пользователь, каждому — транзакции по ARCHIVE_BATCH_SIZE тренировок.
+
+Переменные окружения:
+    TRAINING_STALE_HOURS    — через сколько часов открытая тренировка считается брошенной (12)
+    REAPER_INTERVAL_MINUTES — период запуска, мин (60)
+    REAPER_BATCH_SIZE       — тренировок в одной транзакции (500)
+    ARCHIVE_AFTER_MONTHS    — старше скольких месяцев тренировки уходят в архив; 0 — архив выключен (0)
+    ARCHIVE_BATCH_SIZE      — тренировок пользователя в одной транзакции архивации (500)
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from database import archive_user_trainings, get_archive_user_ids, reap_stale_trainings
+from metrics import inc
+
+logger = logging.getLogger(__name__)
+
+TRAINING_STALE_HOURS = float(os.getenv('TRAINING_STALE_HOURS', '12'))
+REAPER_INTERVAL_MINUTES = float(os.getenv('REAPER_INTERVAL_MINUTES', '60'))
+REAPER_BATCH_SIZE = int(os.getenv('REAPER_BATCH_SIZE', '500'))
+ARCHIVE_AFTER_MONTHS = int(os.getenv('ARCHIVE_AFTER_MONTHS', '0'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '500'))
+
+_ARCHIVE_USERS_PER_BATCH = 100
+
+
+async def run_stale_training_reaper(run):
+    """Задача планировщика: завершить или удалить брошенные тренировки."""
+    finished_total = deleted_total = 0
+    while True:
+        result = await asyncio.to_thread(reap_stale_trainings, TRAINING_STALE_HOURS, REAPER_BATCH_SIZE)
+        if result is None:
+            raise RuntimeError("Не удалось обработать пачку брошенных тренировок")
+        finished, deleted = result
+        finished_total += finished
+        deleted_total += deleted
+        run.details.update(finished=finished_total, deleted=deleted_total)
+        inc("stale_trainings_reaped_total", finished, action="finished")
+        inc("stale_trainings_reaped_total", deleted, action="deleted")
+        await run.checkpoint("", finished + deleted)
+        if finished + deleted < REAPER_BATCH_SIZE:
+            break
+
+
+def archive_cutoff(now, months=ARCHIVE_AFTER_MONTHS) -> datetime:
+    """Граница архива: начало месяца, отстоящего от текущего на months (архивируются целые месяцы)."""
+    index = now.year * 12 + now.month - 1 - months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+async def run_history_archive(run):
+    """Задача планировщика: перенести старые тренировки в training_archive."""
+    cutoff = archive_cutoff(datetime.now())
+    after = int(run.cursor or 0)
+    archived_total = 0
+    while True:
+        user_ids = await asyncio.to_thread(get_archive_user_ids, cutoff, after, _ARCHIVE_USERS_PER_BATCH)
+        if user_ids is None:
+            raise RuntimeError("БД недоступна при выборке пользователей для архива")
+        if not user_ids:
+            break
+        for user_id in user_ids:
+            while True:
+                archived = await asyncio.to_thread(archive_user_trainings, user_id, cutoff, ARCHIVE_BATCH_SIZE)
+                if archived is None:
+                    raise RuntimeError(f"Не удалось архивировать тренировки пользователя {user_id}")
+                archived_total += archived
+                inc("trainings_archived_total", archived)
+                if archived < ARCHIVE_BATCH_SIZE:
+                    break
+        after = user_ids[-1]
+        run.details.update(archived=archived_total)
+        await run.checkpoint(str(after), len(user_ids))
@@ -0,0 +1,233 @@
+"""
+Лёгкие метрики: счётчики и гистограммы по обработчикам и функциям БД.
+
+Накладные расходы — пара perf_counter() и обновление словаря под локом, поэтому
+инструментирование можно держать включённым в проде. Отдаются в текстовом формате
+Prometheus (/metrics) или периодической сводкой в лог.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from logging_setup import bind_update, reset_update
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+# Статистика текущего апдейта: заполняется функциями БД, читается обёрткой хендлера
+_update_stats = contextvars.ContextVar("update_stats", default=None)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Увеличить счётчик."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels):
+    """Установить текущее значение (глубина очереди и т.п.)."""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+    """Добавить наблюдение в гистограмму."""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = _Histogram(buckets)
+        hist.observe(value)
+
+
+def current_update_stats():
+    """Счётчики текущего апдейта (None вне обработчика)."""
+    return _update_stats.get()
+
+
+def record_db_connect(seconds: float, ok: bool):
+    """Учесть попытку подключения к PostgreSQL."""
+    observe("db_connect_seconds", seconds)
+    inc("db_connects_total", ok=str(ok).lower())
+    stats = _update_stats.get()
+    if stats is not None:
+        stats["db_connect_seconds"] += seconds
+
+
+def record_db_round_trip():
+    """Учесть один запрос к PostgreSQL."""
+    inc("db_round_trips_total")
+    stats = _update_stats.get()
+    if stats is not None:
+        stats["db_round_trips"] += 1
+
+
+def track_db(func):
+    """Декоратор для функций database.py: число вызовов и латентность."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            observe("db_call_seconds", time.perf_counter() - started, function=name)
+            inc("db_calls_total", function=name)
+
+    return wrapper
+
+
+def instrument_handler(callback):
+    """Обёртка async-хендлера: латентность, ошибки, походы в БД и correlation ID апдейта."""
+    if getattr(callback, "_instrumented", False):
+        return callback
+    name = getattr(callback, "__name__", repr(callback))
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        if _update_stats.get() is not None:
+            return await callback(update, context)
+        stats = {"handler": name, "db_round_trips": 0, "db_connect_seconds": 0.0}
+        token = _update_stats.set(stats)
+        log_token = bind_update(update)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            inc("handler_errors_total", handler=stats["handler"])
+            raise
+        finally:
+            reset_update(log_token)
+            _update_stats.reset(token)
+            # Диспетчер состояния уточняет имя на обработчик, выбранный по таблице маршрутов
+            handler = stats["handler"]
+            observe("handler_seconds", time.perf_counter() - started, handler=handler)
+            inc("handler_calls_total", handler=handler)
+            observe("db_round_trips_per_update", stats["db_round_trips"], buckets=COUNT_BUCKETS)
+            observe("db_connect_seconds_per_update", stats["db_connect_seconds"])
+
+    wrapper._instrumented = True
+    return wrapper
+
+
+def instrument_application(application):
+    """Обернуть callback у всех зарегистрированных хендлеров (включая состояния ConversationHandler)."""
+    from telegram.ext import ConversationHandler
+
+    def walk(handler):
+        if isinstance(handler, ConversationHandler):
+            for inner in handler.entry_points:
+                walk(inner)
+            for state_handlers in handler.states.values():
+                for inner in state_handlers:
+                    walk(inner)
+            for inner in handler.fallbacks:
+                walk(inner)
+        elif getattr(handler, "callback", None) is not None:
+            handler.callback = instrument_handler(handler.callback)
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            walk(handler)
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def render_prometheus() -> str:
+    """Все метрики в текстовом формате Prometheus."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {
+            k: (h.buckets, list(h.counts), h.total, h.count) for k, h in _histograms.items()
+        }
+
+    lines = []
+    for (name, labels), value in sorted(counters.items()):
+        lines.append(f"nextset_{name}{_format_labels(labels)} {value}")
+    for (name, labels), value in sorted(gauges.items()):
+        lines.append(f"nextset_{name}{_format_labels(labels)} {value}")
+    for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, counts):
+            cumulative += bucket_count
+            lines.append(
+                f"nextset_{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}"
+            )
+        lines.append(f"nextset_{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"nextset_{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"nextset_{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def summary_lines(top: int = 10):
+    """Короткая сводка для лога: самые медленные хендлеры и функции БД по среднему."""
+    with _lock:
+        rows = [
+            (name, dict(labels), h.total / h.count, h.count)
+            for (name, labels), h in _histograms.items()
+            if name in ("handler_seconds", "db_call_seconds") and h.count
+        ]
+    rows.sort(key=lambda r: r[2], reverse=True)
+    return [
+        f"{name}[{labels.get('handler') or labels.get('function')}] "
+        f"avg={avg * 1000:.1f}ms n={count}"
+        for name, labels, avg, count in rows[:top]
+    ]
+
+
+async def _metrics_endpoint(body: bytes):
+    return 200, "text/plain; version=0.0.4", render_prometheus().encode("utf-8")
+
+
+def register_http_routes():
+    """Подключить /metrics к служебному HTTP-серверу."""
+    from http_server import add_route
+
+    add_route("GET", "/metrics", _metrics_endpoint)
+
+
+async def log_summary_forever(interval: float):
+    """Периодически писать сводку метрик в лог."""
+    while True:
+        await asyncio.sleep(interval)
+        lines = summary_lines()
+        if lines:
+            logger.info("Сводка метрик:\n%s", "\n".join(lines))
@@ -0,0 +1,189 @@
+"""
+Необязательное секционирование истории: trainings и training_exercises по месяцам или годам.
+
+Без миграции всё работает как раньше. После неё обе таблицы секционированы по диапазону
+начала тренировки (trainings.date_start, training_exercises.training_start — начало
+тренировки, которое упражнение хранит рядом с training_id). Запросы истории и статистики
+передают этот ключ (соединение упражнений с тренировкой, get_user_exercise_rows(since=...),
+get_training_exercises(training_start)), и PostgreSQL читает только секции нужного
+периода, а не всю историю. Задача планировщика "partition_maintenance" раз в сутки
+создаёт секции на PARTITION_AHEAD периодов вперёд; строки вне секций попадают в секцию
+по умолчанию ({table}_default).
+
+Миграция — при остановленном боте (изменения старых строк во время переноса не переносятся,
+а запущенный бот продолжил бы писать по старой схеме). migrate проверяет это по соединениям
+с application_name бота — перед началом и перед подменой таблиц:
+    python partitioning.py status
+    python partitioning.py migrate month    # или year; перенос пачками, прерванный — продолжается
+    python partitioning.py drop-legacy      # после проверки: удалить старые таблицы *_legacy
+    python partitioning.py ensure           # создать будущие секции сейчас
+
+Переменные окружения:
+    PARTITION_AHEAD      — на сколько периодов вперёд создавать секции (3)
+    PARTITION_BATCH_SIZE — строк в одной транзакции при переносе (5000)
+"""
+import asyncio
+import logging
+import os
+import re
+import sys
+from datetime import date
+
+import database
+from database import (
+    PARTITIONED_TABLES, copy_to_partitioned, count_bot_sessions, create_partitioned_tables,
+    create_partitions, drop_legacy_tables, ensure_bot_schema, get_partitions, get_training_start_range,
+    swap_partitioned_tables, trainings_partitioned,
+)
+from metrics import inc
+
+logger = logging.getLogger(__name__)
+
+AHEAD = int(os.getenv('PARTITION_AHEAD', '3'))
+BATCH_SIZE = int(os.getenv('PARTITION_BATCH_SIZE', '5000'))
+
+GRANULARITIES = ("month", "year")
+
+# Суффикс имени секции: trainings_2026_10 (месяц) или trainings_2026 (год)
+_SUFFIX = re.compile(r"_(\d{4})(?:_(\d{2}))?$")
+
+
+def period_start(day, granularity) -> date:
+    return date(day.year, day.month if granularity == "month" else 1, 1)
+
+
+def next_period(start, granularity) -> date:
+    if granularity == "year" or start.month == 12:
+        return date(start.year + 1, 1, 1)
+    return date(start.year, start.month + 1, 1)
+
+
+def partition_ranges(granularity, first, last) -> list:
+    """Секции [(суффикс, начало, конец)], покрывающие дни от first до last включительно."""
+    ranges = []
+    start = period_start(first, granularity)
+    while start <= last:
+        end = next_period(start, granularity)
+        suffix = f"{start:%Y_%m}" if granularity == "month" else f"{start:%Y}"
+        ranges.append((suffix, start, end))
+        start = end
+    return ranges
+
+
+def granularity_of(partitions):
+    """Шаг секционирования по именам существующих секций (None — не секционировано)."""
+    for name, _ in partitions:
+        match = _SUFFIX.search(name)
+        if match:
+            return "month" if match.group(2) else "year"
+    return None
+
+
+def _future_ranges(granularity, today, ahead):
+    last = today
+    for _ in range(ahead):
+        last = next_period(period_start(last, granularity), granularity)
+    return partition_ranges(granularity, today, last)
+
+
+def ensure_future_partitions(today=None, ahead=AHEAD):
+    """Создать недостающие секции от текущего периода на ahead вперёд. Число созданных, None — ошибка."""
+    if not trainings_partitioned():
+        return 0
+    today = today or date.today()
+    created = 0
+    for table in PARTITIONED_TABLES:
+        partitions = get_partitions(table)
+        if partitions is None:
+            return None
+        granularity = granularity_of(partitions)
+        if granularity is None:
+            continue
+        existing = {name for name, _ in partitions}
+        missing = [r for r in _future_ranges(granularity, today, ahead) if f"{table}_{r[0]}" not in existing]
+        if not missing:
+            continue
+        count = create_partitions(table, missing)
+        if count is None:
+            return None
+        created += count
+        inc("partitions_created_total", count, table=table)
+        logger.info("Созданы секции %s: %s", table, ", ".join(f"{table}_{r[0]}" for r in missing))
+    return created
+
+
+async def run_partition_maintenance(run):
+    """Задача планировщика: заранее создать секции будущих периодов."""
+    created = await asyncio.to_thread(ensure_future_partitions)
+    if created is None:
+        raise RuntimeError("Не удалось создать будущие секции")
+    run.details.update(created=created)
+
+
+def _bot_stopped():
+    sessions = count_bot_sessions()
+    if sessions:
+        print(f"Бот запущен (соединений: {sessions}) — остановите его перед миграцией")
+    return sessions == 0
+
+
+def migrate(granularity):
+    """Перевести таблицы истории на секции: создать копии, перенести данные пачками, подменить."""
+    if not _bot_stopped():
+        return False
+    ensure_bot_schema()
+    if trainings_partitioned():
+        print("Таблицы уже секционированы")
+        return True
+    bounds = get_training_start_range()
+    if bounds is None:
+        return False
+    today = date.today()
+    first = bounds[0].date() if bounds[0] else today
+    # Прошлые периоды с первой тренировки + текущий и AHEAD будущих
+    ranges = partition_ranges(granularity, min(first, today), today)[:-1] + _future_ranges(granularity, today, AHEAD)
+    if not create_partitioned_tables(ranges):
+        return False
+    print(f"Секций на таблицу: {len(ranges)} ({ranges[0][0]} … {ranges[-1][0]}) + default")
+    for table in PARTITIONED_TABLES:
+        copied = copy_to_partitioned(table, BATCH_SIZE)
+        if copied is None:
+            return False
+        print(f"{table}: перенесено строк {copied}")
+    if not _bot_stopped() or not swap_partitioned_tables():
+        return False
+    print("Готово: таблицы секционированы, старые переименованы в *_legacy")
+    return True
+
+
+def status():
+    partitioned = trainings_partitioned()
+    print(f"Секционирование: {'включено' if partitioned else 'нет'}")
+    if not partitioned:
+        return
+    for table in PARTITIONED_TABLES:
+        partitions = get_partitions(table) or []
+        print(f"\n{table} ({granularity_of(partitions)}):")
+        for name, rows in partitions:
+            print(f"  {name}: ~{rows} строк")
+
+
+def main(argv):
+    command = argv[1:2]
+    if command == ["status"]:
+        status()
+    elif command == ["migrate"] and argv[2:3] and argv[2] in GRANULARITIES:
+        sys.exit(0 if migrate(argv[2]) else 1)
+    elif command == ["ensure"]:
+        print(f"Создано секций: {ensure_future_partitions()}")
+    elif command == ["drop-legacy"]:
+        sys.exit(0 if drop_legacy_tables() else 1)
+    else:
+        print(__doc__)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    # Свои соединения не должны выглядеть как запущенный бот
+    database.APPLICATION_NAME = "fitness-bot-partitioning"
+    main(sys.argv)
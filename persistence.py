@@ -0,0 +1,85 @@
+"""
+Хранение состояния диалогов и user_data в PostgreSQL.
+
+Нужно, когда бот работает несколькими воркерами (см. cluster.py): каждый воркер
+загружает только своих пользователей (user_id % WORKER_COUNT == WORKER_INDEX), а при
+изменении числа воркеров или переезде пользователя новый владелец продолжает диалог
+с того же места. Запись — через update_interval (BOT_STATE_FLUSH_INTERVAL) и при остановке.
+"""
+import asyncio
+import os
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import (
+    load_conversation_states,
+    save_conversation_state,
+    load_user_data,
+    save_user_data,
+    delete_user_data,
+)
+
+STATE_FLUSH_INTERVAL = float(os.getenv('BOT_STATE_FLUSH_INTERVAL', '5'))
+
+
+class PostgresPersistence(BasePersistence):
+    """Состояния ConversationHandler и user_data; chat_data/bot_data/callback_data не храним."""
+
+    def __init__(self, worker_index: int = 0, worker_count: int = 1):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=STATE_FLUSH_INTERVAL,
+        )
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+
+    async def get_user_data(self):
+        return await asyncio.to_thread(load_user_data, self.worker_index, self.worker_count)
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return await asyncio.to_thread(
+            load_conversation_states, name, self.worker_index, self.worker_count
+        )
+
+    async def update_conversation(self, name, key, new_state):
+        chat_id, user_id = key
+        await asyncio.to_thread(save_conversation_state, name, chat_id, user_id, new_state)
+
+    async def update_user_data(self, user_id, data):
+        await asyncio.to_thread(save_user_data, user_id, data)
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def drop_user_data(self, user_id):
+        await asyncio.to_thread(delete_user_data, user_id)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        pass
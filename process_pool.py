@@ -0,0 +1,114 @@
+"""
+Пул процессов для тяжёлой CPU-работы: Excel/CSV-выгрузки, статистика по упражнениям и графики.
+
+В воркер уходит только (тип задачи, user_id, параметры) — данные он читает из БД сам,
+а обратно возвращает готовые bytes или dict. Event loop бота в это время свободен
+и продолжает отвечать другим пользователям.
+
+Учёт недавних записей (database._recent_writes) есть только в процессе бота, поэтому
+он сам решает, можно ли задаче читать с реплики: после записи пользователя и для
+задач из PRIMARY_JOBS чтения в воркере идут с основной БД.
+
+Переменные окружения:
+    PROCESS_POOL_SIZE — число процессов (по умолчанию — число ядер; 0 — выполнять
+                        в потоке текущего процесса, без пула)
+"""
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from database import primary_reads, wrote_recently
+from metrics import inc, observe, set_gauge
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv('PROCESS_POOL_SIZE') or os.cpu_count() or 1)
+
+# Тип задачи -> "модуль:функция(user_id, **params)"; импортируется уже в процессе пула
+JOBS = {
+    "excel_report": "handlers_export:generate_excel_report",
+    "csv_export": "handlers_export:generate_csv_bytes",
+    "exercise_stats": "handlers_statistics:exercise_stats_for_user",
+    "chart": "charts:render_chart",
+}
+
+# График кэшируется под версией данных, прочитанной с основной БД (get_chart_cache): нарисованный
+# по отстающей реплике, он остался бы в кэше под новой версией
+PRIMARY_JOBS = {"chart"}
+
+_pool = None
+_in_flight = 0
+
+
+def _init_worker():
+    # Ctrl+C обрабатывает родитель и сам останавливает пул
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from logging_setup import setup_logging
+
+    setup_logging()
+
+
+def _run(job_type, user_id, params, primary=False):
+    module_name, _, func_name = JOBS[job_type].partition(":")
+    func = getattr(importlib.import_module(module_name), func_name)
+    if primary:
+        with primary_reads():
+            return func(user_id, **params)
+    return func(user_id, **params)
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn: у родителя есть потоки (логирование, event loop), fork с ними небезопасен
+        _pool = ProcessPoolExecutor(
+            max_workers=POOL_SIZE,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        logger.info("Пул процессов запущен: %s воркеров", POOL_SIZE)
+    return _pool
+
+
+async def run_job(job_type: str, user_id: int, **params):
+    """Выполнить задачу в пуле процессов. Результат — bytes, dict или None (нет данных)."""
+    global _pool, _in_flight
+    if job_type not in JOBS:
+        raise ValueError(f"Неизвестный тип задачи: {job_type}")
+
+    primary = job_type in PRIMARY_JOBS or wrote_recently(user_id)
+    _in_flight += 1
+    set_gauge("process_pool_in_flight", _in_flight)
+    started = time.perf_counter()
+    try:
+        if POOL_SIZE <= 0:
+            return await asyncio.to_thread(_run, job_type, user_id, params, primary)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(_get_pool(), _run, job_type, user_id, params, primary)
+        except BrokenProcessPool:
+            # Воркер упал (OOM и т.п.) — пересоздаём пул и повторяем один раз
+            logger.error("Пул процессов сломан, перезапуск (задача %s)", job_type)
+            inc("process_pool_restarts_total")
+            _pool = None
+            return await loop.run_in_executor(_get_pool(), _run, job_type, user_id, params, primary)
+    finally:
+        _in_flight -= 1
+        set_gauge("process_pool_in_flight", _in_flight)
+        observe("process_pool_job_seconds", time.perf_counter() - started, job=job_type)
+        inc("process_pool_jobs_total", job=job_type)
+
+
+def shutdown_pool(wait: bool = True):
+    """Остановить пул: дождаться текущих задач, очередь отменить."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+        logger.info("Пул процессов остановлен")
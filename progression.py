@@ -0,0 +1,108 @@
+"""
+Прогресс в силовых упражнениях: расчётный 1ПМ, объём, лучший подход.
+
+Показатели считаются один раз — при сохранении упражнения (database.add_exercise_to_training)
+и складываются в exercise_progress (точка ряда на каждое выполнение) и exercise_records
+(рекорды и итоги по упражнению). Экран «📈 Прогресс» читает одну строку рекордов и
+последние точки по индексу — время ответа не зависит от длины истории.
+
+Для данных, сохранённых до появления этих таблиц:
+    python progression.py backfill
+"""
+import math
+import sys
+
+# Brzycki точнее на малом числе повторений, Epley — на большом
+_BRZYCKI_MAX_REPS = 10
+
+
+def epley(weight: float, reps: int) -> float:
+    return weight * (1 + reps / 30) if reps > 1 else weight
+
+
+def brzycki(weight: float, reps: int) -> float:
+    return weight * 36 / (37 - reps) if 1 < reps < 37 else weight
+
+
+def estimate_1rm(weight: float, reps: int) -> float:
+    """Расчётный одноповторный максимум по весу и числу повторений подхода."""
+    if weight <= 0 or reps <= 0:
+        return 0.0
+    one_rm = brzycki(weight, reps) if reps <= _BRZYCKI_MAX_REPS else epley(weight, reps)
+    # Округление до 0.1 так же, как в analytics.estimated_1rm (одинаковые рекорды в обоих местах)
+    return math.floor(one_rm * 10 + 0.5) / 10
+
+
+def summarize_sets(sets) -> dict:
+    """Показатели одного выполнения упражнения по списку подходов [{'weight', 'reps'}, ...]."""
+    summary = {
+        'best_1rm': 0.0,
+        'volume': 0.0,
+        'best_weight': 0.0,
+        'best_reps': 0,
+        'max_weight': 0.0,
+        'sets_count': 0,
+        'reps_total': 0,
+    }
+    for set_data in sets or []:
+        try:
+            weight = float(set_data['weight'])
+            reps = int(set_data['reps'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        one_rm = estimate_1rm(weight, reps)
+        summary['sets_count'] += 1
+        summary['reps_total'] += reps
+        summary['volume'] += weight * reps
+        summary['max_weight'] = max(summary['max_weight'], weight)
+        if one_rm > summary['best_1rm']:
+            summary['best_1rm'] = one_rm
+            summary['best_weight'] = weight
+            summary['best_reps'] = reps
+    summary['volume'] = round(summary['volume'], 1)
+    return summary
+
+
+def _kg(value) -> str:
+    value = float(value or 0)
+    return f"{value:,.0f}".replace(",", " ") if value >= 1000 else f"{value:g}"
+
+
+def format_progress(exercise: str, progress: dict) -> str:
+    """Текст экрана прогресса по данным database.get_exercise_progress."""
+    record = progress['record']
+    series = progress['series']
+
+    text = f"📈 ПРОГРЕСС: {exercise}\n\n"
+    text += "🏆 Рекорды:\n"
+    text += (
+        f"• Расчётный 1ПМ: {_kg(record['best_1rm'])}кг "
+        f"({_kg(record['best_weight'])}кг × {record['best_reps']}, {record['best_1rm_at']})\n"
+    )
+    text += f"• Макс. вес: {_kg(record['max_weight'])}кг ({record['max_weight_at']})\n"
+    text += f"• Объём за тренировку: {_kg(record['best_volume'])}кг ({record['best_volume_at']})\n\n"
+    text += f"📊 Всего: {record['sessions']} выполнений, объём {_kg(record['total_volume'])}кг\n"
+    text += f"📅 С {record['first_at']} по {record['last_at']}\n"
+
+    if series:
+        text += "\n🗓 Последние тренировки (1ПМ / объём):\n"
+        for point in series:
+            text += f"{point['date']} — {_kg(point['best_1rm'])}кг / {_kg(point['volume'])}кг\n"
+        if len(series) > 1 and series[0]['best_1rm']:
+            first, last = series[0]['best_1rm'], series[-1]['best_1rm']
+            change = last - first
+            text += f"\nИзменение 1ПМ: {change:+.1f}кг ({change / first * 100:+.1f}%)\n"
+    return text
+
+
+def main(argv):
+    if argv[1:2] == ["backfill"]:
+        from database import backfill_exercise_progress
+
+        print(f"Обработано упражнений: {backfill_exercise_progress()}")
+        return
+    print(__doc__)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
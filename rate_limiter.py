@@ -0,0 +1,224 @@
+"""
+Ограничитель исходящих запросов к Telegram.
+
+Подключается в ApplicationBuilder.rate_limiter(), поэтому работает для всех
+reply_text/reply_document без изменений в хендлерах:
+    * общий token bucket на бота (Telegram: ~30 сообщений/с);
+    * bucket на чат: личка ~1 сообщение/с с небольшим запасом, группы — 20 в минуту;
+    * приоритеты: ответы пользователю идут раньше выгрузок документов и рассылок
+      (рассылка передаёт rate_limit_args=PRIORITY_BULK);
+    * на 429 (RetryAfter) вся отправка ставится на паузу на указанное время,
+      запрос повторяется до OUTBOUND_MAX_RETRIES раз.
+
+Переменные окружения:
+    OUTBOUND_GLOBAL_RATE        — сообщений в секунду на бота (30, делится между воркерами)
+    OUTBOUND_CHAT_RATE          — сообщений в секунду в личный чат (1)
+    OUTBOUND_CHAT_BURST         — запас сообщений в личный чат подряд (3)
+    OUTBOUND_GROUP_RATE_PER_MIN — сообщений в минуту в группу (20)
+    OUTBOUND_MAX_RETRIES        — повторов после RetryAfter (3)
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from health import record_poll
+from metrics import inc, observe, set_gauge
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DOCUMENT = 1
+PRIORITY_BULK = 2
+
+_PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_DOCUMENT: "document",
+    PRIORITY_BULK: "bulk",
+}
+
+# Загрузка файлов: тяжёлые запросы, пользователь и так ждёт — уступают обычным ответам
+_DOCUMENT_ENDPOINTS = frozenset({
+    "sendDocument", "sendPhoto", "sendMediaGroup", "sendVideo", "sendAudio", "sendAnimation",
+})
+
+# Bucket'ы чатов, неактивных дольше этого, удаляются при разрастании словаря
+_CHAT_BUCKET_IDLE_SECONDS = 600
+
+
+class TokenBucket:
+    """Bucket с резервированием: reserve() сразу списывает токен и возвращает,
+    сколько ждать до его появления (баланс может уходить в минус)."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def delay(self) -> float:
+        """Сколько ждать до свободного токена, не списывая его."""
+        self._refill(time.monotonic())
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class OutboundRateLimiter(BaseRateLimiter):
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        group_rate_per_min: float = 20,
+        max_retries: int = 3,
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate_per_min / 60
+        self.max_retries = max_retries
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}
+        self._waiters = []
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._dispatcher = None
+        self._paused_until = 0.0
+
+    @classmethod
+    def from_env(cls, worker_count: int = 1):
+        return cls(
+            global_rate=float(os.getenv('OUTBOUND_GLOBAL_RATE', '30')) / max(worker_count, 1),
+            chat_rate=float(os.getenv('OUTBOUND_CHAT_RATE', '1')),
+            chat_burst=float(os.getenv('OUTBOUND_CHAT_BURST', '3')),
+            group_rate_per_min=float(os.getenv('OUTBOUND_GROUP_RATE_PER_MIN', '20')),
+            max_retries=int(os.getenv('OUTBOUND_MAX_RETRIES', '3')),
+        )
+
+    async def initialize(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch_forever())
+
+    async def shutdown(self) -> None:
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        for _, _, future in self._waiters:
+            if not future.done():
+                future.cancel()
+        self._waiters.clear()
+
+    # ---------- общий bucket с приоритетной очередью ----------
+
+    async def _dispatch_forever(self):
+        """Выдаёт токены общего bucket'а ожидающим запросам в порядке приоритета."""
+        while True:
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            pause = self._paused_until - time.monotonic()
+            delay = max(pause, self._global.delay())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            set_gauge("outbound_queue_depth", len(self._waiters))
+            if not future.done():
+                self._global.reserve()
+                future.set_result(None)
+
+    async def _acquire_global(self, priority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        set_gauge("outbound_queue_depth", len(self._waiters))
+        self._wakeup.set()
+        await future
+
+    # ---------- bucket'ы чатов ----------
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                self._evict_idle_chats()
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _evict_idle_chats(self):
+        cutoff = time.monotonic() - _CHAT_BUCKET_IDLE_SECONDS
+        for chat_id in [c for c, b in self._chats.items() if b.updated < cutoff]:
+            del self._chats[chat_id]
+
+    # ---------- BaseRateLimiter ----------
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            # getUpdates, getMe и т.п. — не сообщения, лимиты на них не распространяются
+            result = await callback(*args, **kwargs)
+            if endpoint == "getUpdates":
+                record_poll()
+            return result
+
+        if isinstance(rate_limit_args, int):
+            priority = rate_limit_args
+        elif endpoint in _DOCUMENT_ENDPOINTS:
+            priority = PRIORITY_DOCUMENT
+        else:
+            priority = PRIORITY_INTERACTIVE
+        priority_name = _PRIORITY_NAMES.get(priority, str(priority))
+
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            chat_delay = self._chat_bucket(chat_id).reserve()
+            if chat_delay > 0:
+                inc("outbound_throttled_total", scope="chat")
+                await asyncio.sleep(chat_delay)
+            await self._acquire_global(priority)
+            waited = time.monotonic() - started
+            observe("outbound_wait_seconds", waited, priority=priority_name)
+            if waited - chat_delay > 0.05:
+                inc("outbound_throttled_total", scope="global")
+
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                seconds = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+                inc("outbound_retry_after_total", endpoint=endpoint)
+                if attempt >= self.max_retries:
+                    logger.error("%s в чат %s: исчерпаны повторы после RetryAfter", endpoint, chat_id)
+                    raise
+                logger.warning(
+                    "%s: flood control, пауза отправки на %.1f с (попытка %s)",
+                    endpoint, seconds, attempt + 1,
+                )
+                # Пауза для всех запросов: 429 означает превышение общего лимита бота
+                self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+                await asyncio.sleep(seconds)
@@ -0,0 +1,303 @@
+"""
+Таблица маршрутов по кнопкам.
+
+Для каждого состояния ConversationHandler: {текст кнопки: обработчик} плюс обработчик
+для всего остального текста (ввод данных или «используйте кнопки»). Выбор обработчика —
+один поиск в словаре вместо цепочки if/elif и перебора Regex-фильтров, а все переходы
+перечислимы (iter_transitions) — их проверяет check_handlers.py.
+"""
+import functools
+import importlib
+
+from telegram.ext import MessageHandler, filters
+
+from database import database_available
+from metrics import current_update_stats, inc
+from utils_constants import *
+from handlers_common import (
+    start,
+    help_command,
+    start_new_training,
+    resume_main_menu,
+    show_welcome_for_user,
+    show_clear_data_confirmation,
+    confirm_clear_data,
+    clear_data_unknown,
+    main_menu_unknown,
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _lazy(target: str):
+    """Ссылка на обработчик "модуль:функция": модуль импортируется при первом вызове,
+    поэтому выгрузки, статистика и т.п. не замедляют старт бота."""
+    module_name, _, func_name = target.partition(":")
+    func = None
+
+    async def handler(update, context):
+        nonlocal func
+        if func is None:
+            func = getattr(importlib.import_module(module_name), func_name)
+        return await func(update, context)
+
+    handler.__name__ = func_name
+    handler.target = target
+    return handler
+
+
+DEGRADED_TEXT = "⚠️ База данных временно недоступна. Попробуйте через минуту."
+
+
+
+async def reply_degraded(update):
+    """Мгновенный ответ вместо ожидания таймаута подключения к БД."""
+    inc("degraded_replies_total")
+    stats = current_update_stats()
+    if stats is not None:
+        stats["handler"] = "reply_degraded"
+    if update.effective_message:
+        await update.effective_message.reply_text(DEGRADED_TEXT)
+
+
+def guard_db(handler):
+    """Точка входа (/start и т.п.): пока БД недоступна — ответ о недоступности, состояние не меняется."""
+    @functools.wraps(handler)
+    async def guarded(update, context):
+        if not database_available():
+            await reply_degraded(update)
+            return None
+        return await handler(update, context)
+
+    return guarded
+
+
+# Кнопки, с которых можно войти в диалог без /start
+ENTRY_BUTTONS = ('🚀 Начать', '🚀 Продолжить', '🏃‍♂️ Продолжить тренировку', '🆕 Начать новую тренировку')
+FALLBACK_BUTTONS = ('🚀 Начать', '🚀 Продолжить')
+
+MAIN_MENU_ROUTES = {
+    '💪 Начать тренировку': _lazy('handlers_training:start_training'),
+    '📊 История тренировок': _lazy('handlers_training:show_training_history'),
+    '📝 Мои упражнения': _lazy('handlers_exercises:show_exercises_management'),
+    '📈 Статистика': _lazy('handlers_statistics:show_statistics_menu'),
+    '📏 Мои замеры': _lazy('handlers_measurements:show_measurements_history'),
+    '📤 Выгрузка данных': _lazy('handlers_export:show_export_menu'),
+    '❓ Помощь': help_command,
+}
+
+ROUTES = {
+    INACTIVE: {
+        '🚀 Начать': start,
+        '🚀 Продолжить': start,
+        '🏃‍♂️ Продолжить тренировку': _lazy('handlers_training:continue_training'),
+        '🆕 Начать новую тренировку': start_new_training,
+        '🗑️ Очистить историю': show_clear_data_confirmation,
+        # Клавиатура главного меню осталась, а состояние уже INACTIVE
+        **{text: resume_main_menu for text in MAIN_MENU_ROUTES},
+    },
+    MAIN_MENU: MAIN_MENU_ROUTES,
+    STATS_MENU: {
+        '📊 Общая статистика': _lazy('handlers_statistics:show_general_statistics'),
+        '📅 Текущая неделя': _lazy('handlers_statistics:show_weekly_stats'),
+        '📅 Текущий месяц': _lazy('handlers_statistics:show_monthly_stats'),
+        '📅 Текущий год': _lazy('handlers_statistics:show_yearly_stats'),
+        '📋 Статистика по упражнениям': _lazy('handlers_statistics:show_exercise_stats'),
+        '📈 Прогресс по упражнению': _lazy('handlers_statistics:show_progress_menu'),
+        '📉 Графики': _lazy('handlers_statistics:show_charts_menu'),
+        '🔙 Главное меню': start,
+        # Осталась клавиатура главного меню (несовпадение состояния)
+        **MAIN_MENU_ROUTES,
+    },
+    EXERCISE_STATS_SELECTION: {
+        '🔙 Назад к статистике': _lazy('handlers_statistics:show_statistics_menu'),
+    },
+    CHARTS_MENU: {
+        '📊 Тренировки по неделям': _lazy('handlers_statistics:show_trainings_per_week_chart'),
+        '🏋️ Объём по упражнениям': _lazy('handlers_statistics:show_volume_per_exercise_chart'),
+        '⚖️ Вес тела': _lazy('handlers_statistics:show_body_weight_chart'),
+        '🔙 Назад к статистике': _lazy('handlers_statistics:show_statistics_menu'),
+    },
+    MEASUREMENTS_HISTORY: {
+        '📉 Динамика замеров': _lazy('handlers_measurements:show_measurement_trends'),
+        '🔙 Главное меню': start,
+        **MAIN_MENU_ROUTES,
+    },
+    EXPORT_MENU: {
+        '📗 Excel — вся история': _lazy('handlers_export:export_excel_all_time'),
+        '📗 Excel — текущий месяц': _lazy('handlers_export:export_excel_current_month'),
+        '📄 CSV — вся история': _lazy('handlers_export:export_csv_all_time'),
+        '📄 CSV — текущий месяц': _lazy('handlers_export:export_csv_current_month'),
+        '🔙 Главное меню': start,
+    },
+    CLEAR_DATA_CONFIRM: {
+        '✅ Да, удалить все данные': confirm_clear_data,
+        '❌ Отмена': start,
+    },
+
+    # Модуль тренировки
+    TRAINING_MENU: {
+        '💪 Силовые упражнения': _lazy('handlers_training:show_strength_exercises'),
+        '🏃 Кардио': _lazy('handlers_training:show_cardio_exercises'),
+        '✏️ Добавить свое упражнение': _lazy('handlers_training:choose_exercise_type'),
+        '🏁 Завершить тренировку': _lazy('handlers_training:show_finish_summary'),
+    },
+    ADD_EXERCISE_TYPE: {
+        '💪 Силовое упражнение': _lazy('handlers_training:ask_new_strength_exercise'),
+        '🏃 Кардио упражнение': _lazy('handlers_training:ask_new_cardio_exercise'),
+        '🔙 Назад к тренировке': _lazy('handlers_training:show_training_menu'),
+    },
+    INPUT_MEASUREMENTS_CHOICE: {
+        '📝 Ввести замеры': _lazy('handlers_training:ask_measurements'),
+        '⏭️ Пропустить замеры': _lazy('handlers_training:show_training_menu'),
+        '🔙 Главное меню': start,
+    },
+    INPUT_MEASUREMENTS: {},
+    CHOOSE_STRENGTH_EXERCISE: {
+        '✏️ Добавить силовое упражнение': _lazy('handlers_training:ask_new_strength_exercise'),
+        '🔙 Назад к тренировке': _lazy('handlers_training:show_training_menu'),
+    },
+    INPUT_SETS: {
+        '✅ Добавить еще подходы': _lazy('handlers_training:add_another_set'),
+        '💾 Сохранить упражнение': _lazy('handlers_training:save_exercise'),
+        '❌ Отменить упражнение': _lazy('handlers_training:cancel_exercise'),
+    },
+    CHOOSE_CARDIO_EXERCISE: {
+        '✏️ Добавить кардио упражнение': _lazy('handlers_training:ask_new_cardio_exercise'),
+        '🔙 Назад к тренировке': _lazy('handlers_training:show_training_menu'),
+    },
+    INPUT_NEW_STRENGTH_EXERCISE: {},
+    INPUT_NEW_CARDIO_EXERCISE: {},
+    CARDIO_TYPE_SELECTION: {
+        '⏱️ Мин/Метры': _lazy('handlers_training:ask_cardio_min_meters'),
+        '🚀 Км/Час': _lazy('handlers_training:ask_cardio_km_h'),
+        '🔙 Назад к кардио': _lazy('handlers_training:show_cardio_exercises'),
+    },
+    INPUT_CARDIO_MIN_METERS: {},
+    INPUT_CARDIO_KM_H: {},
+    CONFIRM_FINISH: {
+        '✅ Точно завершить': _lazy('handlers_training:confirm_finish_training'),
+        '✏️ Скорректировать': _lazy('handlers_training:show_edit_not_available'),
+        '🔙 Продолжить тренировку': _lazy('handlers_training:show_training_menu'),
+    },
+
+    # Модуль управления упражнениями
+    EXERCISES_MANAGEMENT: {
+        '➕ Добавить упражнение': _lazy('handlers_exercises:choose_exercise_type_mgmt'),
+        '🗑️ Удалить упражнение': _lazy('handlers_exercises:show_delete_exercise_menu'),
+        '🔙 Главное меню': start,
+    },
+    ADD_EXERCISE_TYPE_MGMT: {
+        '💪 Силовое упражнение': _lazy('handlers_exercises:ask_new_strength_exercise_mgmt'),
+        '🏃 Кардио упражнение': _lazy('handlers_exercises:ask_new_cardio_exercise_mgmt'),
+        '🔙 Назад к управлению упражнениями': _lazy('handlers_exercises:show_exercises_management'),
+    },
+    INPUT_NEW_STRENGTH_EXERCISE_MGMT: {},
+    INPUT_NEW_CARDIO_EXERCISE_MGMT: {},
+    DELETE_EXERCISE_MENU: {
+        '🔙 Назад к управлению упражнениями': _lazy('handlers_exercises:show_exercises_management'),
+    },
+}
+
+# Обработчики, которым не нужна БД: работают и при разомкнутом circuit breaker.
+# Ввод подходов и кардио сюда входит — упражнение уходит в локальный журнал (journal.py)
+DB_FREE_HANDLERS = frozenset({
+    help_command,
+    _lazy('handlers_training:show_training_menu'),
+    _lazy('handlers_training:show_strength_exercises'),
+    _lazy('handlers_training:show_cardio_exercises'),
+    _lazy('handlers_training:handle_strength_exercise_selection'),
+    _lazy('handlers_training:handle_cardio_exercise_selection'),
+    _lazy('handlers_training:handle_set_input'),
+    _lazy('handlers_training:add_another_set'),
+    _lazy('handlers_training:save_exercise'),
+    _lazy('handlers_training:cancel_exercise'),
+    _lazy('handlers_training:ask_cardio_min_meters'),
+    _lazy('handlers_training:ask_cardio_km_h'),
+    _lazy('handlers_training:handle_cardio_min_meters_input'),
+    _lazy('handlers_training:handle_cardio_km_h_input'),
+})
+
+
+# Обработчик любого другого текста в состоянии
+FALLBACKS = {
+    INACTIVE: show_welcome_for_user,
+    MAIN_MENU: main_menu_unknown,
+    STATS_MENU: _lazy('handlers_statistics:statistics_menu_unknown'),
+    EXERCISE_STATS_SELECTION: _lazy('handlers_statistics:show_exercise_progress'),
+    CHARTS_MENU: _lazy('handlers_statistics:charts_menu_unknown'),
+    MEASUREMENTS_HISTORY: _lazy('handlers_measurements:measurements_menu_unknown'),
+    EXPORT_MENU: _lazy('handlers_export:export_menu_unknown'),
+    CLEAR_DATA_CONFIRM: clear_data_unknown,
+    TRAINING_MENU: _lazy('handlers_training:handle_training_menu_fallback'),
+    ADD_EXERCISE_TYPE: _lazy('handlers_training:add_exercise_type_unknown'),
+    INPUT_MEASUREMENTS_CHOICE: _lazy('handlers_training:measurements_choice_unknown'),
+    INPUT_MEASUREMENTS: _lazy('handlers_training:save_measurements'),
+    CHOOSE_STRENGTH_EXERCISE: _lazy('handlers_training:handle_strength_exercise_selection'),
+    INPUT_SETS: _lazy('handlers_training:handle_set_input'),
+    CHOOSE_CARDIO_EXERCISE: _lazy('handlers_training:handle_cardio_exercise_selection'),
+    INPUT_NEW_STRENGTH_EXERCISE: _lazy('handlers_training:save_new_exercise_from_training'),
+    INPUT_NEW_CARDIO_EXERCISE: _lazy('handlers_training:save_new_exercise_from_training'),
+    CARDIO_TYPE_SELECTION: _lazy('handlers_training:cardio_type_unknown'),
+    INPUT_CARDIO_MIN_METERS: _lazy('handlers_training:handle_cardio_min_meters_input'),
+    INPUT_CARDIO_KM_H: _lazy('handlers_training:handle_cardio_km_h_input'),
+    CONFIRM_FINISH: _lazy('handlers_training:finish_confirmation_unknown'),
+    EXERCISES_MANAGEMENT: _lazy('handlers_exercises:show_exercises_management'),
+    ADD_EXERCISE_TYPE_MGMT: _lazy('handlers_exercises:add_exercise_type_mgmt_unknown'),
+    INPUT_NEW_STRENGTH_EXERCISE_MGMT: _lazy('handlers_exercises:save_new_strength_exercise_mgmt'),
+    INPUT_NEW_CARDIO_EXERCISE_MGMT: _lazy('handlers_exercises:save_new_cardio_exercise_mgmt'),
+    DELETE_EXERCISE_MENU: _lazy('handlers_exercises:delete_exercise_handler'),
+}
+
+# Имена состояний для отчётов: {значение: 'MAIN_MENU', ...}
+STATE_NAMES = {
+    value: name for name, value in globals().items()
+    if name.isupper() and isinstance(value, int) and value in FALLBACKS
+}
+
+
+def resolve(state: int, text: str):
+    """Обработчик для текста в состоянии: кнопка из таблицы или обработчик по умолчанию."""
+    return ROUTES[state].get((text or "").strip()) or FALLBACKS[state]
+
+
+async def dispatch(state: int, update, context) -> int:
+    """Вызвать обработчик для сообщения в состоянии state."""
+    message = update.effective_message
+    handler = resolve(state, message.text if message else "")
+    if handler not in DB_FREE_HANDLERS and not database_available():
+        await reply_degraded(update)
+        return state
+    stats = current_update_stats()
+    if stats is not None:
+        stats["handler"] = handler.__name__
+    return await handler(update, context)
+
+
+def make_dispatcher(state: int):
+    async def dispatcher(update, context):
+        return await dispatch(state, update, context)
+
+    dispatcher.__name__ = f"dispatch_{STATE_NAMES.get(state, state)}"
+    return dispatcher
+
+
+def build_states():
+    """states для ConversationHandler: один MessageHandler на состояние."""
+    text = filters.TEXT & ~filters.COMMAND
+    return {state: [MessageHandler(text, make_dispatcher(state))] for state in FALLBACKS}
+
+
+def iter_transitions():
+    """Все переходы таблицы: (состояние, текст кнопки или None для прочего текста, обработчик)."""
+    for state, routes in ROUTES.items():
+        for text, handler in routes.items():
+            yield state, text, handler
+        yield state, None, FALLBACKS[state]
+
+
+def preload():
+    """Импортировать все модули обработчиков заранее (фоновый прогрев или BOT_LAZY_IMPORTS=0)."""
+    for _, _, handler in iter_transitions():
+        target = getattr(handler, "target", None)
+        if target:
+            importlib.import_module(target.partition(":")[0])
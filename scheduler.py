@@ -0,0 +1,155 @@
+"""
+Фоновые задачи по расписанию внутри процесса бота.
+
+Задача регистрируется функцией периода (now -> ключ периода, например начало недели)
+и корутиной, выполняющей работу. Раз в SCHEDULER_TICK секунд планировщик для каждой
+задачи вычисляет текущий период и пытается захватить его запуск в таблице scheduled_jobs:
+захват атомарный, поэтому при нескольких воркерах (cluster.py) задачу выполняет ровно
+один процесс. Задача сохраняет курсор через run.checkpoint(): если процесс упал или
+перезапустился посреди работы, после SCHEDULER_STALE_AFTER секунд без heartbeat
+запуск перехватывается и продолжается с сохранённого курсора, а не с начала.
+
+Переменные окружения:
+    SCHEDULER_ENABLED     — 0 отключает фоновые задачи в этом процессе (1)
+    SCHEDULER_TICK        — период проверки расписания, сек (60)
+    SCHEDULER_STALE_AFTER — через сколько секунд без heartbeat запуск считается брошенным (600)
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime
+
+from database import (
+    claim_scheduled_job, checkpoint_scheduled_job, database_available, finish_scheduled_job,
+)
+from metrics import inc, observe
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('SCHEDULER_ENABLED', '1') != '0'
+TICK = float(os.getenv('SCHEDULER_TICK', '60'))
+STALE_AFTER = float(os.getenv('SCHEDULER_STALE_AFTER', '600'))
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+JOB_BUCKETS = (1, 5, 15, 60, 300, 900, 1800, 3600)
+
+# Имя задачи -> (период: now -> ключ, корутина: run -> None)
+_jobs = {}
+_running = set()
+# Последний запуск каждой задачи в этом процессе — для /readyz
+_last_runs = {}
+
+
+class JobLost(Exception):
+    """Запуск перехвачен другим процессом — продолжать нельзя."""
+
+
+class JobRun:
+    """Контекст одного запуска: период, курсор продолжения и сохранение прогресса."""
+
+    __slots__ = ("name", "period", "application", "cursor", "processed", "details")
+
+    def __init__(self, name, period, application, cursor, processed):
+        self.name = name
+        self.period = period
+        self.application = application
+        self.cursor = cursor
+        self.processed = processed
+        # Счётчики задачи для отчёта ({'finished': 3, ...}) — попадают в лог и /readyz
+        self.details = {}
+
+    async def checkpoint(self, cursor, processed=0):
+        """Сохранить курсор и добавить processed к счётчику; heartbeat для других воркеров."""
+        self.cursor = cursor
+        self.processed += processed
+        if not await asyncio.to_thread(checkpoint_scheduled_job, self.name, OWNER, cursor, self.processed):
+            raise JobLost(self.name)
+
+
+def register(name, period, func):
+    """Зарегистрировать задачу: period(now) -> ключ периода, func(run) — корутина."""
+    _jobs[name] = (period, func)
+
+
+def every(minutes):
+    """Период «раз в N минут»."""
+    seconds = minutes * 60
+    return lambda now: str(int(now.timestamp() // seconds))
+
+
+async def _execute(name, func, run):
+    started = time.perf_counter()
+    error = None
+    try:
+        await func(run)
+    except JobLost:
+        logger.warning("Задача %s перехвачена другим процессом", name)
+        inc("scheduled_job_runs_total", job=name, result="lost")
+        _running.discard(name)
+        return
+    except Exception as e:
+        logger.exception("Ошибка фоновой задачи %s", name)
+        error = str(e)[:500]
+
+    elapsed = time.perf_counter() - started
+    await asyncio.to_thread(finish_scheduled_job, name, OWNER, run.processed, error)
+    _running.discard(name)
+    result = "error" if error else "ok"
+    inc("scheduled_job_runs_total", job=name, result=result)
+    observe("scheduled_job_seconds", elapsed, buckets=JOB_BUCKETS, job=name)
+    _last_runs[name] = {
+        "period": run.period,
+        "result": result,
+        "processed": run.processed,
+        "seconds": round(elapsed, 1),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        **run.details,
+    }
+    logger.info(
+        "Задача %s (%s): %s, обработано %s за %.1f с %s",
+        name, run.period, result, run.processed, elapsed, run.details or "",
+    )
+
+
+async def run_due(application, now=None):
+    """Запустить задачи, период которых ещё не выполнен (и не выполняется кем-то другим)."""
+    if not database_available():
+        return
+    now = now or datetime.now()
+    for name, (period, func) in _jobs.items():
+        if name in _running:
+            continue
+        key = period(now)
+        if key is None:
+            continue
+        claimed = await asyncio.to_thread(claim_scheduled_job, name, key, OWNER, STALE_AFTER)
+        if claimed is None:
+            continue
+        cursor, processed = claimed
+        if cursor:
+            logger.info("Задача %s (%s) продолжается с курсора %s", name, key, cursor)
+        _running.add(name)
+        application.create_task(_execute(name, func, JobRun(name, key, application, cursor, processed)))
+
+
+async def run_forever(application):
+    """Фоновая задача процесса: проверять расписание раз в TICK секунд (первый раз — через TICK после старта)."""
+    while True:
+        await asyncio.sleep(TICK)
+        try:
+            await run_due(application)
+        except Exception as e:
+            logger.error(f"❌ Ошибка планировщика: {e}")
+
+
+def status() -> dict:
+    """Раздел для /readyz."""
+    return {
+        "enabled": ENABLED,
+        "jobs": sorted(_jobs),
+        "running": sorted(_running),
+        "last_runs": dict(_last_runs),
+    }
@@ -0,0 +1,64 @@
+"""
+Отчёт о холодном старте: самые медленные импорты (по данным python -X importtime)
+и время сборки приложения.
+
+    python startup_report.py            # топ-20 модулей
+    python startup_report.py 40         # топ-40
+    BOT_LAZY_IMPORTS=0 python startup_report.py   # сравнить с загрузкой всего сразу
+"""
+import os
+import subprocess
+import sys
+import time
+
+_PROBE = "import main; main.main()"
+
+
+def measure():
+    """Запустить сборку приложения в отдельном процессе с -X importtime."""
+    env = dict(os.environ)
+    env.setdefault("BOT_TOKEN", "0:startup-report")
+    env.setdefault("LOG_LEVEL", "WARNING")
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - started
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:   self [us] | cumulative | module" — отступ имени = глубина импорта
+        own, cumulative, name = line[len("import time:"):].split("|", 2)
+        imports.append((name[1:].rstrip(), int(own), int(cumulative)))
+    return wall, imports
+
+
+def main(top: int = 20):
+    wall, imports = measure()
+    total_own = sum(own for _, own, _ in imports)
+
+    print(f"Холодный старт (процесс + сборка приложения): {wall * 1000:.0f} мс")
+    print(f"Импорты: {len(imports)} модулей, {total_own / 1000:.0f} мс собственного времени\n")
+
+    # Прямые импорты main.py (отступ в два пробела) — что именно тянет старт бота
+    print(f"{'кумулятивно, мс':>16}  модуль")
+    direct = [item for item in imports if item[0].startswith("  ") and not item[0].startswith("   ")]
+    for name, _, cumulative in sorted(direct, key=lambda i: i[2], reverse=True)[:top]:
+        print(f"{cumulative / 1000:>16.1f}  {name.strip()}")
+
+    print(f"\n{'собственное, мс':>16}  модуль")
+    for name, own, _ in sorted(imports, key=lambda i: i[1], reverse=True)[:top]:
+        print(f"{own / 1000:>16.1f}  {name.strip()}")
+
+    loaded = {name.strip() for name, _, _ in imports}
+    heavy = [m for m in ("pg8000", "openpyxl", "numpy", "matplotlib", "handlers_export", "handlers_statistics") if m in loaded]
+    print("\nТяжёлые модули при старте:", ", ".join(heavy) if heavy else "нет (загрузятся при первом обращении)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
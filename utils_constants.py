@@ -28,8 +28,11 @@
     EXPORT_MENU, SELECT_EXPORT_PERIOD, GENERATE_EXPORT, DOWNLOAD_EXPORT,
     
     # Очистка данных
-    CLEAR_DATA_CONFIRM
-) = range(46)  # ИЗМЕНИЛ range(45) НА range(46)
+    CLEAR_DATA_CONFIRM,
+
+    # 📉 Графики (в конце — номера сохранённых состояний не сдвигаются)
+    CHARTS_MENU
+) = range(47)
 
 # Типы упражнений
 STRENGTH_TYPE = 'strength'